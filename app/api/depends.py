@@ -1,4 +1,4 @@
-from typing import Union
+from typing import Optional
 
 from fastapi import Depends
 from fastapi.security.api_key import APIKeyHeader
@@ -6,7 +6,9 @@ from jose.jwt import encode
 
 from app.config import settings
 from app.crud.user import UserService
-from app.db.models import User
+from app.db.instrumentation import query_stats
+from app.schema.schemas import Principal
+from app.utils.cache import cache, principal_cache
 from app.utils.logger import get_logger
 
 logger = get_logger("user_current")
@@ -19,19 +21,46 @@ algorithm = settings.algorithm
 async def current_user(
         api_key: str = Depends(api_key_header),
         service: UserService = Depends(),
-) -> Union[User, None]:
+) -> Optional[Principal]:
     """
-    Функция возвращает api-key.
+    Функция возвращает пользователя по api-key.
+
+    Результат (в том числе для неизвестного ключа) кэшируется в
+    principal_cache, поэтому повторные запросы с тем же ключом не
+    обращаются к базе. Кэш очищается, если ключи изменили вне процесса
+    (PrincipalCache.sync).
 
     :param api_key: любое слово или сочетание слов.
     :param service:
-    :return: пользователь.
+    :return: пользователь (ID и имя) или None.
     """
+    await principal_cache.sync(cache)
+    principal = principal_cache.get(api_key)
+    if principal is not principal_cache.missing:
+        return principal
+
     api_token = encode(
         claims={"api-key": api_key},
         key=secret_key,
         algorithm=algorithm,
     )
-    user: Union[User, None] = await service.get_user_by_token(api_token)
+    principal = await service.get_principal_by_token(api_token)
+    principal_cache.set(api_key, principal)
+
+    return principal
+
+
+class QueryBudget:
+    """
+    Зависимость, объявляющая максимальное количество SQL запросов endpoint.
+
+    Превышение бюджета проверяет middleware instrument_request.
+    """
+
+    def __init__(self, max_queries: int) -> None:
+        self.max_queries = max_queries
 
-    return user
\ No newline at end of file
+    async def __call__(self) -> None:
+        stats = query_stats.get()
+        if stats is not None:
+            stats.budget = self.max_queries
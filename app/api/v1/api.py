@@ -1,8 +1,12 @@
 from fastapi import APIRouter
 
-from app.api.v1.endpoints import media, tweet, user
+from app.api.v1.endpoints import health, media, metrics, tweet, user
+from app.config import settings
 
 api_router = APIRouter()
 api_router.include_router(user.router, tags=["Users"])
 api_router.include_router(tweet.router, prefix="/api/tweets", tags=["Tweets"])
-api_router.include_router(media.router, prefix="/api/medias", tags=["Tweets"])
\ No newline at end of file
+api_router.include_router(media.router, prefix="/api/medias", tags=["Tweets"])
+api_router.include_router(health.router, tags=["Health"])
+if settings.metrics_enabled:
+    api_router.include_router(metrics.router, tags=["Metrics"])
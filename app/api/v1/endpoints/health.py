@@ -0,0 +1,53 @@
+from fastapi import APIRouter, status
+from fastapi.responses import JSONResponse
+
+from app.crud.warmup import warmup
+from app.utils.timing import startup_timings
+
+router = APIRouter()
+
+
+@router.get(
+    "/health/live",
+    summary="Проверка работы приложения",
+    response_description="Успешный ответ",
+    status_code=status.HTTP_200_OK,
+    include_in_schema=False,
+)
+async def show_liveness() -> JSONResponse:
+    """
+    Endpoint для проверки, что процесс приложения отвечает.
+
+    :return: {"result": true}
+    """
+    return JSONResponse({"result": True})
+
+
+@router.get(
+    "/health/ready",
+    summary="Готовность приложения",
+    description="Код 503, пока не закончен прогрев после запуска.",
+    response_description="Успешный ответ",
+    status_code=status.HTTP_200_OK,
+    include_in_schema=False,
+)
+async def show_readiness() -> JSONResponse:
+    """
+    Endpoint для проверки готовности приложения принимать запросы.
+
+    :return: признак готовности, признак запуска без прогрева, ошибка
+        прогрева и длительности этапов запуска
+    """
+    return JSONResponse(
+        {
+            "result": warmup.ready,
+            "degraded": warmup.degraded,
+            "error": warmup.error,
+            "timings_ms": startup_timings,
+        },
+        status_code=(
+            status.HTTP_200_OK
+            if warmup.ready
+            else status.HTTP_503_SERVICE_UNAVAILABLE
+        ),
+    )
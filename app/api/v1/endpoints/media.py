@@ -1,12 +1,15 @@
-from typing import Union
+from typing import Optional, Union
 
-from fastapi import APIRouter, Depends, File, UploadFile, status
+from fastapi import APIRouter, Depends, File, Request, Response, UploadFile, status
 
 from app.api import depends
+from app.config import settings
 from app.crud.media import MediaService
+from app.crud.media_storage import MediaLocation, StoredFile, storage_for
 from app.schema.schemas import Failure, FileSuccess
 from app.utils.errors import AppException, error_handler
 from app.utils.logger import get_logger
+from app.utils.media_response import media_response
 
 logger = get_logger("endpoints.media")
 
@@ -20,6 +23,7 @@ router = APIRouter()
     description="Маршрут - позволяет загрузить файл из твита.",
     response_description="Успешный ответ",
     status_code=status.HTTP_201_CREATED,
+    dependencies=[Depends(depends.QueryBudget(7))],
 )
 @error_handler
 async def get_new_file(
@@ -43,8 +47,82 @@ async def get_new_file(
         )
 
     file_id = await service.write_file(file)
+    if file_id is None:
+        AppException(
+            "File too large",
+            "Размер файла превышает {max_size} байт".format(
+                max_size=settings.media_max_size,
+            ),
+        )
 
     return FileSuccess.parse_obj({
         "result": True,
         "media_id": file_id,
     })
+
+
+@router.get(
+    "/{media_id}",
+    response_model=Failure,
+    summary="Показывает файл из твита",
+    description="Маршрут - отдает содержимое файла по ID медиа.",
+    response_description="Содержимое файла",
+    status_code=status.HTTP_200_OK,
+    dependencies=[Depends(depends.QueryBudget(1))],
+)
+@error_handler
+async def show_file(
+        media_id: int,
+        request: Request,
+        service: MediaService = Depends(),
+) -> Union[Response, Failure]:
+    """
+    Endpoint получения содержимого файла.
+
+    ETag ответа - SHA-256 содержимого, поэтому поддерживаются запросы
+    If-None-Match и Range (If-Range). При media_accel_redirect файл из
+    каталога изображений отдает nginx (X-Accel-Redirect), файлы из
+    сегментов всегда отдает приложение.
+
+    :param media_id: ID медиа
+    :param request: запрос
+    :param service: сервис обработки Media
+    :return: содержимое файла или объект согласно схеме Failure
+    """
+    media = await service.get_media_file(media_id)
+    if media is None:
+        AppException(
+            "Media not found",
+            "Медиа с указанным id отсутствует в базе",
+        )
+
+    stored = StoredFile(
+        media.path_file,
+        media.size,
+        media.segment_id,
+        media.segment_offset,
+    )
+    location: Optional[MediaLocation]
+    try:
+        location = storage_for(stored).locate(stored)
+    except FileNotFoundError:
+        location = None
+    if location is None or not location.path.is_file():
+        AppException(
+            "Media not found",
+            "Файл медиа {media_id} отсутствует на диске".format(media_id=media_id),
+        )
+
+    file_name = media.path_file.split("/")[1]
+    accel_path = None
+    if settings.media_accel_redirect and stored.segment_id is None:
+        accel_path = settings.media_accel_prefix + file_name
+    return media_response(
+        request,
+        location.path,
+        location.offset,
+        location.length,
+        file_name,
+        '"{sha256}"'.format(sha256=media.sha256) if media.sha256 else None,
+        accel_path,
+    )
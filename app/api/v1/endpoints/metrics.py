@@ -0,0 +1,23 @@
+from fastapi import APIRouter, Response, status
+
+from app.utils.metrics import render_metrics
+
+router = APIRouter()
+
+
+@router.get(
+    "/metrics",
+    summary="Метрики приложения",
+    description="Метрики в текстовом формате Prometheus.",
+    response_description="Успешный ответ",
+    status_code=status.HTTP_200_OK,
+    include_in_schema=False,
+)
+async def show_metrics() -> Response:
+    """
+    Endpoint для сбора метрик Prometheus.
+
+    :return: метрики в текстовом формате Prometheus
+    """
+    content, content_type = render_metrics()
+    return Response(content, media_type=content_type)
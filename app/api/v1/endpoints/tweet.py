@@ -1,14 +1,19 @@
-from typing import Union
+from typing import Optional, Union
 
-from fastapi import APIRouter, Depends, status
+from fastapi import APIRouter, BackgroundTasks, Depends, Query, Response, status
+from fastapi.responses import StreamingResponse
 
 from app.api import depends
+from app.config import settings
 from app.crud.tweet import TweetService
 from app.schema.schemas import (
     Failure,
+    LikesOut,
     NewTweetOut,
+    NewTweetsOut,
     Success,
     TweetIn,
+    TweetsBatchIn,
     TweetsOut,
     UserOut,
 )
@@ -27,30 +32,105 @@ router = APIRouter()
     description="Маршрут для отображения всех твитов.",
     response_description="Успешный ответ",
     status_code=status.HTTP_200_OK,
+    dependencies=[Depends(depends.QueryBudget(10))],
 )
 @error_handler
 async def show_all_tweets(
         user: depends.current_user = Depends(),
         service: TweetService = Depends(),
+        limit: Optional[int] = Query(
+            None,
+            ge=1,
+            le=settings.tweets_stream_max_size,
+        ),
+        cursor: Optional[str] = None,
+        stream: bool = False,
 ) -> Union[TweetsOut, Failure]:
     """
-    Endpoint для отображения всех твитов.
+    Endpoint для отображения домашней ленты пользователя постранично.
+
+    Если домашние ленты выключены (home_timeline_enabled), показывается
+    общая лента всех твитов. Если включен флаг совместимости
+    tweets_legacy_feed, возвращаются все твиты одним списком, как раньше.
+    В режиме feed_render_mode="sql" JSON домашней ленты собирается в базе.
+    С параметром stream ответ отдается частями по мере чтения из базы,
+    размер страницы при этом ограничен tweets_stream_max_size.
 
     :param user: текущий пользователь
     :param service: сервис обработки Tweet
+    :param limit: количество твитов на странице
+    :param cursor: курсор следующей страницы из предыдущего ответа
+    :param stream: отдать ленту потоком (StreamingResponse)
     :return: Объект согласно схеме Union[TweetsOut, Failure]
     """
     logger.info("Получение всех твитов.")
+    if user is None:
+        AppException(
+            "id not found",
+            "Пользователь с указанным id отсутствует в базе",
+        )
 
-    tweets = await service.get_all_tweets()
-    print(tweets)
-    return AppException(
-        "id not found",
-        "Пользователь с указанным id отсутствует в базе",
-    ) if user is None else TweetsOut.parse_obj(
+    if stream:
+        return StreamingResponse(
+            await service.stream_feed(
+                user.id,
+                user.username,
+                limit or settings.tweets_page_size,
+                cursor,
+            ),
+            media_type="application/json",
+        )
+
+    if limit is not None and limit > settings.tweets_max_page_size:
+        AppException(
+            "Invalid limit",
+            "Размер страницы больше {max_size}, используйте stream".format(
+                max_size=settings.tweets_max_page_size,
+            ),
+        )
+
+    if all((
+        settings.feed_render_mode == "sql",
+        settings.home_timeline_enabled,
+        not settings.tweets_legacy_feed,
+    )):
+        return Response(
+            await service.get_home_timeline_raw(
+                user.id,
+                user.username,
+                limit or settings.tweets_page_size,
+                cursor,
+            ),
+            media_type="application/json",
+        )
+
+    if settings.tweets_legacy_feed:
+        tweets = await service.serialize_tweets(
+            [tweet[0] for tweet in await service.get_all_tweets()],
+        )
+        next_cursor = None
+    elif settings.home_timeline_enabled:
+        tweets, next_cursor = await service.get_home_timeline_json(
+            user.id,
+            limit or settings.tweets_page_size,
+            cursor,
+        )
+    else:
+        page, next_cursor = await service.get_tweets_page(
+            limit or settings.tweets_page_size,
+            cursor,
+        )
+        tweets = await service.serialize_tweets(page)
+
+    return TweetsOut.parse_obj(
         {
             "result": True,
-            "tweets": [tweet[0].to_json() for tweet in tweets],
+            "tweets": await service.mark_liked_by_me(
+                tweets,
+                user.id,
+                user.username,
+            ),
+            "next_cursor": next_cursor,
         })
 
 
@@ -61,10 +141,12 @@ async def show_all_tweets(
     description="Маршрут для добавления нового твита пользователя.",
     response_description="Успешный ответ",
     status_code=status.HTTP_201_CREATED,
+    dependencies=[Depends(depends.QueryBudget(6))],
 )
 @error_handler
 async def add_tweet(
         tweet: TweetIn,
+        background_tasks: BackgroundTasks,
         user: depends.current_user = Depends(),
         service: TweetService = Depends(),
 ) -> Union[NewTweetOut, Failure]:
@@ -72,23 +154,97 @@ async def add_tweet(
     Endpoint добавления нового твита пользователя.
 
     :param tweet: Объект полученный согласно схеме TweetIn
+    :param background_tasks: фоновые задачи для рассылки твита подписчикам
     :param user: текущий пользователь
     :param service: сервис обработки Tweet
     :return: Объект согласно схеме Union[NewTweetOut, Failure]
     """
     logger.info("Добавления нового твита пользователя.")
+    if user is None:
+        AppException(
+            "Tweet not found",
+            "Tweet не найден",
+        )
 
-    return AppException(
-        "Tweet not found",
-        "Tweet не найден",
-    ) if user is None else NewTweetOut.parse_obj({
+    created = await service.add_new_tweet(tweet, user.id, background_tasks)
+    if created is None:
+        AppException(
+            "Media not found",
+            "Медиа твита отсутствуют в базе или уже прикреплены к твиту",
+        )
+
+    return NewTweetOut.parse_obj({
         "result": True,
-        "tweet_id": (
-            await service.add_new_tweet(
-                tweet,
-                user.id,
-            )
-        )["tweet_id"],
+        "tweet_id": created["tweet_id"],
+    })
+
+
+@router.post(
+    "/batch",
+    response_model=Union[NewTweetsOut, Failure],
+    summary="Добавить пачку твитов пользователя",
+    description=(
+        "Маршрут для загрузки многих твитов одним запросом (миграция данных, "
+        "загрузка от партнеров). Твиты создаются в одной транзакции."
+    ),
+    response_description="Успешный ответ",
+    status_code=status.HTTP_201_CREATED,
+    dependencies=[Depends(depends.QueryBudget(6))],
+)
+@error_handler
+async def add_tweets_batch(
+        batch: TweetsBatchIn,
+        background_tasks: BackgroundTasks,
+        user: depends.current_user = Depends(),
+        service: TweetService = Depends(),
+) -> Union[NewTweetsOut, Failure]:
+    """
+    Endpoint добавления пачки твитов пользователя.
+
+    :param batch: Объект полученный согласно схеме TweetsBatchIn
+    :param background_tasks: фоновые задачи для рассылки твитов подписчикам
+    :param user: текущий пользователь
+    :param service: сервис обработки Tweet
+    :return: Объект согласно схеме Union[NewTweetsOut, Failure]
+    """
+    logger.info("Добавление пачки твитов пользователя.")
+    if user is None:
+        AppException(
+            "id not found",
+            "Пользователь с указанным id отсутствует в базе",
+        )
+
+    if len(batch.tweets) > settings.tweets_batch_max_size:
+        AppException(
+            "Invalid batch",
+            "В пачке больше {max_size} твитов".format(
+                max_size=settings.tweets_batch_max_size,
+            ),
+        )
+
+    media_ids = [
+        media_id for tweet in batch.tweets for media_id in tweet.tweet_media_ids
+    ]
+    if len(media_ids) != len(set(media_ids)):
+        AppException(
+            "Invalid batch",
+            "Одно медиа указано в нескольких твитах пачки",
+        )
+
+    tweet_ids = await service.add_new_tweets(
+        batch.tweets,
+        user.id,
+        background_tasks,
+    )
+    if tweet_ids is None:
+        AppException(
+            "Invalid batch",
+            "Медиа пачки отсутствуют в базе или уже прикреплены к твиту",
+        )
+
+    return NewTweetsOut.parse_obj({
+        "result": True,
+        "tweet_ids": tweet_ids,
     })
 
 
@@ -99,6 +255,7 @@ async def add_tweet(
     description="Маршрут для удаления твита с заданным ID.",
     response_description="Успешный ответ",
     status_code=status.HTTP_200_OK,
+    dependencies=[Depends(depends.QueryBudget(8))],
 )
 @error_handler
 async def delete_tweet(
@@ -129,6 +286,58 @@ async def delete_tweet(
     )
 
 
+@router.get(
+    "/{tweet_id}/likes",
+    response_model=Union[LikesOut, Failure],
+    summary="Показывает пользователей, лайкнувших твит",
+    description="Маршрут для постраничного получения лайков твита.",
+    response_description="Успешный ответ",
+    status_code=status.HTTP_200_OK,
+    dependencies=[Depends(depends.QueryBudget(2))],
+)
+@error_handler
+async def show_likes(
+        tweet_id: int,
+        user: depends.current_user = Depends(),
+        service: TweetService = Depends(),
+        limit: Optional[int] = Query(
+            None,
+            ge=1,
+            le=settings.tweets_max_page_size,
+        ),
+        cursor: Optional[str] = None,
+) -> Union[LikesOut, Failure]:
+    """
+    Endpoint для постраничного получения пользователей, лайкнувших твит.
+
+    :param tweet_id: ID твита
+    :param user: текущий пользователь
+    :param service: сервис обработки Tweet
+    :param limit: количество лайков на странице
+    :param cursor: курсор следующей страницы из предыдущего ответа
+    :return: Объект согласно схеме Union[LikesOut, Failure]
+    """
+    logger.info("Получение лайков твита.")
+    if user is None:
+        AppException(
+            "id not found",
+            "Пользователь с указанным id отсутствует в базе",
+        )
+
+    likes, next_cursor = await service.get_likes(
+        tweet_id,
+        limit or settings.likes_page_size,
+        cursor,
+    )
+
+    return LikesOut.parse_obj(
+        {
+            "result": True,
+            "likes": likes,
+            "next_cursor": next_cursor,
+        })
+
+
 @router.delete(
     "/{tweet_id}/likes",
     summary="Удаляет лайк твита с заданным ID",
@@ -136,6 +345,7 @@ async def delete_tweet(
     description="Маршрут для удаления лайка твита с заданным ID.",
     response_description="Успешный ответ",
     status_code=status.HTTP_200_OK,
+    dependencies=[Depends(depends.QueryBudget(3))],
 )
 @error_handler
 async def delete_like(
@@ -173,6 +383,7 @@ async def delete_like(
     description="Маршрут для добавления лайка твиту с заданным ID.",
     response_description="Успешный ответ",
     status_code=status.HTTP_201_CREATED,
+    dependencies=[Depends(depends.QueryBudget(3))],
 )
 @error_handler
 async def like_tweet(
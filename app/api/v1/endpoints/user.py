@@ -20,20 +20,26 @@ router = APIRouter()
     description="Маршрут получения информации о текущем пользователе.",
     response_description="Успешный ответ",
     status_code=status.HTTP_200_OK,
+    dependencies=[Depends(depends.QueryBudget(4))],
 )
 @error_handler
 async def get_user_profile(
-        user: depends.current_user = Depends(),
+        principal: depends.current_user = Depends(),
+        service: UserService = Depends(),
 ) -> Union[UserOut, Failure]:
     """
     Маршрут получения информации о текущем пользователе.
 
-    :param user:
+    :param principal:
+    :param service:
     :return: Объект согласно схеме UserOut
     """
     logger.info(
         "Получение информации о текущем пользователе.",
     )
+    user = None if principal is None else await service.get_user_info(
+        principal.id,
+    )
     return (
         AppException(
             "api-key not found",
@@ -54,6 +60,7 @@ async def get_user_profile(
     description="Маршрут получения информации о пользователе по ID.",
     response_description="Успешный ответ",
     status_code=status.HTTP_200_OK,
+    dependencies=[Depends(depends.QueryBudget(3))],
 )
 @error_handler
 async def get_user(
@@ -93,6 +100,7 @@ async def get_user(
     description="Маршрут - позволяет подписаться на другого пользователя.",
     response_description="Успешный ответ",
     status_code=status.HTTP_201_CREATED,
+    dependencies=[Depends(depends.QueryBudget(6))],
 )
 @error_handler
 async def add_following(
@@ -129,6 +137,7 @@ async def add_following(
     description="Маршрут - позволяет отписаться от другого пользователя.",
     response_description="Успешный ответ",
     status_code=status.HTTP_201_CREATED,
+    dependencies=[Depends(depends.QueryBudget(5))],
 )
 @error_handler
 async def delete_following(
@@ -0,0 +1,410 @@
+"""
+Выгрузка и загрузка данных через COPY (CSV или NDJSON).
+
+Каждая таблица выгружается в отдельный файл <каталог>/<таблица>.<формат>.
+Выгрузка идет потоком из COPY TO в файл в одном снимке базы (repeatable
+read), загрузка читает файл построчно и выполняет COPY FROM пачками по
+--batch-size строк, каждая пачка в своей транзакции. Поэтому память не
+зависит от размера таблиц. После загрузки последовательности ID
+выставляются на максимальный ID таблиц.
+
+Строки NDJSON загружаются во временную таблицу (jsonb), откуда
+переносятся в целевую таблицу через jsonb_populate_record, так что
+типы колонок приводит Postgres.
+
+Примеры запуска::
+
+    python -m app.bulk_data export --dir dump --format csv
+    python -m app.bulk_data import --dir dump --format csv --batch-size 50000
+"""
+import argparse
+import asyncio
+import json
+import time
+from io import BytesIO
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Sequence
+
+import aiofiles
+import asyncpg
+from asyncpg import Connection
+from sqlalchemy.engine import make_url
+
+from app.config import settings
+from app.utils.cache import cache, principal_cache
+from app.utils.logger import get_logger
+
+logger = get_logger("bulk_data")
+
+# Порядок таблиц соответствует внешним ключам: при загрузке сначала
+# пользователи, затем твиты и т.д.
+TABLES = (
+    "user",
+    "followings",
+    "tweet",
+    "media_segment",
+    "media_blob",
+    "media_job",
+    "media",
+    "tweet_likes",
+    "home_timeline",
+)
+SERIAL_TABLES = (
+    "user",
+    "followings",
+    "tweet",
+    "media_segment",
+    "media_job",
+    "media",
+    "tweet_likes",
+)
+FORMATS = ("csv", "ndjson")
+
+# Для NDJSON COPY работает в режиме csv с символами кавычки и разделителя,
+# которых нет в JSON, поэтому строка документа передается без изменений.
+RAW_OPTIONS: Dict[str, str] = {"format": "csv", "quote": "\x01", "delimiter": "\x02"}
+STAGING_TABLE = "bulk_data_staging"
+
+
+async def connect() -> Connection:
+    """
+    Открывает отдельное соединение asyncpg по настройкам приложения.
+
+    Соединения пула SQLAlchemy не подходят: на выданном из пула соединении
+    уже может быть открыта транзакция, и COPY попал бы в нее, а не в
+    собственную транзакцию пачки.
+
+    :return: соединение asyncpg
+    """
+    url = make_url(settings.async_db_uri).set(drivername="postgresql")
+    return await asyncpg.connect(url.render_as_string(hide_password=False))
+
+
+def quote_table(table: str) -> str:
+    return '"{table}"'.format(table=table)
+
+
+class Progress:
+    """Счетчик строк таблицы со скоростью в строках в секунду."""
+
+    def __init__(self, table: str) -> None:
+        self.table = table
+        self.rows = 0
+        self.started_at = time.perf_counter()
+
+    @property
+    def seconds(self) -> float:
+        return time.perf_counter() - self.started_at
+
+    @property
+    def rows_per_second(self) -> float:
+        return self.rows / self.seconds if self.seconds else 0.0
+
+    def add(self, rows: int) -> None:
+        self.rows += rows
+        logger.info("{table}: {rows} строк, {speed:.0f} строк/с".format(
+            table=self.table,
+            rows=self.rows,
+            speed=self.rows_per_second,
+        ))
+
+    def to_json(self) -> Dict[str, Any]:
+        return {
+            "rows": self.rows,
+            "seconds": round(self.seconds, 3),
+            "rows_per_second": round(self.rows_per_second),
+        }
+
+
+def table_path(directory: Path, table: str, data_format: str) -> Path:
+    return directory / "{table}.{ext}".format(table=table, ext=data_format)
+
+
+async def export_table(
+        conn: Connection,
+        table: str,
+        path: Path,
+        data_format: str,
+) -> Progress:
+    """
+    Выгружает таблицу в файл через COPY TO.
+
+    :param conn: соединение asyncpg внутри транзакции выгрузки
+    :param table: имя таблицы
+    :param path: файл для выгрузки
+    :param data_format: csv или ndjson
+    :return: количество строк и скорость выгрузки
+    """
+    progress = Progress(table)
+
+    async with aiofiles.open(path, mode="wb") as output:
+        if data_format == "csv":
+            status = await conn.copy_from_table(
+                table,
+                output=output.write,
+                format="csv",
+                header=True,
+            )
+        else:
+            status = await conn.copy_from_query(
+                "SELECT row_to_json(t) FROM {table} AS t".format(
+                    table=quote_table(table),
+                ),
+                output=output.write,
+                **RAW_OPTIONS,
+            )
+
+    progress.add(int(status.split()[-1]))
+    return progress
+
+
+def read_records(
+        path: Path,
+        data_format: str,
+        batch_size: int,
+) -> Iterator[List[bytes]]:
+    """
+    Читает файл пачками по batch_size записей.
+
+    Запись CSV может занимать несколько строк (перевод строки внутри
+    кавычек), поэтому запись заканчивается на строке, после которой
+    количество кавычек в записи четное.
+
+    :param path: файл с данными
+    :param data_format: csv или ndjson
+    :param batch_size: количество записей в пачке
+    :return: итератор пачек строк файла
+    """
+    batch: List[bytes] = []
+    record: List[bytes] = []
+    quotes = 0
+
+    with open(path, mode="rb") as source:
+        if data_format == "csv":
+            source.readline()
+        for line in source:
+            if data_format == "ndjson" and not line.strip():
+                continue
+            record.append(line)
+            if data_format == "csv":
+                quotes += line.count(b'"')
+                if quotes % 2:
+                    continue
+            batch.append(b"".join(record))
+            record = []
+            quotes = 0
+            if len(batch) == batch_size:
+                yield batch
+                batch = []
+
+    if record:
+        raise ValueError("{path}: незакрытая кавычка в последней записи".format(
+            path=path,
+        ))
+    if batch:
+        yield batch
+
+
+def csv_columns(path: Path) -> List[str]:
+    with open(path, mode="r", encoding="utf-8") as source:
+        return source.readline().strip().split(",")
+
+
+async def import_table(
+        conn: Connection,
+        table: str,
+        path: Path,
+        data_format: str,
+        batch_size: int,
+) -> Progress:
+    """
+    Загружает файл в таблицу через COPY FROM пачками.
+
+    Каждая пачка загружается и коммитится в отдельной транзакции.
+
+    :param conn: соединение asyncpg
+    :param table: имя таблицы
+    :param path: файл с данными
+    :param data_format: csv или ndjson
+    :param batch_size: количество строк в пачке
+    :return: количество строк и скорость загрузки
+    """
+    progress = Progress(table)
+    columns = csv_columns(path) if data_format == "csv" else None
+
+    for batch in read_records(path, data_format, batch_size):
+        async with conn.transaction():
+            if data_format == "csv":
+                await conn.copy_to_table(
+                    table,
+                    source=BytesIO(b"".join(batch)),
+                    columns=columns,
+                    format="csv",
+                )
+            else:
+                await conn.copy_to_table(
+                    STAGING_TABLE,
+                    source=BytesIO(b"".join(batch)),
+                    **RAW_OPTIONS,
+                )
+                await conn.execute(
+                    "INSERT INTO {table} SELECT r.* FROM {staging}, "
+                    "jsonb_populate_record(NULL::{table}, doc) AS r".format(
+                        table=quote_table(table),
+                        staging=STAGING_TABLE,
+                    ),
+                )
+        progress.add(len(batch))
+
+    return progress
+
+
+async def rebuild_sequences(conn: Connection, tables: Sequence[str]) -> None:
+    """
+    Выставляет последовательности ID таблиц на максимальный ID.
+
+    :param conn: соединение asyncpg
+    :param tables: имена таблиц
+    """
+    for table in tables:
+        if table not in SERIAL_TABLES:
+            continue
+        await conn.execute(
+            "SELECT setval(pg_get_serial_sequence($1, 'id'), "
+            "COALESCE(MAX(id), 1), MAX(id) IS NOT NULL) FROM {table}".format(
+                table=quote_table(table),
+            ),
+            quote_table(table),
+        )
+
+
+async def run_export(
+        conn: Connection,
+        directory: Path,
+        data_format: str,
+        tables: Sequence[str],
+) -> Dict[str, Any]:
+    """
+    Выгружает таблицы в каталог в одном снимке базы.
+
+    :param conn: соединение asyncpg
+    :param directory: каталог для файлов
+    :param data_format: csv или ndjson
+    :param tables: имена таблиц
+    :return: отчет по таблицам
+    """
+    directory.mkdir(parents=True, exist_ok=True)
+    report = {}
+
+    async with conn.transaction(isolation="repeatable_read", readonly=True):
+        for table in tables:
+            progress = await export_table(
+                conn,
+                table,
+                table_path(directory, table, data_format),
+                data_format,
+            )
+            report[table] = progress.to_json()
+
+    return report
+
+
+async def run_import(
+        conn: Connection,
+        directory: Path,
+        data_format: str,
+        tables: Sequence[str],
+        batch_size: int,
+        truncate: bool = False,
+) -> Dict[str, Any]:
+    """
+    Загружает таблицы из каталога и перестраивает последовательности ID.
+
+    Таблицы, для которых нет файла, пропускаются.
+
+    :param conn: соединение asyncpg
+    :param directory: каталог с файлами
+    :param data_format: csv или ndjson
+    :param tables: имена таблиц
+    :param batch_size: количество строк в пачке
+    :param truncate: очистить таблицы перед загрузкой; TRUNCATE выполняется
+        без CASCADE, поэтому таблицы, которые ссылаются на очищаемые,
+        должны загружаться вместе с ними, иначе Postgres откажет
+    :return: отчет по таблицам
+    """
+    tables = [
+        table for table in tables
+        if table_path(directory, table, data_format).exists()
+    ]
+    if truncate and tables:
+        await conn.execute("TRUNCATE {tables}".format(
+            tables=", ".join(quote_table(table) for table in tables),
+        ))
+    if data_format == "ndjson":
+        await conn.execute(
+            "CREATE TEMPORARY TABLE IF NOT EXISTS {staging} (doc jsonb) "
+            "ON COMMIT DELETE ROWS".format(staging=STAGING_TABLE),
+        )
+
+    report = {}
+    for table in tables:
+        progress = await import_table(
+            conn,
+            table,
+            table_path(directory, table, data_format),
+            data_format,
+            batch_size,
+        )
+        report[table] = progress.to_json()
+    await rebuild_sequences(conn, tables)
+
+    return report
+
+
+async def run(args: argparse.Namespace) -> Dict[str, Any]:
+    # Таблицы обрабатываются в порядке внешних ключей, а не в порядке --tables.
+    tables: Sequence[str] = [
+        table for table in TABLES if not args.tables or table in args.tables
+    ]
+
+    conn = await connect()
+    try:
+        if args.command == "export":
+            report = await run_export(conn, args.dir, args.format, tables)
+        else:
+            report = await run_import(
+                conn,
+                args.dir,
+                args.format,
+                tables,
+                args.batch_size,
+                args.truncate,
+            )
+            if "user" in report:
+                # Ключи могли перейти к другим пользователям.
+                await principal_cache.bump(cache)
+    finally:
+        await conn.close()
+
+    return {"command": args.command, "format": args.format, "tables": report}
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("command", choices=["export", "import"])
+    parser.add_argument("--dir", type=Path, required=True, help="каталог с файлами")
+    parser.add_argument("--format", choices=FORMATS, default="csv")
+    parser.add_argument("--tables", nargs="*", choices=TABLES)
+    parser.add_argument("--batch-size", type=int, default=10000)
+    parser.add_argument(
+        "--truncate",
+        action="store_true",
+        help="очистить таблицы перед загрузкой (без CASCADE)",
+    )
+    args = parser.parse_args()
+
+    print(json.dumps(asyncio.run(run(args)), indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -15,6 +15,71 @@ class Settings(BaseSettings):
     algorithm: str
     secret_key: str
     async_db_uri: Optional[str]
+    db_echo: bool = False
+    db_pool_size: int = 10
+    db_max_overflow: int = 10
+    db_pool_timeout: float = 30.0
+    db_pool_recycle: int = 1800
+    db_pool_pre_ping: bool = True
+    db_statement_cache_size: int = 100
+    db_pgbouncer_mode: bool = False
+    tweets_page_size: int = 20
+    tweets_max_page_size: int = 100
+    tweets_stream_max_size: int = 100000
+    tweets_stream_chunk_size: int = 500
+    tweets_batch_max_size: int = 1000
+    tweets_legacy_feed: bool = False
+    home_timeline_enabled: bool = True
+    feed_render_mode: str = "orm"
+    fanout_batch_size: int = 1000
+    fanout_follower_threshold: int = 10000
+    likes_sample_size: int = 3
+    likes_page_size: int = 50
+    like_buffer_enabled: bool = False
+    like_buffer_flush_ms: int = 200
+    like_buffer_max_entries: int = 1000
+    cache_backend: str = "memory"
+    cache_max_bytes: int = 64 * 1024 * 1024
+    cache_ttl: float = 30.0
+    cache_redis_url: str = "redis://localhost:6379/0"
+    auth_cache_max_entries: int = 10000
+    auth_cache_ttl: float = 300.0
+    auth_cache_negative_ttl: float = 10.0
+    auth_cache_check_seconds: float = 1.0
+    sql_n_plus_one_threshold: int = 3
+    sql_query_budget_strict: bool = False
+    metrics_enabled: bool = True
+    timeline_backfill_size: int = 100
+    warmup_enabled: bool = True
+    warmup_connections: int = 5
+    warmup_principals: int = 1000
+    warmup_max_attempts: int = 5
+    warmup_retry_seconds: float = 2.0
+    log_format: str = "text"
+    log_file_enabled: bool = True
+    log_sampling: Dict[str, float] = {}
+    media_max_size: int = 10 * 1024 * 1024
+    media_chunk_size: int = 64 * 1024
+    media_worker_enabled: bool = True
+    media_workers: int = 2
+    media_worker_poll_ms: int = 1000
+    media_job_max_attempts: int = 3
+    media_job_retry_seconds: float = 5.0
+    media_job_lease_seconds: float = 60.0
+    media_unlink_threads: int = 4
+    media_gc_enabled: bool = True
+    media_gc_interval_seconds: float = 3600.0
+    media_gc_batch_size: int = 500
+    media_gc_batch_pause_ms: int = 100
+    media_orphan_ttl_seconds: int = 86400
+    media_storage: str = "flat"
+    media_segment_max_size: int = 256 * 1024 * 1024
+    media_segment_max_blob_size: int = 1024 * 1024
+    media_segment_compact_ratio: float = 0.5
+    media_segment_lease_seconds: float = 3600.0
+    media_cache_max_age: int = 86400
+    media_accel_redirect: bool = False
+    media_accel_prefix: str = "/internal/images/"
 
     @validator("async_db_uri", pre=True)
     def assemble_db_connection(cls, v: Optional[str], values: Dict[str, Any]) -> Any:
@@ -37,6 +102,23 @@ class Settings(BaseSettings):
 
         return uploaded_file_path
 
+    @staticmethod
+    def path_image_temp() -> Path:
+        # Недописанные загрузки лежат отдельно, чтобы очистка не обходила
+        # весь каталог изображений.
+        temp_path = Settings.path_image() / ".tmp"
+        temp_path.mkdir(exist_ok=True)
+
+        return temp_path
+
+    @staticmethod
+    def path_segments() -> Path:
+        # Сегменты лежат вне каталога изображений, который отдает nginx.
+        segments_path = Path(__file__).parent / "segments"
+        segments_path.mkdir(exist_ok=True, parents=True)
+
+        return segments_path.absolute()
+
     class Config:
         # case_sensitive = True
         env_file = os.path.join(os.getcwd(), ".env")
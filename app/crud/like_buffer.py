@@ -0,0 +1,200 @@
+import asyncio
+from collections import Counter
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from sqlalchemy import Integer, column, delete, select, tuple_, update, values
+from sqlalchemy.dialects.postgresql import insert
+
+from app.config import settings
+from app.db.database import async_session
+from app.db.models import Tweet, TweetLikes
+from app.utils.cache import cache, tweet_cache_key
+from app.utils.logger import get_logger
+
+logger = get_logger("crud.like_buffer")
+
+LikeKey = Tuple[int, int]
+
+
+class LikeBuffer:
+    """
+    Буфер отложенной записи лайков (write-behind).
+
+    Лайки и их отмены копятся в памяти по ключу (user_id, tweet_id), так что
+    многократные переключения одного лайка схлопываются в одно итоговое
+    состояние. Буфер сбрасывается в tweet_likes одним многострочным
+    запросом каждые like_buffer_flush_ms миллисекунд, при накоплении
+    like_buffer_max_entries записей и при остановке приложения. Пачка,
+    которая записывается, остается видна в pending_for до фиксации.
+    """
+
+    def __init__(self, flush_interval: float, max_entries: int) -> None:
+        self.flush_interval = flush_interval
+        self.max_entries = max_entries
+        self._pending: Dict[LikeKey, bool] = {}
+        self._inflight: Dict[LikeKey, bool] = {}
+        self._wakeup = asyncio.Event()
+        self._lock = asyncio.Lock()
+        self._task: Optional[asyncio.Task] = None
+        self._stopping = False
+
+    def __len__(self) -> int:
+        return len(self._pending.keys() | self._inflight.keys())
+
+    def start(self) -> None:
+        """Запускает фоновую задачу периодического сброса буфера."""
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        """
+        Останавливает фоновую задачу и сбрасывает оставшиеся лайки.
+
+        Задача не отменяется, а завершается после текущего сброса, чтобы
+        не прервать запись пачки.
+        """
+        if self._task is not None:
+            self._stopping = True
+            self._wakeup.set()
+            try:
+                await self._task
+            finally:
+                self._task = None
+                self._stopping = False
+            logger.debug("Фоновый сброс лайков остановлен.")
+        await self.flush()
+
+    def add(self, user_id: int, tweet_id: int, liked: bool) -> None:
+        """
+        Запоминает итоговое состояние лайка пользователя.
+
+        :param user_id: ID пользователя
+        :param tweet_id: ID твита
+        :param liked: True - лайк, False - отмена лайка
+        """
+        self._pending[(user_id, tweet_id)] = liked
+        if len(self._pending) >= self.max_entries:
+            self._wakeup.set()
+
+    def pending_for(self, tweet_ids: Iterable[int]) -> Dict[LikeKey, bool]:
+        """
+        Возвращает еще не записанные состояния лайков для твитов, включая
+        записываемую пачку.
+
+        :param tweet_ids: ID твитов
+        :return: словарь (user_id, tweet_id) -> liked
+        """
+        tweet_ids = set(tweet_ids)
+        return {
+            key: liked
+            for key, liked in {**self._inflight, **self._pending}.items()
+            if key[1] in tweet_ids
+        }
+
+    async def flush(self) -> int:
+        """
+        Записывает накопленные лайки в базу одной транзакцией.
+
+        Лайки вставляются одним INSERT ... ON CONFLICT DO NOTHING, отмены
+        удаляются одним DELETE, like_count обновляется одним UPDATE по
+        фактически измененным строкам. При ошибке или отмене записи лайки
+        возвращаются в буфер, если их не успели переписать новые.
+
+        :return: количество записанных состояний
+        """
+        async with self._lock:
+            if not self._pending:
+                return 0
+
+            batch, self._pending = self._pending, {}
+            self._inflight = batch
+            try:
+                changed = await self._write(batch)
+            except Exception:
+                logger.exception("Ошибка записи буфера лайков.")
+                self._restore(batch)
+                return 0
+            except BaseException:
+                self._restore(batch)
+                raise
+            finally:
+                self._inflight = {}
+
+        await cache.delete(*[tweet_cache_key(tweet_id) for tweet_id in changed])
+        logger.debug(
+            "Записано {count} лайков из буфера.".format(count=len(batch)),
+        )
+        return len(batch)
+
+    def _restore(self, batch: Dict[LikeKey, bool]) -> None:
+        for key, liked in batch.items():
+            self._pending.setdefault(key, liked)
+
+    async def _run(self) -> None:
+        while not self._stopping:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), self.flush_interval)
+            except asyncio.TimeoutError:
+                logger.debug("Плановый сброс буфера лайков.")
+            self._wakeup.clear()
+            await self.flush()
+
+    @staticmethod
+    async def _write(batch: Dict[LikeKey, bool]) -> List[int]:
+        likes = [key for key, liked in batch.items() if liked]
+        unlikes = [key for key, liked in batch.items() if not liked]
+        deltas: Counter = Counter()
+
+        async with async_session() as session:
+            if likes:
+                new_likes = values(
+                    column("user_id", Integer),
+                    column("tweet_id", Integer),
+                    name="new_likes",
+                ).data(likes)
+                inserted = await session.execute(
+                    insert(TweetLikes).from_select(
+                        ["user_id", "tweet_id"],
+                        select(new_likes.c.user_id, new_likes.c.tweet_id).join(
+                            Tweet,
+                            Tweet.id == new_likes.c.tweet_id,
+                        ),
+                    ).on_conflict_do_nothing(
+                        constraint="uq_tweet_likes_tweet_user",
+                    ).returning(TweetLikes.tweet_id),
+                )
+                deltas.update(inserted.scalars().all())
+
+            if unlikes:
+                deleted = await session.execute(
+                    delete(TweetLikes).where(
+                        tuple_(TweetLikes.user_id, TweetLikes.tweet_id).in_(unlikes),
+                    ).returning(TweetLikes.tweet_id),
+                )
+                deltas.subtract(deleted.scalars().all())
+
+            changed = {
+                tweet_id: delta for tweet_id, delta in deltas.items() if delta
+            }
+            if changed:
+                tweet_deltas = values(
+                    column("tweet_id", Integer),
+                    column("delta", Integer),
+                    name="tweet_deltas",
+                ).data(list(changed.items()))
+                await session.execute(
+                    update(Tweet).where(
+                        Tweet.id == tweet_deltas.c.tweet_id,
+                    ).values(
+                        like_count=Tweet.like_count + tweet_deltas.c.delta,
+                    ).execution_options(synchronize_session=False),
+                )
+            await session.commit()
+
+        return list(deltas)
+
+
+like_buffer = LikeBuffer(
+    settings.like_buffer_flush_ms / 1000,
+    settings.like_buffer_max_entries,
+)
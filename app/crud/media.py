@@ -1,19 +1,43 @@
-import os
+import hashlib
 import uuid
+from collections import Counter
 from pathlib import Path
+from typing import Any, Dict, List, Optional, Sequence, Tuple
 
-import aiofiles
 from fastapi import Depends, UploadFile
+from sqlalchemy import Integer, String, column, delete, func, select, update, values
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.engine import Row
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from app.config import settings
+from app.crud.media_storage import MediaStorage, StoredFile, storage_for_upload
+from app.crud.media_worker import media_worker
 from app.db.database import get_db
-from app.db.models import Media
+from app.db.models import Media, MediaBlob, MediaJob, MediaSegment
 from app.utils.logger import get_logger
 
 logger = get_logger("crud.media")
 
 
+def blob_file_name(sha256: str, filename: Optional[str]) -> str:
+    """
+    Имя файла блоба: хеш содержимого, случайный суффикс и расширение.
+
+    Суффикс различает файлы одного содержимого, созданные заново после
+    удаления блоба, поэтому удаление старого файла не задевает новый.
+
+    :param sha256: SHA-256 содержимого (hex)
+    :param filename: имя загруженного файла
+    :return: имя файла в каталоге медиа
+    """
+    return "{sha256}-{suffix}{ext}".format(
+        sha256=sha256,
+        suffix=uuid.uuid4().hex[:8],
+        ext=Path(filename or "").suffix,
+    )
+
+
 class MediaService:
     """Класс для обработки Endpoint связанных с media файлами."""
 
@@ -23,26 +47,231 @@ class MediaService:
     async def write_file(
             self,
             file: UploadFile,
-    ):
+    ) -> Optional[int]:
         """
         Метод для записи полученного файла.
 
+        Файлы хранятся по содержимому (MediaBlob): сначала считается
+        SHA-256 загрузки (hash_upload). Если блоб с таким хешем уже есть,
+        его счетчик ссылок увеличивается и файл на диск не пишется. Иначе
+        файл сохраняется в хранилище (storage_for_upload) и создается блоб. Запись
+        Media ссылается на блоб и сохраняется в той же транзакции вместе с
+        задачей обработки нового файла (MediaWorker); если она не
+        сохранилась, созданный файл удаляется.
+
         :param file: Полученный файл
-        :return: Объект согласно схеме Success или Failure
+        :return: ID медиа или None, если файл больше media_max_size
         """
-        home = settings.path_image()
-        filename = str(uuid.uuid4())
-        file_name_extension = os.path.splitext(file.filename)
+        hashed = await self.hash_upload(file)
+        if hashed is None:
+            return None
+        sha256, size = hashed
 
-        file_name = "{name}.{ext}".format(name=filename, ext=file_name_extension)
-        file_path = "images/{image_name}".format(image_name=file_name)
-        path_absolute = str(Path(home, file_name))
+        created: Optional[Tuple[MediaStorage, str, Dict[str, Any]]] = None
+        path_file = await self.acquire_blob(sha256)
+        if path_file is None:
+            file_name = blob_file_name(sha256, file.filename)
+            storage = storage_for_upload(size)
+            while path_file is None:
+                # None: сегмент с записанным файлом уже переписан
+                # (SegmentStorage.compact_segment), файл пишется заново.
+                await file.seek(0)
+                placement = await storage.save(file, file_name, size)
+                path_file = await self.insert_blob(
+                    sha256,
+                    "images/{image_name}".format(image_name=file_name),
+                    size,
+                    placement,
+                )
+            created = (storage, file_name, placement)
+            if path_file != "images/{image_name}".format(image_name=file_name):
+                # Одновременная загрузка того же содержимого создала блоб раньше.
+                await storage.discard(file_name, placement)
+                created = None
+            else:
+                self.session.add(MediaJob(sha256=sha256))
 
-        add_img = Media(path_file=file_path)
+        add_img = Media(path_file=path_file, sha256=sha256, size=size)
         self.session.add(add_img)
-        await self.session.commit()
+        try:
+            await self.session.commit()
+        except Exception:
+            if created is not None:
+                await created[0].discard(created[1], created[2])
+            raise
 
-        async with aiofiles.open(path_absolute, mode="wb") as file_image:
-            content = await file.read()
-            await file_image.write(content)
+        if created is not None:
+            media_worker.notify()
         return add_img.id
+
+    async def get_media_file(self, media_id: int) -> Optional[Row]:
+        """
+        Метод для получения размещения файла медиа.
+
+        :param media_id: ID медиа
+        :return: path_file, sha256 и размещение блоба (size, segment_id,
+            segment_offset) или None, если медиа нет
+        """
+        result = await self.session.execute(
+            select(
+                Media.path_file,
+                Media.sha256,
+                func.coalesce(MediaBlob.size, Media.size).label("size"),
+                MediaBlob.segment_id,
+                MediaBlob.segment_offset,
+            ).outerjoin(
+                MediaBlob,
+                MediaBlob.sha256 == Media.sha256,
+            ).where(Media.id == media_id),
+        )
+        return result.one_or_none()
+
+    @staticmethod
+    async def hash_upload(file: UploadFile) -> Optional[Tuple[str, int]]:
+        """
+        Считает SHA-256 и размер загруженного файла, читая его частями по
+        media_chunk_size.
+
+        Чтение прерывается, как только размер превысил media_max_size.
+
+        :param file: Полученный файл
+        :return: SHA-256 (hex) и размер в байтах или None, если файл
+            больше media_max_size
+        """
+        digest = hashlib.sha256()
+        size = 0
+
+        while chunk := await file.read(settings.media_chunk_size):
+            size += len(chunk)
+            if size > settings.media_max_size:
+                logger.warning(
+                    "Файл {name} больше {max_size} байт, загрузка прервана.".format(
+                        name=file.filename,
+                        max_size=settings.media_max_size,
+                    ),
+                )
+                return None
+            digest.update(chunk)
+
+        return digest.hexdigest(), size
+
+    async def acquire_blob(self, sha256: str) -> Optional[str]:
+        """
+        Добавляет ссылку на существующий блоб.
+
+        :param sha256: SHA-256 содержимого (hex)
+        :return: путь файла блоба или None, если блоба нет
+        """
+        result = await self.session.execute(
+            update(MediaBlob).where(
+                MediaBlob.sha256 == sha256,
+            ).values(
+                ref_count=MediaBlob.ref_count + 1,
+            ).returning(
+                MediaBlob.path_file,
+            ).execution_options(synchronize_session=False),
+        )
+        return result.scalar_one_or_none()
+
+    async def insert_blob(
+            self,
+            sha256: str,
+            path_file: str,
+            size: int,
+            placement: Dict[str, Any],
+    ) -> Optional[str]:
+        """
+        Создает блоб с одной ссылкой.
+
+        Если блоб с тем же хешем успели создать, увеличивается его счетчик
+        ссылок. Строка сегмента блоба блокируется (FOR KEY SHARE) до конца
+        транзакции, поэтому SegmentStorage.compact_segment ждет ее
+        фиксации и переносит новый блоб вместе с остальными.
+
+        :param sha256: SHA-256 содержимого (hex)
+        :param path_file: путь записанного файла
+        :param size: размер файла в байтах
+        :param placement: колонки размещения блоба (MediaStorage.save)
+        :return: путь файла блоба или None, если сегмент блоба уже
+            переписан
+        """
+        segment_id = placement.get("segment_id")
+        if segment_id is not None:
+            segment = await self.session.execute(
+                select(MediaSegment.id).where(
+                    MediaSegment.id == segment_id,
+                    MediaSegment.retired_at.is_(None),
+                ).with_for_update(key_share=True),
+            )
+            if segment.scalar_one_or_none() is None:
+                return None
+
+        statement = insert(MediaBlob).values(
+            sha256=sha256,
+            path_file=path_file,
+            size=size,
+            ref_count=1,
+            **placement,
+        )
+        result = await self.session.execute(
+            statement.on_conflict_do_update(
+                index_elements=[MediaBlob.sha256],
+                set_={"ref_count": MediaBlob.ref_count + 1},
+            ).returning(MediaBlob.path_file),
+        )
+        return result.scalar_one()
+
+    async def release_blobs(self, hashes: Sequence[str]) -> List[StoredFile]:
+        """
+        Убирает по одной ссылке на блоб для каждого хеша.
+
+        Блобы без ссылок удаляются; их место освобождает вызывающий код
+        после фиксации транзакции (remove_stored).
+
+        :param hashes: SHA-256 удаленных медиа, хеш повторяется по числу медиа
+        :return: размещение удаленных блобов
+        """
+        if not hashes:
+            return []
+
+        released = values(
+            column("sha256", String),
+            column("total", Integer),
+            name="released",
+        ).data(list(Counter(hashes).items()))
+        await self.session.execute(
+            update(MediaBlob).where(
+                MediaBlob.sha256 == released.c.sha256,
+            ).values(
+                ref_count=MediaBlob.ref_count - released.c.total,
+            ).execution_options(synchronize_session=False),
+        )
+        result = await self.session.execute(
+            delete(MediaBlob).where(
+                MediaBlob.sha256.in_(set(hashes)),
+                MediaBlob.ref_count <= 0,
+            ).returning(
+                MediaBlob.path_file,
+                MediaBlob.size,
+                MediaBlob.segment_id,
+                MediaBlob.segment_offset,
+            ).execution_options(synchronize_session=False),
+        )
+        return [StoredFile(*row) for row in result.all()]
+
+    async def release_media(self, media: Sequence[Row]) -> List[StoredFile]:
+        """
+        Освобождает файлы удаленных медиа.
+
+        Медиа с хешем освобождают свои блобы (release_blobs), файлы медиа
+        без хеша (загруженные до MediaBlob) освобождаются всегда.
+
+        :param media: удаленные медиа (path_file, sha256)
+        :return: размещение файлов, которые нужно освободить после
+            фиксации транзакции
+        """
+        stored = [StoredFile(row.path_file) for row in media if row.sha256 is None]
+        stored += await self.release_blobs(
+            [row.sha256 for row in media if row.sha256 is not None],
+        )
+        return stored
@@ -0,0 +1,205 @@
+import asyncio
+import os
+import time
+from datetime import timedelta
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+from sqlalchemy import delete, func, select
+
+from app.config import settings
+from app.crud.media import MediaService
+from app.crud.media_storage import (
+    TEMP_SUFFIX,
+    StoredFile,
+    flat_storage,
+    remove_stored,
+    segment_storage,
+    unlink_executor,
+)
+from app.db.database import async_session
+from app.db.models import Media, MediaFileCleanup
+from app.utils.logger import get_logger
+
+logger = get_logger("crud.media_gc")
+
+
+def expired_temp_files(temp_dir: Path, ttl: float) -> List[str]:
+    """
+    Ищет временные файлы загрузок, которые не дописали дольше ttl секунд.
+
+    Такие файлы остаются, если процесс остановился во время загрузки.
+    Просматривается только каталог временных файлов, а не весь каталог
+    изображений.
+
+    :param temp_dir: каталог временных файлов (Settings.path_image_temp)
+    :param ttl: возраст файла в секундах
+    :return: пути файлов вида images/.tmp/<имя>
+    """
+    expired_before = time.time() - ttl
+    with os.scandir(temp_dir) as entries:
+        return [
+            "images/{temp_dir}/{name}".format(temp_dir=temp_dir.name, name=entry.name)
+            for entry in entries
+            if entry.name.endswith(TEMP_SUFFIX) and
+            entry.is_file() and
+            entry.stat().st_mtime < expired_before
+        ]
+
+
+class MediaSweeper:
+    """
+    Фоновое удаление медиа, которые так и не прикрепили к твиту.
+
+    Раз в media_gc_interval_seconds удаляются записи Media без твита,
+    загруженные раньше media_orphan_ttl_seconds назад, пачками по
+    media_gc_batch_size с паузой media_gc_batch_pause_ms между пачками,
+    чтобы не нагружать базу и диск. Строки пачки блокируются с SKIP
+    LOCKED, а условие повторяется в DELETE, поэтому одновременные и
+    повторные запуски безопасны. Файлы освобожденных блобов, файлы из
+    media_file_cleanup и недописанные временные файлы загрузок удаляются
+    в пуле потоков (FlatFileStorage.remove), место в сегментах
+    возвращает SegmentStorage.compact.
+    """
+
+    def __init__(self, interval: float) -> None:
+        self.interval = interval
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self) -> None:
+        """Запускает периодическую очистку."""
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        """Останавливает периодическую очистку."""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                logger.debug("Очистка медиа остановлена.")
+            self._task = None
+
+    async def sweep(self) -> Dict[str, int]:
+        """
+        Удаляет все найденные непривязанные медиа, файлы из
+        media_file_cleanup и временные файлы и сжимает сегменты
+        (SegmentStorage.compact).
+
+        :return: количество удаленных медиа и освобожденные байты
+        """
+        report = {"media": 0, "bytes": 0}
+
+        while True:
+            deleted, stored = await self.delete_orphans()
+            report["media"] += deleted
+            report["bytes"] += await remove_stored(stored, "orphan")
+            if deleted < settings.media_gc_batch_size:
+                break
+            await asyncio.sleep(settings.media_gc_batch_pause_ms / 1000)
+
+        while True:
+            unused = await self.delete_unused_files()
+            report["bytes"] += await flat_storage.remove(unused, "unused")
+            if len(unused) < settings.media_gc_batch_size:
+                break
+            await asyncio.sleep(settings.media_gc_batch_pause_ms / 1000)
+
+        loop = asyncio.get_running_loop()
+        temp_files = await loop.run_in_executor(
+            unlink_executor,
+            expired_temp_files,
+            settings.path_image_temp(),
+            settings.media_orphan_ttl_seconds,
+        )
+        report["bytes"] += await flat_storage.remove(
+            [StoredFile(path_file) for path_file in temp_files],
+            "temp",
+        )
+        report["bytes"] += await segment_storage.compact()
+
+        if report["media"] or temp_files:
+            logger.info(
+                "Очистка медиа: {media} медиа, {temp} временных файлов, "
+                "{size} байт.".format(
+                    media=report["media"],
+                    temp=len(temp_files),
+                    size=report["bytes"],
+                ),
+            )
+        return report
+
+    @staticmethod
+    async def delete_orphans() -> Tuple[int, List[StoredFile]]:
+        """
+        Удаляет одну пачку непривязанных медиа.
+
+        :return: количество удаленных медиа и размещение файлов для
+            освобождения
+        """
+        orphaned = Media.tweet_id.is_(None)
+        async with async_session() as session:
+            result = await session.execute(
+                delete(Media).where(
+                    Media.id.in_(
+                        select(Media.id).where(
+                            orphaned,
+                            Media.created_at < func.now() - timedelta(
+                                seconds=settings.media_orphan_ttl_seconds,
+                            ),
+                        ).order_by(
+                            Media.created_at,
+                        ).limit(
+                            settings.media_gc_batch_size,
+                        ).with_for_update(skip_locked=True),
+                    ),
+                    orphaned,
+                ).returning(
+                    Media.path_file,
+                    Media.sha256,
+                ).execution_options(synchronize_session=False),
+            )
+            media = result.all()
+            stored = await MediaService(session).release_media(media)
+            await session.commit()
+
+        return len(media), stored
+
+    @staticmethod
+    async def delete_unused_files() -> List[StoredFile]:
+        """
+        Удаляет одну пачку записей media_file_cleanup.
+
+        Файлы удаляются после фиксации транзакции, как и файлы
+        освобожденных блобов.
+
+        :return: файлы для удаления
+        """
+        async with async_session() as session:
+            result = await session.execute(
+                delete(MediaFileCleanup).where(
+                    MediaFileCleanup.path_file.in_(
+                        select(MediaFileCleanup.path_file).limit(
+                            settings.media_gc_batch_size,
+                        ).with_for_update(skip_locked=True),
+                    ),
+                ).returning(
+                    MediaFileCleanup.path_file,
+                ).execution_options(synchronize_session=False),
+            )
+            unused = [StoredFile(path_file) for path_file in result.scalars()]
+            await session.commit()
+
+        return unused
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                await self.sweep()
+            except Exception:
+                logger.exception("Ошибка очистки медиа.")
+            await asyncio.sleep(self.interval)
+
+
+media_sweeper = MediaSweeper(settings.media_gc_interval_seconds)
@@ -0,0 +1,632 @@
+import asyncio
+import mmap
+import os
+import time
+from abc import ABC, abstractmethod
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from pathlib import Path
+from typing import Any, Dict, List, NamedTuple, Optional, Sequence, Tuple
+
+import aiofiles
+from fastapi import UploadFile
+from sqlalchemy import (
+    BigInteger,
+    Integer,
+    String,
+    column,
+    delete,
+    func,
+    insert,
+    select,
+    update,
+    values,
+)
+
+from app.config import settings
+from app.db.database import async_session
+from app.db.models import MediaBlob, MediaSegment
+from app.utils.logger import get_logger
+from app.utils.metrics import MEDIA_RECLAIMED_BYTES, MEDIA_RECLAIMED_FILES
+
+logger = get_logger("crud.media_storage")
+
+# Временные файлы загрузок (Settings.path_image_temp): недописанные
+# файлы удаляет MediaSweeper.
+TEMP_SUFFIX = ".part"
+
+unlink_executor = ThreadPoolExecutor(
+    max_workers=settings.media_unlink_threads,
+    thread_name_prefix="media-unlink",
+)
+
+
+class StoredFile(NamedTuple):
+    """Место хранения содержимого блоба (или медиа без блоба)."""
+
+    path_file: str
+    size: Optional[int] = None
+    segment_id: Optional[int] = None
+    segment_offset: Optional[int] = None
+
+
+class MediaLocation(NamedTuple):
+    """Диапазон байтов файла с содержимым медиа для mmap/sendfile."""
+
+    path: Path
+    offset: int
+    length: int
+
+
+def unlink_file(path: Path) -> Optional[int]:
+    """
+    Удаляет файл, если он существует.
+
+    :param path: путь файла
+    :return: размер удаленного файла или None, если файла уже нет
+    """
+    try:
+        size = path.stat().st_size
+        path.unlink()
+    except FileNotFoundError:
+        return None
+    return size
+
+
+def read_range(location: MediaLocation) -> bytes:
+    """
+    Читает содержимое медиа через mmap, не загружая остальной файл.
+
+    :param location: файл и диапазон байтов
+    :return: содержимое медиа
+    """
+    if location.length == 0:
+        return b""
+    with open(location.path, mode="rb") as source:
+        with mmap.mmap(source.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            return mapped[location.offset:location.offset + location.length]
+
+
+def copy_range(source: Path, offset: int, length: int, target_fd: int) -> None:
+    """
+    Дописывает диапазон байтов файла в конец другого файла через sendfile.
+
+    :param source: исходный файл
+    :param offset: начало диапазона
+    :param length: длина диапазона
+    :param target_fd: дескриптор файла, открытого на дозапись
+    """
+    with open(source, mode="rb") as source_file:
+        while length > 0:
+            sent = os.sendfile(target_fd, source_file.fileno(), offset, length)
+            if sent == 0:
+                raise EOFError("{path}: диапазон за концом файла".format(path=source))
+            offset += sent
+            length -= sent
+
+
+class MediaStorage(ABC):
+    """
+    Хранилище содержимого блобов.
+
+    Блоб сохраняется методом save, который возвращает значения колонок
+    размещения MediaBlob; locate возвращает файл и диапазон байтов для
+    чтения. Освобожденные блобы передаются в remove после фиксации
+    транзакции, compact возвращает место, занятое удаленными блобами.
+    """
+
+    @abstractmethod
+    async def save(self, file: UploadFile, file_name: str, size: int) -> Dict[str, Any]:
+        """
+        Сохраняет загруженный файл.
+
+        :param file: Полученный файл (чтение с начала)
+        :param file_name: имя файла блоба
+        :param size: размер файла в байтах
+        :return: колонки размещения блоба (segment_id, segment_offset)
+        """
+
+    @abstractmethod
+    async def discard(self, file_name: str, placement: Dict[str, Any]) -> None:
+        """
+        Отменяет save, если блоб не сохранился в базе.
+
+        :param file_name: имя файла блоба
+        :param placement: результат save
+        """
+
+    @abstractmethod
+    def locate(self, stored: StoredFile) -> MediaLocation:
+        """
+        Находит содержимое блоба.
+
+        :param stored: размещение блоба
+        :return: файл и диапазон байтов содержимого
+        """
+
+    @abstractmethod
+    async def remove(self, stored: Sequence[StoredFile], reason: str) -> int:
+        """
+        Освобождает место блобов, удаленных из базы.
+
+        :param stored: размещение блобов
+        :param reason: причина удаления для метрик media_reclaimed_*
+        :return: освобожденные байты
+        """
+
+    async def compact(self) -> int:
+        """
+        Возвращает место удаленных блобов, которое remove не освободил.
+
+        :return: освобожденные байты
+        """
+        return 0
+
+
+class FlatFileStorage(MediaStorage):
+    """Отдельный файл на блоб в каталоге изображений (Settings.path_image)."""
+
+    async def save(self, file: UploadFile, file_name: str, size: int) -> Dict[str, Any]:
+        """
+        Копирует загруженный файл в каталог изображений частями по
+        media_chunk_size.
+
+        Файл пишется во временный файл в подкаталоге .tmp, сбрасывается на
+        диск и атомарно переименовывается, поэтому недописанный файл под
+        итоговым именем не появляется.
+
+        :param file: Полученный файл
+        :param file_name: имя файла блоба
+        :param size: размер файла в байтах
+        :return: колонки размещения блоба (у файла их нет)
+        """
+        destination = settings.path_image() / file_name
+        temp_path = settings.path_image_temp() / "{name}{suffix}".format(
+            name=file_name,
+            suffix=TEMP_SUFFIX,
+        )
+
+        try:
+            async with aiofiles.open(temp_path, mode="wb") as output:
+                while chunk := await file.read(settings.media_chunk_size):
+                    await output.write(chunk)
+                await output.flush()
+                await asyncio.to_thread(os.fsync, output.fileno())
+            os.replace(temp_path, destination)
+        except BaseException:
+            temp_path.unlink(missing_ok=True)
+            raise
+        return {}
+
+    async def discard(self, file_name: str, placement: Dict[str, Any]) -> None:
+        await asyncio.get_running_loop().run_in_executor(
+            unlink_executor,
+            unlink_file,
+            settings.path_image() / file_name,
+        )
+
+    def locate(self, stored: StoredFile) -> MediaLocation:
+        path = settings.path_image() / stored.path_file.split("/")[1]
+        if stored.size is None:
+            return MediaLocation(path, 0, path.stat().st_size)
+        return MediaLocation(path, 0, stored.size)
+
+    async def remove(self, stored: Sequence[StoredFile], reason: str) -> int:
+        """
+        Удаляет файлы в пуле потоков.
+
+        Уже удаленные файлы пропускаются. Освобожденные байты и файлы
+        учитываются в метриках media_reclaimed_*.
+
+        :param stored: файлы блобов (пути вида images/<имя> или
+            images/.tmp/<имя>)
+        :param reason: причина удаления для метрик (tweet, orphan, temp)
+        :return: освобожденные байты
+        """
+        if not stored:
+            return 0
+
+        loop = asyncio.get_running_loop()
+        home = settings.path_image()
+        removed = await asyncio.gather(*[
+            loop.run_in_executor(
+                unlink_executor,
+                unlink_file,
+                home / item.path_file.split("/", 1)[1],
+            )
+            for item in stored
+        ])
+        reclaimed = sum(size for size in removed if size is not None)
+        MEDIA_RECLAIMED_FILES.labels(reason).inc(
+            sum(1 for size in removed if size is not None),
+        )
+        MEDIA_RECLAIMED_BYTES.labels(reason).inc(reclaimed)
+        return reclaimed
+
+
+class SegmentStorage(MediaStorage):
+    """
+    Небольшие блобы, дописанные подряд в большие файлы-сегменты.
+
+    Каждый процесс дописывает блобы в свой текущий сегмент (строка
+    media_segment) под asyncio.Lock, поэтому смещения не пересекаются
+    без блокировок между процессами. Сегмент больше
+    media_segment_max_size закрывается (sealed) и заменяется новым.
+    Блоб хранится как (segment_id, segment_offset, size) и читается
+    через mmap или sendfile. Место удаленных блобов остается в сегменте,
+    пока compact не перепишет живые блобы закрытого сегмента в текущий
+    сегмент; старый файл удаляется одной из следующих очисток, чтобы
+    чтения по старому размещению успели закончиться.
+
+    Процесс продлевает владение текущим сегментом (heartbeat_at) при
+    записи. Сегмент, который не продлевали дольше
+    media_segment_lease_seconds (процесс упал без seal), закрывается
+    очисткой и становится доступен для compact.
+    """
+
+    def __init__(self) -> None:
+        self._lock = asyncio.Lock()
+        self._segment_id: Optional[int] = None
+        self._segment_size = 0
+        self._heartbeat = 0.0
+
+    @staticmethod
+    def segment_path(segment_id: int) -> Path:
+        return settings.path_segments() / "{segment_id:08d}.seg".format(
+            segment_id=segment_id,
+        )
+
+    async def _active_segment(self, size: int) -> Tuple[int, int]:
+        # Вызывается под self._lock.
+        stale = settings.media_segment_lease_seconds / 2
+        if self._segment_id is not None and time.monotonic() - self._heartbeat > stale:
+            await self._renew()
+        if self._segment_id is not None and self._segment_size > 0 and (
+            self._segment_size + size > settings.media_segment_max_size
+        ):
+            await self.seal()
+        if self._segment_id is None:
+            async with async_session() as session:
+                result = await session.execute(
+                    insert(MediaSegment).returning(MediaSegment.id),
+                )
+                self._segment_id = result.scalar_one()
+                await session.commit()
+            self.segment_path(self._segment_id).write_bytes(b"")
+            self._segment_size = 0
+            self._heartbeat = time.monotonic()
+        return self._segment_id, self._segment_size
+
+    async def _renew(self) -> None:
+        # Продлевает владение текущим сегментом. Если сегмент уже закрыт
+        # как брошенный (seal_abandoned), запись в него прекращается.
+        async with async_session() as session:
+            result = await session.execute(
+                update(MediaSegment).where(
+                    MediaSegment.id == self._segment_id,
+                    MediaSegment.sealed.is_(False),
+                ).values(
+                    heartbeat_at=func.now(),
+                ).returning(
+                    MediaSegment.id,
+                ).execution_options(synchronize_session=False),
+            )
+            renewed = result.scalar_one_or_none()
+            await session.commit()
+        if renewed is None:
+            self._segment_id = None
+            self._segment_size = 0
+        self._heartbeat = time.monotonic()
+
+    async def seal(self) -> None:
+        """Закрывает текущий сегмент процесса для дозаписи."""
+        if self._segment_id is None:
+            return
+        async with async_session() as session:
+            await session.execute(
+                update(MediaSegment).where(
+                    MediaSegment.id == self._segment_id,
+                ).values(sealed=True).execution_options(synchronize_session=False),
+            )
+            await session.commit()
+        self._segment_id = None
+        self._segment_size = 0
+
+    async def save(self, file: UploadFile, file_name: str, size: int) -> Dict[str, Any]:
+        """
+        Дописывает загруженный файл в конец текущего сегмента.
+
+        Если запись не удалась, сегмент обрезается до прежнего размера.
+
+        :param file: Полученный файл
+        :param file_name: имя файла блоба (не используется)
+        :param size: размер файла в байтах
+        :return: segment_id и segment_offset блоба
+        """
+        async with self._lock:
+            segment_id, offset = await self._active_segment(size)
+            path = self.segment_path(segment_id)
+            try:
+                async with aiofiles.open(path, mode="r+b") as output:
+                    await output.seek(offset)
+                    while chunk := await file.read(settings.media_chunk_size):
+                        await output.write(chunk)
+                    await output.flush()
+                    await asyncio.to_thread(os.fsync, output.fileno())
+            except BaseException:
+                os.truncate(path, offset)
+                raise
+            self._segment_size = offset + size
+
+        return {"segment_id": segment_id, "segment_offset": offset}
+
+    async def discard(self, file_name: str, placement: Dict[str, Any]) -> None:
+        """Место блоба освобождает compact."""
+
+    def locate(self, stored: StoredFile) -> MediaLocation:
+        return MediaLocation(
+            self.segment_path(stored.segment_id),
+            stored.segment_offset,
+            stored.size,
+        )
+
+    async def remove(self, stored: Sequence[StoredFile], reason: str) -> int:
+        """Место блобов освобождает compact."""
+        return 0
+
+    async def compact(self) -> int:
+        """
+        Переписывает закрытые сегменты, где живые блобы занимают не больше
+        media_segment_compact_ratio размера файла.
+
+        Перед этим закрываются брошенные сегменты (seal_abandoned) и
+        удаляются файлы сегментов, переписанных предыдущими очистками
+        (purge_retired).
+
+        :return: освобожденные байты
+        """
+        await self.seal_abandoned()
+        await self.purge_retired()
+        async with async_session() as session:
+            result = await session.execute(
+                select(
+                    MediaSegment.id,
+                    func.coalesce(func.sum(MediaBlob.size), 0).label("live"),
+                ).outerjoin(
+                    MediaBlob,
+                    MediaBlob.segment_id == MediaSegment.id,
+                ).where(
+                    MediaSegment.sealed.is_(True),
+                    MediaSegment.retired_at.is_(None),
+                ).group_by(MediaSegment.id),
+            )
+            segments = result.all()
+
+        reclaimed = 0
+        for segment in segments:
+            path = self.segment_path(segment.id)
+            file_size = path.stat().st_size if path.exists() else 0
+            if segment.live <= file_size * settings.media_segment_compact_ratio:
+                reclaimed += await self.compact_segment(segment.id)
+        return reclaimed
+
+    async def compact_segment(self, segment_id: int) -> int:
+        """
+        Переносит живые блобы сегмента в текущий сегмент и отмечает
+        сегмент переписанным (retired_at).
+
+        Строка сегмента блокируется до конца переноса (FOR UPDATE), поэтому
+        перенос ждет фиксации загрузок, которые уже дописали блоб в
+        сегмент (MediaService.insert_blob), а более поздние загрузки видят
+        сегмент переписанным. Строки блобов сегмента тоже блокируются,
+        поэтому одновременное освобождение или добавление ссылок ждет
+        переноса. Файл
+        удаляет purge_retired не раньше чем через половину
+        media_gc_interval_seconds, то есть при одной из следующих
+        очисток: запросы, которые уже получили старое размещение блоба,
+        успевают его прочитать.
+
+        :param segment_id: ID закрытого сегмента
+        :return: освобожденные байты
+        """
+        source = self.segment_path(segment_id)
+        async with async_session() as session:
+            locked = await session.execute(
+                select(MediaSegment.id).where(
+                    MediaSegment.id == segment_id,
+                    MediaSegment.retired_at.is_(None),
+                ).with_for_update(),
+            )
+            if locked.scalar_one_or_none() is None:
+                # Сегмент уже переписала другая очистка.
+                return 0
+
+            result = await session.execute(
+                select(
+                    MediaBlob.sha256,
+                    MediaBlob.segment_offset,
+                    MediaBlob.size,
+                ).where(
+                    MediaBlob.segment_id == segment_id,
+                ).order_by(MediaBlob.segment_offset).with_for_update(),
+            )
+            blobs = result.all()
+
+            moved: List[Tuple[str, int, int]] = []
+            if blobs:
+                async with self._lock:
+                    target_id, offset = await self._active_segment(
+                        sum(blob.size for blob in blobs),
+                    )
+                    target = self.segment_path(target_id)
+                    await asyncio.to_thread(
+                        self._copy_blobs,
+                        source,
+                        target,
+                        offset,
+                        blobs,
+                    )
+                    for blob in blobs:
+                        moved.append((blob.sha256, target_id, offset))
+                        offset += blob.size
+                    self._segment_size = offset
+
+                relocated = values(
+                    column("sha256", String),
+                    column("segment_id", Integer),
+                    column("segment_offset", BigInteger),
+                    name="relocated",
+                ).data(moved)
+                await session.execute(
+                    update(MediaBlob).where(
+                        MediaBlob.sha256 == relocated.c.sha256,
+                    ).values(
+                        segment_id=relocated.c.segment_id,
+                        segment_offset=relocated.c.segment_offset,
+                    ).execution_options(synchronize_session=False),
+                )
+            await session.execute(
+                update(MediaSegment).where(
+                    MediaSegment.id == segment_id,
+                ).values(
+                    retired_at=func.now(),
+                ).execution_options(synchronize_session=False),
+            )
+            await session.commit()
+
+        size = source.stat().st_size if source.exists() else 0
+        reclaimed = max(size - sum(blob.size for blob in blobs), 0)
+        MEDIA_RECLAIMED_FILES.labels("compact").inc()
+        MEDIA_RECLAIMED_BYTES.labels("compact").inc(reclaimed)
+        logger.info(
+            "Сегмент {segment_id} сжат: перенесено {count} блобов, "
+            "освобождено {size} байт.".format(
+                segment_id=segment_id,
+                count=len(blobs),
+                size=reclaimed,
+            ),
+        )
+        return reclaimed
+
+    async def seal_abandoned(self) -> int:
+        """
+        Закрывает сегменты, владение которыми не продлевали дольше
+        media_segment_lease_seconds.
+
+        :return: количество закрытых сегментов
+        """
+        async with async_session() as session:
+            result = await session.execute(
+                update(MediaSegment).where(
+                    MediaSegment.sealed.is_(False),
+                    MediaSegment.heartbeat_at < func.now() - timedelta(
+                        seconds=settings.media_segment_lease_seconds,
+                    ),
+                ).values(
+                    sealed=True,
+                ).returning(
+                    MediaSegment.id,
+                ).execution_options(synchronize_session=False),
+            )
+            sealed = result.scalars().all()
+            await session.commit()
+
+        if sealed:
+            logger.info(
+                "Закрыты брошенные сегменты: {segments}.".format(segments=sealed),
+            )
+        return len(sealed)
+
+    async def purge_retired(self) -> int:
+        """
+        Удаляет файлы и строки сегментов, переписанных compact_segment не
+        меньше половины media_gc_interval_seconds назад.
+
+        Строки удаляются после файлов, поэтому файл остановленного на
+        середине удаления процесса удалит следующая очистка.
+
+        :return: количество удаленных сегментов
+        """
+        async with async_session() as session:
+            result = await session.execute(
+                select(MediaSegment.id).where(
+                    MediaSegment.retired_at <= func.now() - timedelta(
+                        seconds=settings.media_gc_interval_seconds / 2,
+                    ),
+                ),
+            )
+            retired = result.scalars().all()
+        if not retired:
+            return 0
+
+        loop = asyncio.get_running_loop()
+        await asyncio.gather(*[
+            loop.run_in_executor(
+                unlink_executor,
+                unlink_file,
+                self.segment_path(segment_id),
+            )
+            for segment_id in retired
+        ])
+        async with async_session() as session:
+            await session.execute(
+                delete(MediaSegment).where(MediaSegment.id.in_(retired)),
+            )
+            await session.commit()
+        return len(retired)
+
+    @staticmethod
+    def _copy_blobs(
+            source: Path,
+            target: Path,
+            offset: int,
+            blobs: Sequence[Any],
+    ) -> None:
+        with open(target, mode="r+b") as output:
+            output.seek(offset)
+            output.truncate()
+            for blob in blobs:
+                copy_range(source, blob.segment_offset, blob.size, output.fileno())
+            output.flush()
+            os.fsync(output.fileno())
+
+
+flat_storage = FlatFileStorage()
+segment_storage = SegmentStorage()
+
+
+def storage_for(stored: StoredFile) -> MediaStorage:
+    """Хранилище, в котором лежит блоб."""
+    return flat_storage if stored.segment_id is None else segment_storage
+
+
+def storage_for_upload(size: int) -> MediaStorage:
+    """
+    Хранилище для нового блоба.
+
+    В режиме media_storage=segment в сегменты пишутся блобы не больше
+    media_segment_max_blob_size, остальные остаются отдельными файлами.
+
+    :param size: размер файла в байтах
+    :return: хранилище
+    """
+    small = size <= settings.media_segment_max_blob_size
+    if settings.media_storage == "segment" and small:
+        return segment_storage
+    return flat_storage
+
+
+async def remove_stored(stored: Sequence[StoredFile], reason: str) -> int:
+    """
+    Освобождает место освобожденных блобов в их хранилищах.
+
+    :param stored: освобожденные блобы и медиа без блоба
+    :param reason: причина удаления для метрик
+    :return: освобожденные байты
+    """
+    flat = [item for item in stored if item.segment_id is None]
+    segments = [item for item in stored if item.segment_id is not None]
+    return (
+        await flat_storage.remove(flat, reason)
+        + await segment_storage.remove(segments, reason)
+    )
@@ -0,0 +1,240 @@
+import asyncio
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from datetime import timedelta
+from typing import Any, Dict, Optional
+
+from sqlalchemy import case, func, select, update
+from sqlalchemy.engine import Row
+
+from app.config import settings
+from app.crud.media_storage import StoredFile, storage_for
+from app.db.database import async_session
+from app.db.models import MediaBlob, MediaJob
+from app.utils.logger import get_logger
+from app.utils.media_info import inspect_media
+from app.utils.metrics import MEDIA_JOBS
+
+logger = get_logger("crud.media_worker")
+
+PENDING = "pending"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+LEASE_EXPIRED = "Процесс остановился во время обработки."
+
+
+class MediaWorker:
+    """
+    Фоновая обработка загруженных файлов (таблица media_job).
+
+    Задачи ставит MediaService при создании нового блоба. Фоновая задача
+    забирает до media_workers готовых задач (FOR UPDATE SKIP LOCKED,
+    поэтому процессы приложения не берут одну задачу дважды) и выполняет
+    inspect_media в ProcessPoolExecutor, не занимая цикл событий.
+    Результат записывается в MediaBlob.meta. Задача, которая упала,
+    повторяется с экспоненциальной задержкой до media_job_max_attempts
+    попыток; задача процесса, который остановился во время обработки,
+    снова становится доступной через media_job_lease_seconds.
+    """
+
+    def __init__(self, workers: int, poll_interval: float) -> None:
+        self.workers = max(workers, 1)
+        self.poll_interval = poll_interval
+        self._wakeup = asyncio.Event()
+        self._pool: Optional[ProcessPoolExecutor] = None
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self) -> None:
+        """Запускает фоновую обработку задач."""
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        """Останавливает фоновую обработку и пул процессов."""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                logger.debug("Фоновая обработка медиа остановлена.")
+            self._task = None
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
+
+    def notify(self) -> None:
+        """Сообщает о новых задачах, чтобы не ждать poll_interval."""
+        self._wakeup.set()
+
+    def executor(self) -> ProcessPoolExecutor:
+        # Процессы запускаются через spawn: fork копировал бы процесс
+        # приложения вместе с потоками логирования и соединениями.
+        if self._pool is None:
+            self._pool = ProcessPoolExecutor(
+                max_workers=self.workers,
+                mp_context=multiprocessing.get_context("spawn"),
+            )
+        return self._pool
+
+    async def run_once(self) -> int:
+        """
+        Забирает и обрабатывает одну пачку задач.
+
+        Задача, которая уже израсходовала media_job_max_attempts попыток
+        (процесс останавливался во время каждой из них), не запускается,
+        а отмечается failed тем же запросом.
+
+        :return: количество обработанных задач
+        """
+        exhausted = MediaJob.attempts >= settings.media_job_max_attempts
+        async with async_session() as session:
+            result = await session.execute(
+                update(MediaJob).where(
+                    MediaJob.id.in_(
+                        select(MediaJob.id).where(
+                            MediaJob.status.in_((PENDING, RUNNING)),
+                            MediaJob.run_after <= func.now(),
+                        ).order_by(
+                            MediaJob.run_after,
+                        ).limit(
+                            self.workers,
+                        ).with_for_update(skip_locked=True),
+                    ),
+                    MediaBlob.sha256 == MediaJob.sha256,
+                ).values(
+                    status=case((exhausted, FAILED), else_=RUNNING),
+                    attempts=case(
+                        (exhausted, MediaJob.attempts),
+                        else_=MediaJob.attempts + 1,
+                    ),
+                    run_after=func.now() + timedelta(
+                        seconds=settings.media_job_lease_seconds,
+                    ),
+                    last_error=case(
+                        (exhausted, LEASE_EXPIRED),
+                        else_=MediaJob.last_error,
+                    ),
+                    updated_at=func.now(),
+                ).returning(
+                    MediaJob.id,
+                    MediaJob.sha256,
+                    MediaJob.status,
+                    MediaJob.attempts,
+                    MediaBlob.path_file,
+                    MediaBlob.size,
+                    MediaBlob.segment_id,
+                    MediaBlob.segment_offset,
+                ).execution_options(synchronize_session=False),
+            )
+            jobs = result.all()
+            await session.commit()
+
+        failed = [job for job in jobs if job.status == FAILED]
+        if failed:
+            MEDIA_JOBS.labels(FAILED).inc(len(failed))
+            logger.warning(
+                "Задачи медиа {jobs} не завершились за {attempts} попыток.".format(
+                    jobs=[job.id for job in failed],
+                    attempts=settings.media_job_max_attempts,
+                ),
+            )
+        running = [job for job in jobs if job.status == RUNNING]
+        await asyncio.gather(*[self.process(job) for job in running])
+        return len(running)
+
+    async def process(self, job: Row) -> None:
+        """
+        Обрабатывает файл задачи в пуле процессов и записывает результат.
+
+        :param job: задача (id, sha256, attempts и размещение блоба)
+        """
+        stored = StoredFile(
+            job.path_file,
+            job.size,
+            job.segment_id,
+            job.segment_offset,
+        )
+        loop = asyncio.get_running_loop()
+        try:
+            location = storage_for(stored).locate(stored)
+            meta = await loop.run_in_executor(
+                self.executor(),
+                inspect_media,
+                str(location.path),
+                location.offset,
+                location.length,
+                job.sha256,
+            )
+        except BrokenProcessPool as ex:
+            self._pool = None
+            await self.fail(job, ex)
+        except Exception as ex:
+            await self.fail(job, ex)
+        else:
+            await self.complete(job, meta)
+
+    @staticmethod
+    async def complete(job: Row, meta: Dict[str, Any]) -> None:
+        async with async_session() as session:
+            await session.execute(
+                update(MediaBlob).where(
+                    MediaBlob.sha256 == job.sha256,
+                ).values(meta=meta).execution_options(synchronize_session=False),
+            )
+            await session.execute(
+                update(MediaJob).where(MediaJob.id == job.id).values(
+                    status=DONE,
+                    last_error=None,
+                    updated_at=func.now(),
+                ).execution_options(synchronize_session=False),
+            )
+            await session.commit()
+        MEDIA_JOBS.labels(DONE).inc()
+
+    @staticmethod
+    async def fail(job: Row, ex: BaseException) -> None:
+        failed = job.attempts >= settings.media_job_max_attempts
+        logger.warning(
+            "Ошибка обработки медиа {sha256} (попытка {attempts}): {error!r}".format(
+                sha256=job.sha256,
+                attempts=job.attempts,
+                error=ex,
+            ),
+        )
+        delay = timedelta(
+            seconds=settings.media_job_retry_seconds * 2 ** (job.attempts - 1),
+        )
+        async with async_session() as session:
+            await session.execute(
+                update(MediaJob).where(MediaJob.id == job.id).values(
+                    status=FAILED if failed else PENDING,
+                    run_after=func.now() + delay,
+                    last_error=repr(ex)[:1000],
+                    updated_at=func.now(),
+                ).execution_options(synchronize_session=False),
+            )
+            await session.commit()
+        MEDIA_JOBS.labels(FAILED if failed else "retry").inc()
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                processed = await self.run_once()
+            except Exception:
+                logger.exception("Ошибка выборки задач обработки медиа.")
+                processed = 0
+            if processed == self.workers:
+                continue
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), self.poll_interval)
+            except asyncio.TimeoutError:
+                logger.debug("Плановая проверка задач обработки медиа.")
+            self._wakeup.clear()
+
+
+media_worker = MediaWorker(
+    settings.media_workers,
+    settings.media_worker_poll_ms / 1000,
+)
@@ -0,0 +1,354 @@
+import heapq
+from collections import defaultdict
+from datetime import datetime
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple
+
+from sqlalchemy import (
+    DateTime,
+    Integer,
+    column,
+    delete,
+    desc,
+    literal,
+    select,
+    true,
+    tuple_,
+    values,
+)
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.config import settings
+from app.db.database import async_session
+from app.db.models import Follows, HomeTimeline, Tweet, User
+from app.utils.cache import cache
+from app.utils.logger import get_logger
+
+logger = get_logger("crud.timeline")
+
+TimelineKey = Tuple[Any, int]
+
+
+def is_high_fanout(followers_count: int) -> bool:
+    """
+    Проверяет, что твиты автора не рассылаются, а подмешиваются при чтении.
+
+    :param followers_count: количество подписчиков автора
+    :return: True, если подписчиков больше fanout_follower_threshold
+    """
+    return followers_count > settings.fanout_follower_threshold
+
+
+def timeline_version_key(user_id: int) -> str:
+    return "timeline_version:{user_id}".format(user_id=user_id)
+
+
+async def invalidate_timelines(user_ids: Iterable[int]) -> None:
+    """
+    Сбрасывает закэшированные страницы домашних лент пользователей.
+
+    Страницы кэшируются под текущей версией ленты, поэтому достаточно
+    удалить версию: следующее чтение создаст новую.
+
+    :param user_ids: ID пользователей
+    """
+    await cache.delete(*[timeline_version_key(user_id) for user_id in user_ids])
+
+
+def merge_timelines(
+        streams: Iterable[Iterable[TimelineKey]],
+        limit: int,
+) -> List[TimelineKey]:
+    """
+    K-way слияние лент, отсортированных по убыванию (created_at, tweet_id).
+
+    Слияние идет через кучу (heapq.merge), поэтому стоимость зависит от
+    размера страницы и количества лент, а не от их длины. Дубликаты
+    твитов (например, попавшие во входящую ленту до превышения порога)
+    пропускаются.
+
+    :param streams: ленты ключей (created_at, tweet_id) по убыванию
+    :param limit: максимальное количество ключей в результате
+    :return: объединенная лента ключей по убыванию
+    """
+    merged: List[TimelineKey] = []
+    seen: Set[int] = set()
+
+    for key in heapq.merge(*streams, reverse=True):
+        if key[1] in seen:
+            continue
+        seen.add(key[1])
+        merged.append(key)
+        if len(merged) == limit:
+            break
+
+    return merged
+
+
+class TimelineService:
+    """Сервис материализованных домашних лент (fan-out-on-write)."""
+
+    def __init__(self, session: AsyncSession):
+        self.session = session
+
+    async def get_page_keys(
+            self,
+            user_id: int,
+            limit: int,
+            cursor_key: Optional[TimelineKey] = None,
+    ) -> List[TimelineKey]:
+        """
+        Метод возвращает ключи страницы домашней ленты пользователя.
+
+        Ключи из входящей ленты (home_timeline) сливаются с последними
+        твитами авторов с большим числом подписчиков, которые не
+        рассылаются при записи. Твиты таких авторов читаются одним запросом
+        по индексу ix_tweet_user_created_at через LATERAL.
+
+        :param user_id: ID пользователя, чья лента запрашивается
+        :param limit: количество ключей на странице
+        :param cursor_key: позиция (created_at, tweet_id) после которой читать
+        :return: ключи (created_at, tweet_id) по убыванию
+        """
+        inbox_query = select(
+            HomeTimeline.created_at,
+            HomeTimeline.tweet_id,
+        ).where(
+            HomeTimeline.user_id == user_id,
+        ).order_by(
+            desc(HomeTimeline.created_at),
+            desc(HomeTimeline.tweet_id),
+        ).limit(limit)
+
+        pulled_authors = select(User.id.label("author_id")).join(
+            Follows,
+            Follows.follows_user_id == User.id,
+        ).where(
+            Follows.user_id == user_id,
+            User.followers_count > settings.fanout_follower_threshold,
+        ).distinct().subquery()
+
+        recent_query = select(
+            Tweet.created_at,
+            Tweet.id,
+            Tweet.user_id,
+        ).where(
+            Tweet.user_id == pulled_authors.c.author_id,
+        ).order_by(
+            desc(Tweet.created_at),
+            desc(Tweet.id),
+        ).limit(limit)
+
+        if cursor_key is not None:
+            inbox_query = inbox_query.where(
+                tuple_(HomeTimeline.created_at, HomeTimeline.tweet_id)
+                < tuple_(*cursor_key),
+            )
+            recent_query = recent_query.where(
+                tuple_(Tweet.created_at, Tweet.id) < tuple_(*cursor_key),
+            )
+
+        recent_tweets = recent_query.lateral()
+        inbox_result = await self.session.execute(inbox_query)
+        pulled_result = await self.session.execute(
+            select(
+                recent_tweets.c.created_at,
+                recent_tweets.c.id,
+                recent_tweets.c.user_id,
+            ).select_from(pulled_authors.join(recent_tweets, true())),
+        )
+
+        streams: Dict[int, List[TimelineKey]] = defaultdict(list)
+        for created_at, tweet_id, author_id in pulled_result.all():
+            streams[author_id].append((created_at, tweet_id))
+        for stream in streams.values():
+            stream.sort(reverse=True)
+
+        return merge_timelines(
+            [
+                [(created_at, tweet_id) for created_at, tweet_id in inbox_result.all()],
+                *streams.values(),
+            ],
+            limit,
+        )
+
+    async def push_to_author(
+            self,
+            author_id: int,
+            keys: List[TimelineKey],
+    ) -> None:
+        """
+        Метод добавляет твиты в ленту самого автора одним запросом.
+
+        Выполняется синхронно с созданием твитов, чтобы автор сразу видел
+        свои твиты. Коммит остается за вызывающим кодом.
+
+        :param author_id: ID автора твитов
+        :param keys: ключи (created_at, tweet_id) новых твитов
+        """
+        await self.session.execute(
+            insert(HomeTimeline).values([
+                {
+                    "user_id": author_id,
+                    "tweet_id": tweet_id,
+                    "author_id": author_id,
+                    "created_at": created_at,
+                }
+                for created_at, tweet_id in keys
+            ]).on_conflict_do_nothing(),
+        )
+
+    async def fan_out(
+            self,
+            author_id: int,
+            keys: List[TimelineKey],
+    ) -> int:
+        """
+        Метод рассылает твиты в ленты подписчиков автора пачками.
+
+        Подписчики читаются по возрастанию ID пачками по fanout_batch_size,
+        каждая пачка вставляется одним запросом (подписчики x твиты) и
+        коммитится отдельно. Твиты авторов с числом подписчиков выше
+        fanout_follower_threshold не рассылаются и подмешиваются при
+        чтении (см. get_page_keys).
+
+        :param author_id: ID автора твитов
+        :param keys: ключи (created_at, tweet_id) твитов
+        :return: количество обработанных подписчиков
+        """
+        tweet_ids = [tweet_id for _, tweet_id in keys]
+        followers_count = await self.session.scalar(
+            select(User.followers_count).where(User.id == author_id),
+        )
+        if is_high_fanout(followers_count or 0):
+            logger.debug(
+                "Твиты {tweet_ids} не рассылаются: "
+                "у автора {count} подписчиков.".format(
+                    tweet_ids=tweet_ids,
+                    count=followers_count,
+                ),
+            )
+            return 0
+
+        tweets = values(
+            column("created_at", DateTime(timezone=True)),
+            column("tweet_id", Integer),
+            name="tweets",
+        ).data(keys)
+        last_follower_id = 0
+        delivered = 0
+
+        while True:
+            result = await self.session.execute(
+                select(Follows.user_id).where(
+                    Follows.follows_user_id == author_id,
+                    Follows.user_id > last_follower_id,
+                ).distinct().order_by(Follows.user_id).limit(
+                    settings.fanout_batch_size,
+                ),
+            )
+            follower_ids: List[int] = result.scalars().all()
+            if not follower_ids:
+                break
+
+            followers = values(
+                column("user_id", Integer),
+                name="followers",
+            ).data([(follower_id,) for follower_id in follower_ids])
+            await self.session.execute(
+                insert(HomeTimeline).from_select(
+                    ["user_id", "tweet_id", "author_id", "created_at"],
+                    select(
+                        followers.c.user_id,
+                        tweets.c.tweet_id,
+                        literal(author_id),
+                        tweets.c.created_at,
+                    ).select_from(followers.join(tweets, true())),
+                ).on_conflict_do_nothing(),
+            )
+            await self.session.commit()
+            await invalidate_timelines(follower_ids)
+
+            delivered += len(follower_ids)
+            last_follower_id = follower_ids[-1]
+
+        logger.debug(
+            "Твиты {tweet_ids} разосланы {count} подписчикам.".format(
+                tweet_ids=tweet_ids,
+                count=delivered,
+            ),
+        )
+        return delivered
+
+    async def remove_tweet(self, tweet_id: int) -> List[int]:
+        """
+        Метод удаляет твит из всех домашних лент.
+
+        Коммит остается за вызывающим кодом.
+
+        :param tweet_id: ID твита
+        :return: ID пользователей, из чьих лент удален твит
+        """
+        result = await self.session.execute(
+            delete(HomeTimeline).where(
+                HomeTimeline.tweet_id == tweet_id,
+            ).returning(HomeTimeline.user_id),
+        )
+        return result.scalars().all()
+
+    async def add_followee(self, user_id: int, followee_id: int) -> None:
+        """
+        Метод дополняет ленту пользователя последними твитами нового автора.
+
+        Коммит остается за вызывающим кодом.
+
+        :param user_id: ID подписавшегося пользователя
+        :param followee_id: ID автора, на которого подписались
+        """
+        recent_tweets = select(
+            literal(user_id),
+            Tweet.id,
+            Tweet.user_id,
+            Tweet.created_at,
+        ).where(
+            Tweet.user_id == followee_id,
+        ).order_by(
+            desc(Tweet.created_at),
+        ).limit(settings.timeline_backfill_size)
+
+        await self.session.execute(
+            insert(HomeTimeline).from_select(
+                ["user_id", "tweet_id", "author_id", "created_at"],
+                recent_tweets,
+            ).on_conflict_do_nothing(),
+        )
+
+    async def remove_followee(self, user_id: int, followee_id: int) -> None:
+        """
+        Метод удаляет твиты автора из ленты отписавшегося пользователя.
+
+        Коммит остается за вызывающим кодом.
+
+        :param user_id: ID отписавшегося пользователя
+        :param followee_id: ID автора, от которого отписались
+        """
+        await self.session.execute(
+            delete(HomeTimeline).where(
+                HomeTimeline.user_id == user_id,
+                HomeTimeline.author_id == followee_id,
+            ),
+        )
+
+
+async def fan_out_tweets(
+        author_id: int,
+        keys: List[TimelineKey],
+) -> None:
+    """
+    Фоновая задача рассылки твитов подписчикам в отдельной сессии.
+
+    :param author_id: ID автора твитов
+    :param keys: ключи (created_at, tweet_id) новых твитов
+    """
+    async with async_session() as session:
+        await TimelineService(session).fan_out(author_id, keys)
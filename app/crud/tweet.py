@@ -1,18 +1,187 @@
-from typing import Any, Dict, List, Optional, Union
+import json
+import uuid
+from collections import defaultdict
+from typing import Any, AsyncIterator, Dict, List, Optional, Set, Tuple, Union
 
-from fastapi import Depends
-from sqlalchemy import delete, desc, select
+from fastapi import BackgroundTasks, Depends
+from sqlalchemy import (
+    Integer,
+    column,
+    delete,
+    desc,
+    select,
+    text,
+    true,
+    tuple_,
+    update,
+    values,
+)
+from sqlalchemy.dialects.postgresql import insert
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import selectinload
+from sqlalchemy.sql.elements import TextClause
 
 from app.config import settings
-from app.db.database import get_db
-from app.db.models import Media, Tweet, TweetLikes
+from app.crud.like_buffer import like_buffer
+from app.crud.media import MediaService
+from app.crud.media_storage import remove_stored
+from app.crud.timeline import (
+    TimelineService,
+    fan_out_tweets,
+    invalidate_timelines,
+    timeline_version_key,
+)
+from app.db.database import async_session, get_db
+from app.db.models import Media, Tweet, TweetLikes, User
 from app.schema.schemas import Success, TweetIn, TweetsOut, TweetSuccess
+from app.utils.cache import cache, tweet_cache_key
 from app.utils.logger import get_logger
+from app.utils.pagination import (
+    decode_cursor,
+    decode_id_cursor,
+    encode_cursor,
+    encode_id_cursor,
+)
 
 logger = get_logger("crud.post")
 
+TWEET_JSON_SQL = """
+    json_build_object(
+        'id', tweet.id,
+        'content', tweet.content,
+        'attachments', coalesce(attachments.urls, '[]'::json),
+        'author', json_build_object('id', author.id, 'name', author.username),
+        'likes', CASE WHEN viewer_like.liked
+            THEN jsonb_build_array(jsonb_build_object(
+                'user_id', CAST(:user_id AS integer),
+                'name', CAST(:username AS text)))
+            ELSE '[]'::jsonb
+        END || coalesce(sample.likes, '[]'::jsonb),
+        'like_count', tweet.like_count,
+        'liked_by_me', viewer_like.liked
+    )
+"""
+
+TWEET_JSON_JOINS = """
+    JOIN tweet ON tweet.id = page.tweet_id
+    JOIN "user" AS author ON author.id = tweet.user_id
+    LEFT JOIN LATERAL (
+        SELECT json_agg('/api/medias/' || media.id ORDER BY media.id) AS urls
+        FROM media
+        WHERE media.tweet_id = tweet.id
+    ) AS attachments ON true
+    LEFT JOIN LATERAL (
+        SELECT jsonb_agg(
+            jsonb_build_object('user_id', recent.user_id, 'name', recent.username)
+            ORDER BY recent.like_id DESC
+        ) FILTER (WHERE recent.user_id <> :user_id) AS likes
+        FROM (
+            SELECT tweet_likes.id AS like_id, tweet_likes.user_id, liker.username
+            FROM tweet_likes
+            JOIN "user" AS liker ON liker.id = tweet_likes.user_id
+            WHERE tweet_likes.tweet_id = tweet.id
+            ORDER BY tweet_likes.id DESC
+            LIMIT :sample_size
+        ) AS recent
+    ) AS sample ON true
+    CROSS JOIN LATERAL (
+        SELECT EXISTS (
+            SELECT 1 FROM tweet_likes
+            WHERE tweet_likes.tweet_id = tweet.id
+                AND tweet_likes.user_id = :user_id
+        ) AS liked
+    ) AS viewer_like
+"""
+
+FEED_JSON_QUERY = text(
+    """
+    SELECT json_build_object(
+        'result', true,
+        'tweets', coalesce(json_agg({tweet_json} ORDER BY page.position), '[]'::json),
+        'next_cursor', CAST(:next_cursor AS text)
+    )::text
+    FROM unnest(CAST(:tweet_ids AS integer[])) WITH ORDINALITY
+        AS page(tweet_id, position)
+    {joins}
+    """.format(tweet_json=TWEET_JSON_SQL, joins=TWEET_JSON_JOINS),
+)
+
+# Каждая ветка ограничена :limit строками по своему индексу, поэтому
+# дубликаты убираются среди не более чем (1 + число популярных
+# авторов) * limit строк, а не по всему inbox.
+HOME_KEYS_SQL = """
+    SELECT DISTINCT candidates.created_at, candidates.tweet_id
+    FROM (
+        (
+            SELECT home_timeline.created_at, home_timeline.tweet_id
+            FROM home_timeline
+            WHERE home_timeline.user_id = :user_id {inbox_cursor}
+            ORDER BY home_timeline.created_at DESC, home_timeline.tweet_id DESC
+            LIMIT :limit
+        )
+        UNION ALL
+        SELECT tweet.created_at, tweet.id
+        FROM followings
+        JOIN "user" AS followee ON followee.id = followings.follows_user_id
+        CROSS JOIN LATERAL (
+            SELECT tweet.created_at, tweet.id
+            FROM tweet
+            WHERE tweet.user_id = followee.id {tweet_cursor}
+            ORDER BY tweet.created_at DESC, tweet.id DESC
+            LIMIT :limit
+        ) AS tweet
+        WHERE followings.user_id = :user_id
+            AND followee.followers_count > :threshold
+    ) AS candidates(created_at, tweet_id)
+"""
+
+ALL_KEYS_SQL = """
+    SELECT tweet.created_at, tweet.id AS tweet_id
+    FROM tweet
+    WHERE true {tweet_cursor}
+"""
+
+FEED_STREAM_SQL = """
+    SELECT {tweet_json}::text AS tweet, page.created_at, page.tweet_id
+    FROM (
+        SELECT keys.created_at, keys.tweet_id
+        FROM ({keys}) AS keys(created_at, tweet_id)
+        ORDER BY keys.created_at DESC, keys.tweet_id DESC
+        LIMIT :limit
+    ) AS page
+    {joins}
+    ORDER BY page.created_at DESC, page.tweet_id DESC
+"""
+
+
+def feed_stream_query(home: bool, with_cursor: bool) -> TextClause:
+    """
+    Строит запрос построчной выдачи твитов ленты в виде JSON.
+
+    :param home: True - домашняя лента пользователя, False - все твиты
+    :param with_cursor: добавить условие продолжения после курсора
+    :return: текстовый запрос с параметрами user_id, username, limit,
+        sample_size (threshold для домашней ленты, cursor_at и cursor_id
+        при наличии курсора)
+    """
+    cursor_sql = "AND ({table}.created_at, {table}.{column}) < (:cursor_at, :cursor_id)"
+    keys = (HOME_KEYS_SQL if home else ALL_KEYS_SQL).format(
+        inbox_cursor=cursor_sql.format(
+            table="home_timeline",
+            column="tweet_id",
+        ) if with_cursor else "",
+        tweet_cursor=cursor_sql.format(
+            table="tweet",
+            column="id",
+        ) if with_cursor else "",
+    )
+
+    return text(FEED_STREAM_SQL.format(
+        tweet_json=TWEET_JSON_SQL,
+        keys=keys,
+        joins=TWEET_JSON_JOINS,
+    ))
+
 
 class TweetService:
     """Сервис обработки Endpoint связанных с пользователями"""
@@ -27,13 +196,461 @@ class TweetService:
         """
         result = await self.session.execute(
             select(Tweet).order_by(desc(Tweet.created_at)).options(
-                selectinload(Tweet.likes),
                 selectinload(Tweet.tweet_image),
                 selectinload(Tweet.user)))
         tweets = result.all()
 
         return tweets
 
+    async def get_tweets_page(
+            self,
+            limit: int,
+            cursor: Optional[str] = None,
+    ) -> Tuple[List[Tweet], Optional[str]]:
+        """
+        Метод для получения страницы твитов по курсору (keyset-пагинация).
+
+        Страница читается по индексу ix_tweet_created_at_id начиная с позиции
+        курсора, поэтому время ответа не зависит от размера таблицы.
+
+        :param limit: количество твитов на странице
+        :param cursor: курсор, полученный с предыдущей страницей
+        :return: кортеж (список твитов, курсор следующей страницы)
+        """
+        query = select(Tweet).order_by(
+            desc(Tweet.created_at),
+            desc(Tweet.id),
+        ).limit(limit + 1).options(
+            selectinload(Tweet.tweet_image),
+            selectinload(Tweet.user))
+
+        if cursor is not None:
+            created_at, tweet_id = decode_cursor(cursor)
+            query = query.where(
+                tuple_(Tweet.created_at, Tweet.id) < tuple_(created_at, tweet_id),
+            )
+
+        result = await self.session.execute(query)
+        tweets: List[Tweet] = result.scalars().all()
+
+        next_cursor = None
+        if len(tweets) > limit:
+            tweets = tweets[:limit]
+            next_cursor = encode_cursor(tweets[-1].created_at, tweets[-1].id)
+
+        return tweets, next_cursor
+
+    async def get_home_timeline_ids(
+            self,
+            user_id: int,
+            limit: int,
+            cursor: Optional[str] = None,
+    ) -> Tuple[List[int], Optional[str]]:
+        """
+        Метод для получения ID твитов страницы домашней ленты пользователя.
+
+        Ключи страницы читаются по индексу ix_home_timeline_user_created_at
+        и сливаются с твитами популярных авторов (см. TimelineService).
+
+        :param user_id: ID пользователя, чья лента запрашивается
+        :param limit: количество твитов на странице
+        :param cursor: курсор, полученный с предыдущей страницей
+        :return: кортеж (список ID твитов, курсор следующей страницы)
+        """
+        cursor_key = decode_cursor(cursor) if cursor is not None else None
+        keys = await TimelineService(self.session).get_page_keys(
+            user_id,
+            limit + 1,
+            cursor_key,
+        )
+
+        next_cursor = None
+        if len(keys) > limit:
+            keys = keys[:limit]
+            next_cursor = encode_cursor(*keys[-1])
+
+        return [tweet_id for _, tweet_id in keys], next_cursor
+
+    async def get_home_timeline_raw(
+            self,
+            user_id: int,
+            username: str,
+            limit: int,
+            cursor: Optional[str] = None,
+    ) -> bytes:
+        """
+        Метод для получения готового JSON ответа домашней ленты из базы.
+
+        Ответ согласно схеме TweetsOut собирается в Postgres через
+        json_build_object/json_agg (FEED_JSON_QUERY), без создания ORM
+        объектов и валидации pydantic. Если по твитам страницы есть
+        незаписанные лайки из буфера, ответ собирается обычным путем.
+
+        :param user_id: ID текущего пользователя
+        :param username: имя текущего пользователя
+        :param limit: количество твитов на странице
+        :param cursor: курсор, полученный с предыдущей страницей
+        :return: тело ответа в кодировке utf-8
+        """
+        tweet_ids, next_cursor = await self.get_home_timeline_ids(
+            user_id,
+            limit,
+            cursor,
+        )
+
+        if like_buffer.pending_for(tweet_ids):
+            tweets = await self.mark_liked_by_me(
+                await self.get_tweets_json(tweet_ids),
+                user_id,
+                username,
+            )
+            return TweetsOut(
+                result=True,
+                tweets=tweets,
+                next_cursor=next_cursor,
+            ).json().encode("utf-8")
+
+        result = await self.session.execute(
+            FEED_JSON_QUERY,
+            {
+                "tweet_ids": tweet_ids,
+                "user_id": user_id,
+                "username": username,
+                "next_cursor": next_cursor,
+                "sample_size": settings.likes_sample_size,
+            },
+        )
+        return result.scalar_one().encode("utf-8")
+
+    async def stream_feed(
+            self,
+            user_id: int,
+            username: str,
+            limit: int,
+            cursor: Optional[str] = None,
+    ) -> AsyncIterator[bytes]:
+        """
+        Метод для потоковой выдачи ленты (больших страниц и выгрузок).
+
+        Твиты читаются серверным курсором пачками по tweets_stream_chunk_size
+        строк, JSON каждого твита собирается в базе, поэтому память не
+        зависит от количества запрошенных твитов. Курсор проверяется и
+        незаписанные лайки сбрасываются из буфера до начала ответа.
+
+        :param user_id: ID текущего пользователя
+        :param username: имя текущего пользователя
+        :param limit: количество твитов
+        :param cursor: курсор, полученный с предыдущей страницей
+        :return: асинхронный итератор частей тела ответа согласно TweetsOut
+        """
+        params = {
+            "user_id": user_id,
+            "username": username,
+            "limit": limit + 1,
+            "sample_size": settings.likes_sample_size,
+        }
+        if settings.home_timeline_enabled:
+            params["threshold"] = settings.fanout_follower_threshold
+        if cursor is not None:
+            params["cursor_at"], params["cursor_id"] = decode_cursor(cursor)
+
+        if len(like_buffer):
+            await like_buffer.flush()
+
+        return self._stream_rows(
+            feed_stream_query(settings.home_timeline_enabled, cursor is not None),
+            params,
+            limit,
+        )
+
+    @staticmethod
+    async def _stream_rows(
+            query: TextClause,
+            params: Dict[str, Any],
+            limit: int,
+    ) -> AsyncIterator[bytes]:
+        chunk_size = settings.tweets_stream_chunk_size
+        count = 0
+        last_key = None
+        has_more = False
+
+        yield b'{"result": true, "tweets": ['
+        async with async_session() as session:
+            result = await session.stream(
+                query.execution_options(max_row_buffer=chunk_size),
+                params,
+            )
+            async for rows in result.partitions(chunk_size):
+                if count + len(rows) > limit:
+                    rows = rows[:limit - count]
+                    has_more = True
+                if rows:
+                    yield (b"," if count else b"") + ",".join(
+                        row.tweet for row in rows
+                    ).encode("utf-8")
+                    count += len(rows)
+                    last_key = (rows[-1].created_at, rows[-1].tweet_id)
+                if has_more:
+                    break
+            await result.close()
+
+        next_cursor = encode_cursor(*last_key) if has_more else None
+        yield '], "next_cursor": {cursor}}}'.format(
+            cursor=json.dumps(next_cursor),
+        ).encode("utf-8")
+
+    async def get_home_timeline_json(
+            self,
+            user_id: int,
+            limit: int,
+            cursor: Optional[str] = None,
+    ) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+        """
+        Метод для получения страницы домашней ленты в виде словарей.
+
+        Страница (список ID и курсор) кэшируется под текущей версией ленты
+        пользователя, твиты кэшируются по ID (см. get_tweets_json).
+
+        :param user_id: ID пользователя, чья лента запрашивается
+        :param limit: количество твитов на странице
+        :param cursor: курсор, полученный с предыдущей страницей
+        :return: кортеж (список твитов, курсор следующей страницы)
+        """
+        version = await cache.get(timeline_version_key(user_id))
+        if version is None:
+            version = uuid.uuid4().hex
+            await cache.set(timeline_version_key(user_id), version)
+
+        page_key = "timeline:{user_id}:{version}:{limit}:{cursor}".format(
+            user_id=user_id,
+            version=version,
+            limit=limit,
+            cursor=cursor,
+        )
+        page = await cache.get(page_key)
+        if page is None:
+            tweet_ids, next_cursor = await self.get_home_timeline_ids(
+                user_id,
+                limit,
+                cursor,
+            )
+            page = {"tweet_ids": tweet_ids, "next_cursor": next_cursor}
+            await cache.set(page_key, page)
+
+        return await self.get_tweets_json(page["tweet_ids"]), page["next_cursor"]
+
+    async def get_tweets_json(self, tweet_ids: List[int]) -> List[Dict[str, Any]]:
+        """
+        Метод возвращает твиты в виде словарей, используя кэш.
+
+        Из базы загружаются только твиты, которых нет в кэше.
+
+        :param tweet_ids: список ID твитов
+        :return: список словарей Tweet.to_json() в порядке tweet_ids
+        """
+        keys = [tweet_cache_key(tweet_id) for tweet_id in tweet_ids]
+        found = await cache.get_many(keys)
+
+        missing = [
+            tweet_id for tweet_id, key in zip(tweet_ids, keys) if key not in found
+        ]
+        loaded = await self.serialize_tweets(await self.get_tweets_by_ids(missing))
+        for tweet_json in loaded:
+            found[tweet_cache_key(tweet_json["id"])] = tweet_json
+            await cache.set(tweet_cache_key(tweet_json["id"]), tweet_json)
+
+        return [found[key] for key in keys if key in found]
+
+    async def serialize_tweets(self, tweets: List[Tweet]) -> List[Dict[str, Any]]:
+        """
+        Метод преобразует твиты в словари со сводкой лайков.
+
+        Вместо полного списка лайкнувших в ответ попадает like_count и
+        несколько последних лайкнувших (likes_sample_size).
+
+        :param tweets: список твитов
+        :return: список словарей согласно схеме TweetsResponseModel
+        """
+        samples = await self.get_like_samples([tweet.id for tweet in tweets])
+
+        return [tweet.to_json(samples.get(tweet.id)) for tweet in tweets]
+
+    async def get_like_samples(
+            self,
+            tweet_ids: List[int],
+    ) -> Dict[int, List[Dict[str, Any]]]:
+        """
+        Метод загружает последних лайкнувших для каждого твита одним запросом.
+
+        :param tweet_ids: список ID твитов
+        :return: словарь ID твита -> список лайкнувших согласно схеме LikeUser
+        """
+        if not tweet_ids:
+            return {}
+
+        page = select(Tweet.id.label("tweet_id")).where(
+            Tweet.id.in_(tweet_ids),
+        ).subquery()
+        sample = select(TweetLikes.user_id, User.username).join(
+            User,
+            User.id == TweetLikes.user_id,
+        ).where(
+            TweetLikes.tweet_id == page.c.tweet_id,
+        ).order_by(
+            desc(TweetLikes.id),
+        ).limit(settings.likes_sample_size).lateral()
+
+        result = await self.session.execute(
+            select(
+                page.c.tweet_id,
+                sample.c.user_id,
+                sample.c.username,
+            ).select_from(page.join(sample, true())),
+        )
+
+        samples: Dict[int, List[Dict[str, Any]]] = defaultdict(list)
+        for tweet_id, user_id, username in result.all():
+            samples[tweet_id].append({"user_id": user_id, "name": username})
+
+        return samples
+
+    async def mark_liked_by_me(
+            self,
+            tweets: List[Dict[str, Any]],
+            user_id: int,
+            username: str,
+    ) -> List[Dict[str, Any]]:
+        """
+        Метод отмечает твиты, которые лайкнул текущий пользователь.
+
+        Если пользователь лайкнул твит, но не попал в выборку лайкнувших,
+        он добавляется в начало списка likes. Еще не записанные лайки из
+        буфера отложенной записи учитываются в liked_by_me и like_count.
+
+        :param tweets: список словарей твитов
+        :param user_id: ID текущего пользователя
+        :param username: имя текущего пользователя
+        :return: тот же список с заполненным полем liked_by_me
+        """
+        if not tweets:
+            return tweets
+
+        tweet_ids = [tweet["id"] for tweet in tweets]
+        result = await self.session.execute(
+            select(TweetLikes.tweet_id).where(
+                TweetLikes.user_id == user_id,
+                TweetLikes.tweet_id.in_(tweet_ids),
+            ),
+        )
+        liked = set(result.scalars().all())
+        deltas = await self._pending_like_deltas(tweet_ids, user_id, liked)
+
+        for tweet in tweets:
+            tweet["like_count"] += deltas.get(tweet["id"], 0)
+            tweet["liked_by_me"] = tweet["id"] in liked
+            tweet["likes"] = [
+                like for like in tweet["likes"] if like["user_id"] != user_id
+            ]
+            if tweet["liked_by_me"]:
+                tweet["likes"].insert(0, {"user_id": user_id, "name": username})
+
+        return tweets
+
+    async def _pending_like_deltas(
+            self,
+            tweet_ids: List[int],
+            user_id: int,
+            liked: Set[int],
+    ) -> Dict[int, int]:
+        """
+        Метод применяет еще не записанные лайки из буфера.
+
+        :param tweet_ids: ID твитов страницы
+        :param user_id: ID текущего пользователя
+        :param liked: ID твитов, лайкнутых пользователем (изменяется на месте)
+        :return: словарь ID твита -> поправка к like_count
+        """
+        pending = like_buffer.pending_for(tweet_ids)
+        if not pending:
+            return {}
+
+        result = await self.session.execute(
+            select(TweetLikes.user_id, TweetLikes.tweet_id).where(
+                tuple_(TweetLikes.user_id, TweetLikes.tweet_id).in_(list(pending)),
+            ),
+        )
+        stored = {tuple(row) for row in result.all()}
+
+        deltas: Dict[int, int] = defaultdict(int)
+        for (liker_id, tweet_id), is_liked in pending.items():
+            if is_liked and (liker_id, tweet_id) not in stored:
+                deltas[tweet_id] += 1
+            elif not is_liked and (liker_id, tweet_id) in stored:
+                deltas[tweet_id] -= 1
+
+            if liker_id == user_id and is_liked:
+                liked.add(tweet_id)
+            elif liker_id == user_id:
+                liked.discard(tweet_id)
+
+        return deltas
+
+    async def get_likes(
+            self,
+            tweet_id: int,
+            limit: int,
+            cursor: Optional[str] = None,
+    ) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+        """
+        Метод для получения страницы пользователей, лайкнувших твит.
+
+        :param tweet_id: ID твита
+        :param limit: количество лайков на странице
+        :param cursor: курсор, полученный с предыдущей страницей
+        :return: кортеж (список лайкнувших, курсор следующей страницы)
+        """
+        query = select(TweetLikes.id, TweetLikes.user_id, User.username).join(
+            User,
+            User.id == TweetLikes.user_id,
+        ).where(
+            TweetLikes.tweet_id == tweet_id,
+        ).order_by(
+            desc(TweetLikes.id),
+        ).limit(limit + 1)
+
+        if cursor is not None:
+            query = query.where(TweetLikes.id < decode_id_cursor(cursor))
+
+        result = await self.session.execute(query)
+        rows = result.all()
+
+        next_cursor = None
+        if len(rows) > limit:
+            rows = rows[:limit]
+            next_cursor = encode_id_cursor(rows[-1].id)
+
+        return [
+            {"user_id": row.user_id, "name": row.username} for row in rows
+        ], next_cursor
+
+    async def get_tweets_by_ids(self, tweet_ids: List[int]) -> List[Tweet]:
+        """
+        Метод загружает твиты по списку ID, сохраняя порядок списка.
+
+        :param tweet_ids: список ID твитов
+        :return: Объект согласно схеме List[Tweet]
+        """
+        if not tweet_ids:
+            return []
+
+        result = await self.session.execute(
+            select(Tweet).where(Tweet.id.in_(tweet_ids)).options(
+                selectinload(Tweet.tweet_image),
+                selectinload(Tweet.user)))
+        tweets = {tweet.id: tweet for tweet in result.scalars().all()}
+
+        return [tweets[tweet_id] for tweet_id in tweet_ids if tweet_id in tweets]
+
     async def get_tweet(
             self,
             user_id: int,
@@ -59,56 +676,123 @@ class TweetService:
             self,
             tweet: TweetIn,
             user_id: int,
-    ) -> Dict[str, str]:
+            background_tasks: Optional[BackgroundTasks] = None,
+    ) -> Optional[Dict[str, int]]:
         """
         Метод обработки нового твита.
 
+        Твит создается тем же путем, что и пачка твитов (add_new_tweets).
+
         :param tweet: Информация полученная с фронта согласно схеме TweetIn
         :param user_id: ID пользователя отправившего твит
-        :return: Объект Optional[Tweet]
+        :param background_tasks: фоновые задачи запроса для рассылки твита
+        :return: ID твита или None, если медиа твита нельзя прикрепить
         """
-        new_tweet = Tweet(
-            content=tweet.tweet_data,
-            user_id=user_id,
+        tweet_ids = await self.add_new_tweets([tweet], user_id, background_tasks)
+        if tweet_ids is None:
+            return None
+
+        return {"tweet_id": tweet_ids[0]}
+
+    async def add_new_tweets(
+            self,
+            tweets: List[TweetIn],
+            user_id: int,
+            background_tasks: Optional[BackgroundTasks] = None,
+    ) -> Optional[List[int]]:
+        """
+        Метод создает пачку твитов пользователя в одной транзакции.
+
+        Твиты вставляются одним многострочным INSERT ... RETURNING, медиа
+        привязываются одним UPDATE по списку пар (media_id, tweet_id).
+        Привязываются только медиа без твита; если какое-то медиа не
+        найдено (в том числе удалено очисткой MediaSweeper) или уже
+        прикреплено, транзакция откатывается.
+        Твиты сразу попадают в ленту автора, а рассылка подписчикам
+        выполняется фоновой задачей, если переданы background_tasks.
+
+        :param tweets: твиты согласно схеме TweetIn
+        :param user_id: ID автора твитов
+        :param background_tasks: фоновые задачи запроса для рассылки твитов
+        :return: ID созданных твитов в порядке списка tweets или None, если
+            медиа нельзя прикрепить
+        """
+        result = await self.session.execute(
+            insert(Tweet).values([
+                {"content": tweet.tweet_data, "user_id": user_id}
+                for tweet in tweets
+            ]).returning(Tweet.id, Tweet.created_at),
+        )
+        # ID из последовательности выдаются в порядке строк VALUES.
+        keys = sorted(
+            ((row.created_at, row.id) for row in result.all()),
+            key=lambda key: key[1],
         )
 
-        self.session.add(new_tweet)
-        await self.session.flush()
+        attachments = [
+            (media_id, tweet_id)
+            for tweet, (_, tweet_id) in zip(tweets, keys)
+            for media_id in tweet.tweet_media_ids
+        ]
+        if attachments:
+            attached = values(
+                column("media_id", Integer),
+                column("tweet_id", Integer),
+                name="attached",
+            ).data(attachments)
+            result = await self.session.execute(
+                update(Media).where(
+                    Media.id == attached.c.media_id,
+                    Media.tweet_id.is_(None),
+                ).values(
+                    tweet_id=attached.c.tweet_id,
+                ).execution_options(synchronize_session=False),
+            )
+            if result.rowcount != len(attachments):
+                await self.session.rollback()
+                return None
+        await TimelineService(self.session).push_to_author(user_id, keys)
         await self.session.commit()
+        await invalidate_timelines([user_id])
 
-        for tweet_id in tweet.tweet_media_ids:
-            result = await self.session.execute(select(Media).where(Media.id == tweet_id))
-            media: Optional[Media] = result.scalars().first()
-            if media is not None:
-                media.tweet_id = new_tweet.id
-                await self.session.flush()
-                await self.session.commit()
+        if background_tasks is not None:
+            background_tasks.add_task(fan_out_tweets, user_id, keys)
+        else:
+            await TimelineService(self.session).fan_out(user_id, keys)
 
-        return {"tweet_id": new_tweet.id}
+        return [tweet_id for _, tweet_id in keys]
 
     async def delete_tweet(self, tweet_id: int) -> None:
         """
         Метод для удаления твита пользователя.
 
+        Медиа твита освобождают свои файлы (MediaService.release_media);
+        файлы, на которые больше никто не ссылается, удаляются в пуле
+        потоков после фиксации транзакции.
+
         :param tweet_id: ID твита для удаления
         :param user_id: ID пользователя, который хочет удалить твит
         :return: Объект None
         """
         all_medias = await self.session.execute(
-            select(Media).where(
+            delete(Media).where(
                 Media.tweet_id == tweet_id
-            ))
-        media: List[Media] = all_medias.scalars().all()
+            ).returning(
+                Media.path_file,
+                Media.sha256,
+            ).execution_options(synchronize_session=False))
+        media = all_medias.all()
 
-        if media is not None:
-            for tweet_file in media:
-                await self.session.execute(delete(Media).where(Media.tweet_id == tweet_file.tweet_id))
-                file_path = settings.path_image() / tweet_file.path_file.split("/")[1]
-                file_path.unlink()
+        media_service = MediaService(self.session)
+        unlinked = await media_service.release_media(media)
+        readers = await TimelineService(self.session).remove_tweet(tweet_id)
         await self.session.execute(
             delete(TweetLikes).where(TweetLikes.tweet_id == tweet_id))
         await self.session.execute(delete(Tweet).where(Tweet.id == tweet_id))
         await self.session.commit()
+        await remove_stored(unlinked, "tweet")
+        await cache.delete(tweet_cache_key(tweet_id))
+        await invalidate_timelines(readers)
 
     async def add_like(
             self,
@@ -118,14 +802,34 @@ class TweetService:
         """
         Метод для добавления лайка с твита пользователя.
 
+        Повторный лайк игнорируется, like_count твита увеличивается в той же
+        транзакции только для нового лайка. Если включен like_buffer_enabled,
+        лайк попадает в буфер отложенной записи (см. LikeBuffer).
+
         :param tweet_id: ID твита на который нужно поставить
         :param user_id: ID пользователя которых хочет поставить
         :return: Объект согласно схеме Success или Failure
         """
-        new_like = TweetLikes(tweet_id=tweet_id, user_id=user_id)
-        self.session.add(new_like)
-        await self.session.flush()
+        if settings.like_buffer_enabled:
+            like_buffer.add(user_id, tweet_id, True)
+            return Success.parse_obj({"result": True})
+
+        result = await self.session.execute(
+            insert(TweetLikes).values(
+                tweet_id=tweet_id,
+                user_id=user_id,
+            ).on_conflict_do_nothing(
+                constraint="uq_tweet_likes_tweet_user",
+            ).returning(TweetLikes.id),
+        )
+        if result.scalar() is not None:
+            await self.session.execute(
+                update(Tweet).where(Tweet.id == tweet_id).values(
+                    like_count=Tweet.like_count + 1,
+                ),
+            )
         await self.session.commit()
+        await cache.delete(tweet_cache_key(tweet_id))
 
         return Success.parse_obj({"result": True})
 
@@ -137,13 +841,28 @@ class TweetService:
         """
         Метод для удаления лайка с твита пользователя.
 
+        like_count твита уменьшается в той же транзакции на число удаленных
+        лайков. Если включен like_buffer_enabled, отмена лайка попадает в
+        буфер отложенной записи (см. LikeBuffer).
+
         :param tweet_id: ID твита на который нужно поставить/удалить лайк
         :param user_id: ID пользователя которых хочет поставить/удалить лайк
         :return: Объект согласно схеме None
         """
+        if settings.like_buffer_enabled:
+            like_buffer.add(user_id, tweet_id, False)
+            return
+
         query = delete(TweetLikes).where(
             TweetLikes.user_id == user_id,
             TweetLikes.tweet_id == tweet_id,
         )
-        await self.session.execute(query)
+        result = await self.session.execute(query)
+        if result.rowcount:
+            await self.session.execute(
+                update(Tweet).where(Tweet.id == tweet_id).values(
+                    like_count=Tweet.like_count - result.rowcount,
+                ),
+            )
         await self.session.commit()
+        await cache.delete(tweet_cache_key(tweet_id))
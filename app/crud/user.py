@@ -1,12 +1,14 @@
-from typing import Any, Dict, List, Optional, Union
+from typing import Any, Dict, Optional, Union
 
 from fastapi import Depends
-from sqlalchemy import delete, select
+from sqlalchemy import delete, select, update
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import selectinload
 
+from app.crud.timeline import TimelineService, invalidate_timelines
 from app.db.database import get_db
 from app.db.models import Follows, User
+from app.schema.schemas import Principal
 from app.utils.logger import get_logger
 
 logger = get_logger("crud.user")
@@ -39,13 +41,12 @@ class UserService:
         """
         Метод - получает информацию о пользователе по его ID.
 
+        Подписки и подписчики не загружаются, для них есть get_user_info.
+
         :param user_id: ID пользователя.
         :return: Информацию о пользователе в виде словаря
         """
-        query = select(User).where(User.id == user_id).options(
-            selectinload(User.followers),
-            selectinload(User.follows),
-        )
+        query = select(User).where(User.id == user_id)
         result = await self.session.execute(query)
         user = result.scalars().first()
 
@@ -59,16 +60,46 @@ class UserService:
         :return: Информацию о пользователе в виде словаря
         """
         logger.info("Получение информации о текущем пользователе.")
-        query = select(User).where(User.api_token == api_key).options(
-            selectinload(User.followers),
-            selectinload(User.follows),
-        )
+        query = select(User).where(User.api_token == api_key)
 
         result = await self.session.execute(query)
         user: Union[User, None] = result.scalars().first()
 
         return user
 
+    async def get_principal_by_token(self, api_key: str) -> Optional[Principal]:
+        """
+        Метод получает ID и имя пользователя по его токену.
+
+        В отличие от get_user_by_token, подписки и подписчики не загружаются.
+
+        :param api_key: api-key.
+        :return: объект Principal или None, если токен неизвестен
+        """
+        result = await self.session.execute(
+            select(User.id, User.username).where(User.api_token == api_key),
+        )
+        row = result.first()
+
+        return None if row is None else Principal(id=row.id, username=row.username)
+
+    async def is_following(self, user_id: int, follows_user_id: int) -> bool:
+        """
+        Метод проверяет, подписан ли пользователь на другого пользователя.
+
+        :param user_id: ID подписчика
+        :param follows_user_id: ID пользователя, на которого подписываются
+        :return: True, если подписка есть
+        """
+        result = await self.session.execute(
+            select(Follows.id).where(
+                Follows.user_id == user_id,
+                Follows.follows_user_id == follows_user_id,
+            ).limit(1),
+        )
+
+        return result.first() is not None
+
     async def follow(
             self,
             user_to_follow: int,
@@ -81,25 +112,30 @@ class UserService:
         :param current_user_id: ID пользователя который подписывается
         :return: Объект согласно схеме Success или Failure
         """
-        result = await self.session.execute(select(User).where(
-            User.id == current_user_id).options(
-            selectinload(User.followers), selectinload(User.follows),
-        )
-        )
-
-        to_follow = result.scalars().first()
-        following_id = [user.id for user in to_follow.followers]
         user = await self.session.execute(
-            select(User).where(User.id == user_to_follow)
+            select(User.id).where(User.id == user_to_follow)
         )
         user = user.one_or_none()
 
-        if user is not None and user_to_follow not in following_id:
+        if user is not None and not await self.is_following(
+                current_user_id,
+                user_to_follow,
+        ):
             self.session.add(
                 Follows(user_id=current_user_id, follows_user_id=user_to_follow)
             )
+            await self.session.execute(
+                update(User).where(User.id == user_to_follow).values(
+                    followers_count=User.followers_count + 1,
+                ),
+            )
             await self.session.flush()
+            await TimelineService(self.session).add_followee(
+                current_user_id,
+                user_to_follow,
+            )
             await self.session.commit()
+            await invalidate_timelines([current_user_id])
             return True
         else:
             return False
@@ -116,23 +152,24 @@ class UserService:
         :param current_user_id: ID пользователя который отписываетс
         :return: Объект согласно схеме Success или Failure
         """
-        result = await self.session.execute(select(User).where(
-            User.id == current_user_id).options(
-            selectinload(User.followers), selectinload(User.follows),
-        )
-        )
-
-        to_follow = result.scalars().first()
-        followers_id: List[int] = [user.id for user in to_follow.followers]
-
-        if user_un_follow not in followers_id:
+        if not await self.is_following(current_user_id, user_un_follow):
             return False
 
-        await self.session.execute(
+        deleted = await self.session.execute(
             delete(Follows).where(
                 Follows.user_id == current_user_id,
                 Follows.follows_user_id == user_un_follow)
         )
+        await self.session.execute(
+            update(User).where(User.id == user_un_follow).values(
+                followers_count=User.followers_count - deleted.rowcount,
+            ),
+        )
+        await TimelineService(self.session).remove_followee(
+            current_user_id,
+            user_un_follow,
+        )
         await self.session.commit()
+        await invalidate_timelines([current_user_id])
 
         return True
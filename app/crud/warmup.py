@@ -0,0 +1,223 @@
+import asyncio
+from typing import Any, Dict, List, Optional
+
+from jose import JWTError, jwt
+from sqlalchemy import select, text
+from sqlalchemy.ext.asyncio import AsyncConnection, AsyncSession
+from sqlalchemy.pool import NullPool
+
+from app.config import settings
+from app.crud.media import MediaService
+from app.crud.tweet import TweetService
+from app.crud.user import UserService
+from app.db.database import engine
+from app.db.models import User
+from app.schema.schemas import Principal
+from app.utils.cache import principal_cache
+from app.utils.logger import get_logger
+from app.utils.timing import format_timings, startup_timings, timed
+
+logger = get_logger("startup")
+
+UNKNOWN_ID = 0
+
+
+class Warmup:
+    """
+    Прогрев приложения после запуска.
+
+    Фоновая задача открывает warmup_connections соединений пула,
+    выполняет на каждом горячие запросы сервисов (SQLAlchemy кэширует их
+    компиляцию, asyncpg подготавливает запрос на соединении) и заполняет
+    кэш principal_cache. Пока прогрев не закончен, ready равно False и
+    /health/ready отвечает 503. Неудачный прогрев (например, база еще не
+    запущена) повторяется с экспоненциальной задержкой; после
+    warmup_max_attempts попыток приложение отмечается готовым без
+    прогрева (degraded), чтобы временный сбой не оставил его
+    недоступным навсегда.
+    """
+
+    def __init__(self) -> None:
+        self.ready = False
+        self.degraded = False
+        self.error: Optional[str] = None
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self) -> None:
+        """Запускает прогрев в фоновой задаче."""
+        if self._task is None:
+            self._task = asyncio.create_task(self.run())
+
+    async def stop(self) -> None:
+        """Отменяет незаконченный прогрев."""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                logger.debug("Прогрев приложения остановлен.")
+            self._task = None
+
+    async def run(self) -> None:
+        """
+        Выполняет прогрев с повторами и отмечает приложение готовым.
+
+        Длительности этапов добавляются в startup_timings.
+        """
+        self.ready = False
+        self.degraded = False
+        self.error = None
+        attempt = 1
+        while not await self.attempt():
+            if attempt >= settings.warmup_max_attempts:
+                self.ready = True
+                self.degraded = True
+                logger.error(
+                    "Прогрев не выполнен за {attempts} попыток, приложение "
+                    "запущено без прогрева.".format(attempts=attempt),
+                )
+                return
+            await asyncio.sleep(settings.warmup_retry_seconds * 2 ** (attempt - 1))
+            attempt += 1
+
+        self.ready = True
+        self.error = None
+
+    async def attempt(self) -> bool:
+        """
+        Выполняет одну попытку прогрева.
+
+        :return: True, если прогрев выполнен
+        """
+        try:
+            with timed("warmup"):
+                with timed("images_dir"):
+                    settings.path_image()
+                with timed("connections"):
+                    connections = await self.open_connections()
+                with timed("statements"):
+                    try:
+                        await asyncio.gather(*[
+                            self.prepare_statements(conn) for conn in connections
+                        ])
+                    finally:
+                        await asyncio.gather(*[conn.close() for conn in connections])
+                with timed("principal_cache"):
+                    primed = await self.prime_principals()
+        except Exception as ex:
+            self.error = repr(ex)
+            logger.exception("Прогрев приложения не выполнен.")
+            return False
+
+        logger.info(
+            "Прогрев выполнен: {connections} соединений, {primed} ключей в кэше, "
+            "{timings}".format(
+                connections=len(connections),
+                primed=primed,
+                timings=format_timings(startup_timings),
+            ),
+        )
+        return True
+
+    async def open_connections(self) -> List[AsyncConnection]:
+        """
+        Открывает соединения пула одновременно.
+
+        Соединения удерживаются до конца прогрева, чтобы пул создал
+        разные соединения, а не выдавал одно и то же. Без пула
+        (db_pgbouncer_mode) открывается одно соединение.
+
+        :return: открытые соединения
+        """
+        count = settings.warmup_connections
+        if isinstance(engine.sync_engine.pool, NullPool):
+            count = 1
+        else:
+            count = min(count, settings.db_pool_size)
+
+        return list(await asyncio.gather(*[
+            engine.connect() for _ in range(max(count, 1))
+        ]))
+
+    @staticmethod
+    async def prepare_statements(conn: AsyncConnection) -> None:
+        """
+        Выполняет на соединении горячие запросы сервисов.
+
+        Запросы обращаются к данным по несуществующему ID (хешу), поэтому
+        ничего не находят и ничего не меняют; транзакция откатывается.
+
+        :param conn: соединение пула
+        """
+        async with AsyncSession(bind=conn) as session:
+            users = UserService(session)
+            tweets = TweetService(session)
+            media = MediaService(session)
+
+            await session.execute(text("SELECT 1"))
+            await users.get_principal_by_token("")
+            await users.get_user_by_id(UNKNOWN_ID)
+            await users.get_user_info(UNKNOWN_ID)
+            await users.is_following(UNKNOWN_ID, UNKNOWN_ID)
+            await tweets.get_home_timeline_ids(UNKNOWN_ID, settings.tweets_page_size)
+            await tweets.get_tweets_by_ids([UNKNOWN_ID])
+            await tweets.get_like_samples([UNKNOWN_ID])
+            await tweets.mark_liked_by_me(
+                [{"id": UNKNOWN_ID, "like_count": 0, "likes": []}],
+                UNKNOWN_ID,
+                "",
+            )
+            await tweets.get_likes(UNKNOWN_ID, settings.likes_page_size)
+            await tweets.get_tweet(UNKNOWN_ID, UNKNOWN_ID)
+            await media.acquire_blob("")
+            if settings.feed_render_mode == "sql":
+                await tweets.get_home_timeline_raw(
+                    UNKNOWN_ID,
+                    "",
+                    settings.tweets_page_size,
+                )
+            await session.rollback()
+
+    @staticmethod
+    async def prime_principals() -> int:
+        """
+        Заполняет principal_cache пользователями из базы.
+
+        Ключом кэша служит исходный api-key, поэтому он извлекается из
+        токена пользователя.
+
+        :return: количество добавленных ключей
+        """
+        if settings.warmup_principals <= 0:
+            return 0
+
+        async with engine.connect() as conn:
+            result = await conn.execute(
+                select(User.id, User.username, User.api_token).order_by(
+                    User.id,
+                ).limit(settings.warmup_principals),
+            )
+            rows = result.all()
+
+        primed = 0
+        for row in rows:
+            try:
+                claims: Dict[str, Any] = jwt.decode(
+                    row.api_token,
+                    key=settings.secret_key,
+                    algorithms=[settings.algorithm],
+                )
+            except JWTError:
+                continue
+            api_key = claims.get("api-key")
+            if isinstance(api_key, str):
+                principal_cache.set(
+                    api_key,
+                    Principal(id=row.id, username=row.username),
+                )
+                primed += 1
+
+        return primed
+
+
+warmup = Warmup()
@@ -1,16 +1,60 @@
-from typing import AsyncGenerator
+from typing import Any, AsyncGenerator, Dict
 
 from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import NullPool
 
-from app.config import settings
+from app.config import Settings, settings
+from app.db.instrumentation import instrument_engine
 from app.utils.logger import get_logger
+from app.utils.metrics import instrument_pool
+from app.utils.timing import timed
 
 logger = get_logger("db.database")
 
 
-engine = create_async_engine(settings.async_db_uri, echo=True)
+def engine_options(config: Settings = settings) -> Dict[str, Any]:
+    """
+    Параметры create_async_engine согласно настройкам db_*.
+
+    В режиме db_pgbouncer_mode (pgbouncer в режиме pool_mode=transaction)
+    пул соединений держит pgbouncer, поэтому используется NullPool, а кэши
+    подготовленных запросов asyncpg и SQLAlchemy выключены: соседние
+    транзакции попадают на разные соединения сервера.
+
+    :param config: настройки приложения
+    :return: словарь именованных аргументов create_async_engine
+    """
+    options: Dict[str, Any] = {
+        "echo": config.db_echo,
+        "pool_pre_ping": config.db_pool_pre_ping,
+    }
+
+    if config.db_pgbouncer_mode:
+        options["poolclass"] = NullPool
+        options["connect_args"] = {
+            "statement_cache_size": 0,
+            "prepared_statement_cache_size": 0,
+        }
+        return options
+
+    options.update(
+        pool_size=config.db_pool_size,
+        max_overflow=config.db_max_overflow,
+        pool_timeout=config.db_pool_timeout,
+        pool_recycle=config.db_pool_recycle,
+        connect_args={
+            "prepared_statement_cache_size": config.db_statement_cache_size,
+        },
+    )
+    return options
+
+
+with timed("engine"):
+    engine = create_async_engine(settings.async_db_uri, **engine_options())
+    instrument_engine(engine.sync_engine)
+    instrument_pool(engine.sync_engine.pool)
 
 Base = declarative_base()
 
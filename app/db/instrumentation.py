@@ -0,0 +1,141 @@
+import time
+from collections import Counter
+from contextvars import ContextVar
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+from fastapi import Request, Response
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+from app.config import settings
+from app.utils.logger import get_logger
+
+logger = get_logger("db.instrumentation")
+
+
+class QueryBudgetExceeded(Exception):
+    """Запрос выполнил больше SQL запросов, чем объявлено для endpoint."""
+
+
+class QueryStats:
+    """Статистика SQL запросов, выполненных при обработке одного HTTP запроса."""
+
+    def __init__(self) -> None:
+        self.count = 0
+        self.duration = 0.0
+        self.shapes: Counter = Counter()
+        self.budget: Optional[int] = None
+
+    def record(self, statement: str, duration: float) -> None:
+        """
+        Учитывает выполненный SQL запрос.
+
+        :param statement: текст запроса с плейсхолдерами параметров
+        :param duration: время выполнения в секундах
+        """
+        self.count += 1
+        self.duration += duration
+        self.shapes[" ".join(statement.split())] += 1
+
+    def repeated(self, threshold: int) -> Dict[str, int]:
+        """
+        Возвращает запросы, повторенные не меньше threshold раз (N+1).
+
+        Запросы сравниваются по тексту с плейсхолдерами, поэтому один и тот
+        же запрос с разными параметрами считается повтором.
+
+        :param threshold: минимальное количество повторов
+        :return: словарь текст запроса -> количество выполнений
+        """
+        return {
+            shape: count
+            for shape, count in self.shapes.items()
+            if count >= threshold
+        }
+
+    def server_timing(self) -> str:
+        return 'db;dur={duration:.2f};desc="{count} queries"'.format(
+            duration=self.duration * 1000,
+            count=self.count,
+        )
+
+
+query_stats: ContextVar[Optional[QueryStats]] = ContextVar(
+    "query_stats",
+    default=None,
+)
+
+
+def _before_cursor_execute(conn: Any, *args: Any) -> None:
+    conn.info.setdefault("query_started_at", []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn: Any, cursor: Any, statement: str, *args: Any) -> None:
+    started_at = conn.info["query_started_at"].pop()
+    stats = query_stats.get()
+    if stats is not None:
+        stats.record(statement, time.perf_counter() - started_at)
+
+
+def instrument_engine(engine: Engine) -> None:
+    """
+    Подключает подсчет SQL запросов к движку.
+
+    :param engine: синхронный движок (AsyncEngine.sync_engine)
+    """
+    event.listen(engine, "before_cursor_execute", _before_cursor_execute)
+    event.listen(engine, "after_cursor_execute", _after_cursor_execute)
+
+
+async def instrument_request(
+        request: Request,
+        call_next: Callable[[Request], Awaitable[Response]],
+) -> Response:
+    """
+    Middleware: считает SQL запросы и время базы для HTTP запроса.
+
+    Итог отдается в заголовке Server-Timing и пишется в лог. Повторы
+    одного запроса (sql_n_plus_one_threshold раз и больше) логируются
+    как N+1. Если endpoint объявил бюджет запросов (QueryBudget) и
+    превысил его, пишется предупреждение, а в строгом режиме
+    (sql_query_budget_strict) выбрасывается QueryBudgetExceeded.
+
+    :param request: HTTP запрос
+    :param call_next: следующий обработчик
+    :return: HTTP ответ
+    """
+    stats = QueryStats()
+    token = query_stats.set(stats)
+    try:
+        response = await call_next(request)
+    finally:
+        query_stats.reset(token)
+
+    route = "{method} {path}".format(method=request.method, path=request.url.path)
+    response.headers["Server-Timing"] = stats.server_timing()
+    logger.info("{route}: {count} SQL запросов за {duration:.2f} мс".format(
+        route=route,
+        count=stats.count,
+        duration=stats.duration * 1000,
+    ))
+
+    for shape, count in stats.repeated(settings.sql_n_plus_one_threshold).items():
+        logger.warning(
+            "{route}: возможный N+1, запрос выполнен {count} раз: {shape}".format(
+                route=route,
+                count=count,
+                shape=shape,
+            ),
+        )
+
+    if stats.budget is not None and stats.count > stats.budget:
+        message = "{route}: {count} SQL запросов при бюджете {budget}".format(
+            route=route,
+            count=stats.count,
+            budget=stats.budget,
+        )
+        if settings.sql_query_budget_strict:
+            raise QueryBudgetExceeded(message)
+        logger.warning(message)
+
+    return response
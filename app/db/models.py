@@ -1,7 +1,20 @@
 from datetime import datetime
 from typing import Any, Dict, List, Optional
 
-from sqlalchemy import Column, DateTime, ForeignKey, Integer, String, Text, func
+from sqlalchemy import (
+    BigInteger,
+    Boolean,
+    Column,
+    DateTime,
+    ForeignKey,
+    Index,
+    Integer,
+    String,
+    Text,
+    UniqueConstraint,
+    func,
+)
+from sqlalchemy.dialects.postgresql import JSONB
 from sqlalchemy.orm import relationship
 
 from app.db.database import Base
@@ -11,8 +24,9 @@ class User(Base):
     __tablename__ = "user"
     id = Column(Integer, primary_key=True)
     username = Column(String(25), unique=True, nullable=False)
-    api_token = Column(Text(), nullable=False)
+    api_token = Column(Text(), nullable=False, index=True)
     created_at = Column(DateTime(timezone=True), server_default=func.now())
+    followers_count = Column(Integer, nullable=False, default=0, server_default="0")
 
     tweets = relationship(
         "Tweet",
@@ -26,7 +40,7 @@ class User(Base):
         primaryjoin="User.id == Follows.user_id",
         secondaryjoin="User.id == Follows.follows_user_id",
         back_populates="follows",
-        lazy="selectin",
+        lazy="raise",
         uselist=True,
     )
     follows = relationship(
@@ -35,7 +49,7 @@ class User(Base):
         primaryjoin="User.id == Follows.follows_user_id",
         secondaryjoin="User.id == Follows.user_id",
         back_populates="followers",
-        lazy="selectin",
+        lazy="raise",
         uselist=True,
     )
     tweet_likes = relationship("TweetLikes", back_populates="user")
@@ -72,14 +86,30 @@ class Tweet(Base):
     __tablename__ = "tweet"
 
     id = Column(Integer, primary_key=True, index=True)
-    content = Column(String, index=True)
+    content = Column(String)
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     user_id = Column(Integer, ForeignKey("user.id"))
+    like_count = Column(Integer, nullable=False, default=0, server_default="0")
 
     user = relationship("User", back_populates="tweets")
     likes = relationship("TweetLikes", back_populates="tweet")
 
-    tweet_image = relationship("Media", back_populates="medias")
+    tweet_image = relationship(
+        "Media",
+        back_populates="medias",
+        order_by="Media.id",
+    )
+
+    __table_args__ = (
+        Index("ix_tweet_created_at_id", created_at.desc(), id.desc()),
+        Index(
+            "ix_tweet_user_created_at",
+            user_id,
+            created_at.desc(),
+            id.desc(),
+        ),
+    )
+    __mapper_args__ = {"eager_defaults": True}
 
     def __repr__(self) -> str:
         return "{name} ({id}, {content}, {date_create})".format(
@@ -89,7 +119,10 @@ class Tweet(Base):
             date_create=self.created_at
         )
 
-    def to_json(self) -> Dict[str, Any]:
+    def to_json(
+            self,
+            likes: Optional[List[Dict[str, Any]]] = None,
+    ) -> Dict[str, Any]:
         return {
             "id": self.id,
             "content": self.content,
@@ -98,9 +131,8 @@ class Tweet(Base):
                 "name": self.user.username,
             },
             "attachments": [image.to_json()["url"] for image in self.tweet_image],
-            "likes": [
-                like.to_json() for like in self.likes
-            ],
+            "likes": likes or [],
+            "like_count": self.like_count,
         }
 
 
@@ -113,6 +145,32 @@ class Follows(Base):
     user_id = Column(Integer, ForeignKey("user.id"))
     follows_user_id = Column(Integer, ForeignKey("user.id"))
 
+    __table_args__ = (
+        Index("ix_followings_user_id_follows_user_id", user_id, follows_user_id),
+        Index("ix_followings_follows_user_id", follows_user_id),
+    )
+
+
+class HomeTimeline(Base):
+    """<tweet_id> from <author_id> is in the home timeline of <user_id>
+    """
+    __tablename__ = "home_timeline"
+
+    user_id = Column(Integer, ForeignKey("user.id"), primary_key=True)
+    tweet_id = Column(Integer, ForeignKey("tweet.id"), primary_key=True)
+    author_id = Column(Integer, ForeignKey("user.id"), nullable=False)
+    created_at = Column(DateTime(timezone=True), nullable=False)
+
+    __table_args__ = (
+        Index(
+            "ix_home_timeline_user_created_at",
+            user_id,
+            created_at.desc(),
+            tweet_id.desc(),
+        ),
+        Index("ix_home_timeline_tweet_id", tweet_id),
+    )
+
 
 class TweetLikes(Base):
     __tablename__ = "tweet_likes"
@@ -124,18 +182,106 @@ class TweetLikes(Base):
     user = relationship("User", back_populates="tweet_likes")
     tweet = relationship("Tweet", back_populates="likes")
 
+    __table_args__ = (
+        UniqueConstraint("tweet_id", "user_id", name="uq_tweet_likes_tweet_user"),
+        Index("ix_tweet_likes_tweet_id_id", tweet_id, id.desc()),
+    )
+
     def to_json(self) -> dict:
         return {"user_id": self.user.id,
                 "name": self.user.username}
 
 
+class MediaSegment(Base):
+    """Файл, в который дописываются небольшие блобы (SegmentStorage)."""
+
+    __tablename__ = "media_segment"
+    id = Column(Integer, primary_key=True)
+    sealed = Column(Boolean, nullable=False, server_default="false")
+    heartbeat_at = Column(DateTime(timezone=True), server_default=func.now())
+    retired_at = Column(DateTime(timezone=True))
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+
+
+class MediaBlob(Base):
+    """Файл медиа, общий для всех загрузок с одинаковым содержимым."""
+
+    __tablename__ = "media_blob"
+    sha256 = Column(String(64), primary_key=True)
+    path_file = Column(Text(), nullable=False)
+    size = Column(BigInteger, nullable=False)
+    ref_count = Column(Integer, nullable=False, server_default="1")
+    segment_id = Column(Integer, ForeignKey("media_segment.id"), index=True)
+    segment_offset = Column(BigInteger)
+    meta = Column(JSONB)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+
+    def __repr__(self) -> str:
+        return "{name} ({sha256}', '{path_file}', '{ref_count}')".format(
+            name=self.__class__.__name__,
+            sha256=self.sha256,
+            path_file=self.path_file,
+            ref_count=self.ref_count,
+        )
+
+
+class MediaFileCleanup(Base):
+    """Файл, который больше не используется и ждет удаления MediaSweeper."""
+
+    __tablename__ = "media_file_cleanup"
+    path_file = Column(Text(), primary_key=True)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+
+
+class MediaJob(Base):
+    """Задача обработки файла блоба фоновым MediaWorker."""
+
+    __tablename__ = "media_job"
+    id = Column(Integer, primary_key=True)
+    sha256 = Column(
+        String(64),
+        ForeignKey("media_blob.sha256", ondelete="CASCADE"),
+        nullable=False,
+        index=True,
+    )
+    status = Column(String(16), nullable=False, server_default="pending")
+    attempts = Column(Integer, nullable=False, server_default="0")
+    run_after = Column(
+        DateTime(timezone=True),
+        nullable=False,
+        server_default=func.now(),
+    )
+    last_error = Column(Text())
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    updated_at = Column(DateTime(timezone=True), server_default=func.now())
+
+    __table_args__ = (
+        Index(
+            "ix_media_job_run_after",
+            run_after,
+            postgresql_where=status.in_(("pending", "running")),
+        ),
+    )
+
+
 class Media(Base):
     __tablename__ = "media"
     id = Column(Integer, primary_key=True)
-    tweet_id = Column(Integer, ForeignKey("tweet.id"))
+    tweet_id = Column(Integer, ForeignKey("tweet.id"), index=True)
     path_file = Column(Text(), nullable=False)
+    sha256 = Column(String(64), ForeignKey("media_blob.sha256"), index=True)
+    size = Column(BigInteger)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
     medias = relationship("Tweet", back_populates="tweet_image")
 
+    __table_args__ = (
+        Index(
+            "ix_media_orphan_created_at",
+            created_at,
+            postgresql_where=tweet_id.is_(None),
+        ),
+    )
+
     def __repr__(self) -> str:
         return "{name} ({id}', '{tweet_id}', '{path_file}')".format(
             name=self.__class__.__name__,
@@ -145,6 +291,8 @@ class Media(Base):
         )
 
     def to_json(self) -> Dict[str, Any]:
+        # Файл отдает GET /api/medias/{id}: у блобов в сегментах нет
+        # отдельного файла в каталоге изображений.
         return {
-            "url": self.path_file
+            "url": "/api/medias/{id}".format(id=self.id)
         }
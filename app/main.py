@@ -1,9 +1,23 @@
+import time
+
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 
 from app.api.v1.api import api_router as api_router_v1
+from app.config import settings
+from app.crud.like_buffer import like_buffer
+from app.crud.media_gc import media_sweeper
+from app.crud.media_storage import segment_storage
+from app.crud.media_worker import media_worker
+from app.crud.warmup import warmup
+from app.db.instrumentation import instrument_request
+from app.utils.logger import assign_request_id, get_logger, shutdown_logging
+from app.utils.metrics import mark_process_dead, record_request_metrics
+from app.utils.timing import format_timings, startup_timings
 from app.schema.schemas import Failure
 
+logger = get_logger("startup")
+
 app = FastAPI(
     title="Clone-tweeter",
     description="Итоговый проект по курсу Python advanced. Skiilbox.",
@@ -33,4 +47,38 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+app.middleware("http")(instrument_request)
+if settings.metrics_enabled:
+    app.middleware("http")(record_request_metrics)
+app.middleware("http")(assign_request_id)
+
 app.include_router(api_router_v1)
+startup_timings["import_cpu"] = time.process_time() * 1000
+
+
+@app.on_event("startup")
+async def startup() -> None:
+    if settings.like_buffer_enabled:
+        like_buffer.start()
+    if settings.media_worker_enabled:
+        media_worker.start()
+    if settings.media_gc_enabled:
+        media_sweeper.start()
+    logger.info("Запуск приложения: {timings}".format(
+        timings=format_timings(startup_timings),
+    ))
+    if settings.warmup_enabled:
+        warmup.start()
+    else:
+        warmup.ready = True
+
+
+@app.on_event("shutdown")
+async def shutdown() -> None:
+    await warmup.stop()
+    await like_buffer.stop()
+    await media_worker.stop()
+    await media_sweeper.stop()
+    await segment_storage.seal()
+    mark_process_dead()
+    shutdown_logging()
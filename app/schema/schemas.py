@@ -1,6 +1,6 @@
 from typing import Optional
 
-from pydantic import BaseModel
+from pydantic import BaseModel, conlist
 
 
 class BaseUser(BaseModel):
@@ -8,6 +8,15 @@ class BaseUser(BaseModel):
     name: str
 
 
+class Principal(BaseModel):
+    id: int
+    username: str
+
+    class Config:
+        orm_mode = True
+        allow_mutation = False
+
+
 class LikeUser(BaseModel):
     user_id: int
     name: str
@@ -33,6 +42,8 @@ class TweetsResponseModel(BaseModel):
     attachments: Optional[list[str]]
     author: BaseUser
     likes: Optional[list[LikeUser]]
+    like_count: int = 0
+    liked_by_me: bool = False
 
     class Config:
         arbitrary_types_allowed = True
@@ -44,6 +55,10 @@ class TweetIn(BaseModel):
     tweet_media_ids: list[int]
 
 
+class TweetsBatchIn(BaseModel):
+    tweets: conlist(TweetIn, min_items=1)
+
+
 class NewTweetOut(BaseModel):
     result: bool = True
     tweet_id: int
@@ -52,9 +67,21 @@ class NewTweetOut(BaseModel):
         orm_mode = True
 
 
+class NewTweetsOut(BaseModel):
+    result: bool = True
+    tweet_ids: list[int]
+
+
 class TweetsOut(BaseModel):
     result: bool
     tweets: list[TweetsResponseModel]
+    next_cursor: Optional[str] = None
+
+
+class LikesOut(BaseModel):
+    result: bool = True
+    likes: list[LikeUser]
+    next_cursor: Optional[str] = None
 
 
 class Success(BaseModel):
@@ -0,0 +1,395 @@
+import json
+import time
+import uuid
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, Iterable, Optional, Tuple
+
+from app.config import settings
+from app.schema.schemas import Principal
+from app.utils.logger import get_logger
+from app.utils.metrics import CACHE_REMOVALS, CACHE_REQUESTS
+
+logger = get_logger("utils.cache")
+
+
+class CacheStats:
+    """Счетчики обращений к кэшу, дублируются в метрики Prometheus."""
+
+    def __init__(self, name: str) -> None:
+        self.name = name
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def hit(self, count: int = 1) -> None:
+        self.hits += count
+        CACHE_REQUESTS.labels(self.name, "hit").inc(count)
+
+    def miss(self, count: int = 1) -> None:
+        self.misses += count
+        CACHE_REQUESTS.labels(self.name, "miss").inc(count)
+
+    def evict(self) -> None:
+        self.evictions += 1
+        CACHE_REMOVALS.labels(self.name, "evicted").inc()
+
+    def expire(self) -> None:
+        self.expirations += 1
+        CACHE_REMOVALS.labels(self.name, "expired").inc()
+
+    @property
+    def hit_ratio(self) -> float:
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+    def to_json(self) -> Dict[str, Any]:
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+            "hit_ratio": self.hit_ratio,
+        }
+
+
+class CacheBackend(ABC):
+    """
+    Интерфейс кэша.
+
+    Значения сериализуются в JSON, поэтому в кэш можно класть только
+    JSON-совместимые объекты. TTL задается в секундах.
+    """
+
+    name = "responses"
+
+    def __init__(self) -> None:
+        self.stats = CacheStats(self.name)
+
+    async def get(self, key: str) -> Optional[Any]:
+        values = await self.get_many([key])
+        return values.get(key)
+
+    @abstractmethod
+    async def get_many(self, keys: Iterable[str]) -> Dict[str, Any]:
+        """
+        Читает значения нескольких ключей.
+
+        :param keys: ключи
+        :return: словарь найденных ключей и значений
+        """
+
+    @abstractmethod
+    async def set(self, key: str, value: Any, ttl: Optional[float] = None) -> None:
+        """
+        Сохраняет значение.
+
+        :param key: ключ
+        :param value: JSON-совместимое значение
+        :param ttl: время жизни в секундах (по умолчанию TTL кэша)
+        """
+
+    @abstractmethod
+    async def delete(self, *keys: str) -> None:
+        """
+        Удаляет ключи.
+
+        :param keys: ключи
+        """
+
+    @staticmethod
+    def dumps(value: Any) -> bytes:
+        return json.dumps(value, ensure_ascii=False).encode("utf-8")
+
+    @staticmethod
+    def loads(raw: bytes) -> Any:
+        return json.loads(raw)
+
+
+class NullCache(CacheBackend):
+    """Кэш, который ничего не хранит (кэширование выключено)."""
+
+    async def get_many(self, keys: Iterable[str]) -> Dict[str, Any]:
+        self.stats.miss(len(list(keys)))
+        return {}
+
+    async def set(self, key: str, value: Any, ttl: Optional[float] = None) -> None:
+        return None
+
+    async def delete(self, *keys: str) -> None:
+        return None
+
+
+class MemoryCache(CacheBackend):
+    """
+    LRU кэш в памяти процесса с ограничением по размеру в байтах.
+
+    Размер записи считается как длина ключа и сериализованного значения.
+    Записи старше TTL удаляются при обращении к ним.
+    """
+
+    def __init__(
+            self,
+            max_bytes: int,
+            ttl: float,
+            clock: Callable[[], float] = time.monotonic,
+    ) -> None:
+        super().__init__()
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.size = 0
+        self._clock = clock
+        self._entries: "OrderedDict[str, Tuple[float, bytes]]" = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    async def get_many(self, keys: Iterable[str]) -> Dict[str, Any]:
+        now = self._clock()
+        found = {}
+
+        for key in keys:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] <= now:
+                self._remove(key)
+                self.stats.expire()
+                entry = None
+
+            if entry is None:
+                self.stats.miss()
+                continue
+
+            self._entries.move_to_end(key)
+            self.stats.hit()
+            found[key] = self.loads(entry[1])
+
+        return found
+
+    async def set(self, key: str, value: Any, ttl: Optional[float] = None) -> None:
+        raw = self.dumps(value)
+        entry_size = len(key) + len(raw)
+        if entry_size > self.max_bytes:
+            return
+
+        self._remove(key)
+        expires_at = self._clock() + (self.ttl if ttl is None else ttl)
+        self._entries[key] = (expires_at, raw)
+        self.size += entry_size
+
+        while self.size > self.max_bytes:
+            oldest_key = next(iter(self._entries))
+            self._remove(oldest_key)
+            self.stats.evict()
+
+    async def delete(self, *keys: str) -> None:
+        for key in keys:
+            self._remove(key)
+
+    def _remove(self, key: str) -> None:
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self.size -= len(key) + len(entry[1])
+
+
+class RedisCache(CacheBackend):
+    """
+    Кэш в Redis (или совместимом сервере), общий для всех воркеров.
+
+    Клиент должен поддерживать асинхронные методы mget, set(px=...) и
+    delete, как redis.asyncio.Redis. Вытеснением записей занимается сам
+    сервер (maxmemory-policy), поэтому evictions здесь не считаются.
+    """
+
+    def __init__(self, client: Any, ttl: float, prefix: str = "tweeter:") -> None:
+        super().__init__()
+        self.client = client
+        self.ttl = ttl
+        self.prefix = prefix
+
+    async def get_many(self, keys: Iterable[str]) -> Dict[str, Any]:
+        keys = list(keys)
+        if not keys:
+            return {}
+
+        raw_values = await self.client.mget([self.prefix + key for key in keys])
+        found = {}
+        for key, raw in zip(keys, raw_values):
+            if raw is None:
+                self.stats.miss()
+                continue
+            self.stats.hit()
+            found[key] = self.loads(raw)
+
+        return found
+
+    async def set(self, key: str, value: Any, ttl: Optional[float] = None) -> None:
+        await self.client.set(
+            self.prefix + key,
+            self.dumps(value),
+            px=int((self.ttl if ttl is None else ttl) * 1000),
+        )
+
+    async def delete(self, *keys: str) -> None:
+        if keys:
+            await self.client.delete(*[self.prefix + key for key in keys])
+
+
+class PrincipalCache:
+    """
+    Кэш аутентификации: api-key -> Principal (ID и имя пользователя).
+
+    Хранится в памяти процесса, не больше max_entries записей (LRU).
+    Найденные пользователи живут ttl секунд, неизвестные ключи
+    запоминаются на negative_ttl секунд, чтобы перебор ключей не
+    нагружал базу. Кэш синхронный: попадание не требует ни запроса
+    в базу, ни переключения задач.
+
+    Пользователи и их ключи меняются вне процесса приложения
+    (initial_data, bulk_data), поэтому такие команды меняют версию ключей
+    в общем кэше (bump), а процесс приложения не чаще раза в
+    check_interval секунд сверяет ее (sync) и при изменении очищает
+    кэш. Версия доходит до всех процессов только через общий кэш
+    (cache_backend=redis); с кэшем в памяти процесса измененный ключ
+    проходит аутентификацию по-старому не дольше ttl секунд, а новый
+    ключ, запомненный как неизвестный, - не дольше negative_ttl секунд.
+    """
+
+    missing = object()
+    version_key = "principals:version"
+
+    def __init__(
+            self,
+            max_entries: int,
+            ttl: float,
+            negative_ttl: float,
+            check_interval: float = 1.0,
+            clock: Callable[[], float] = time.monotonic,
+    ) -> None:
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.check_interval = check_interval
+        self.stats = CacheStats("principals")
+        self._clock = clock
+        self._version: Optional[str] = None
+        self._checked_at: Optional[float] = None
+        self._entries: "OrderedDict[Hashable, Tuple[float, Optional[Principal]]]" = (
+            OrderedDict()
+        )
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, api_key: Hashable) -> Any:
+        """
+        Возвращает пользователя по api-key.
+
+        :param api_key: значение заголовка api-key
+        :return: Principal, None для неизвестного ключа или
+            PrincipalCache.missing, если ключа нет в кэше
+        """
+        entry = self._entries.get(api_key)
+        if entry is not None and entry[0] <= self._clock():
+            self._remove(api_key)
+            self.stats.expire()
+            entry = None
+
+        if entry is None:
+            self.stats.miss()
+            return self.missing
+
+        self._entries.move_to_end(api_key)
+        self.stats.hit()
+        return entry[1]
+
+    def set(self, api_key: Hashable, principal: Optional[Principal]) -> None:
+        """
+        Запоминает результат аутентификации, в том числе неудачной.
+
+        :param api_key: значение заголовка api-key
+        :param principal: пользователь или None, если ключ неизвестен
+        """
+        if self.max_entries <= 0:
+            return
+
+        self._remove(api_key)
+        ttl = self.negative_ttl if principal is None else self.ttl
+        self._entries[api_key] = (self._clock() + ttl, principal)
+
+        while len(self._entries) > self.max_entries:
+            self._remove(next(iter(self._entries)))
+            self.stats.evict()
+
+    def clear(self) -> None:
+        self._entries.clear()
+
+    async def sync(self, backend: CacheBackend) -> None:
+        """
+        Очищает кэш, если версия ключей в общем кэше изменилась.
+
+        Версия читается не чаще раза в check_interval секунд.
+
+        :param backend: общий кэш
+        """
+        now = self._clock()
+        checked_at = self._checked_at
+        if checked_at is not None and now < checked_at + self.check_interval:
+            return
+
+        self._checked_at = now
+        version = await backend.get(self.version_key)
+        if version != self._version:
+            self._version = version
+            self.clear()
+
+    async def bump(self, backend: CacheBackend) -> None:
+        """
+        Меняет версию ключей, чтобы процессы приложения очистили кэш.
+
+        Версия хранится ttl секунд: записи, сохраненные до изменения,
+        к этому времени истекают сами.
+
+        :param backend: общий кэш
+        """
+        await backend.set(self.version_key, uuid.uuid4().hex, ttl=self.ttl)
+
+    def _remove(self, api_key: Hashable) -> None:
+        self._entries.pop(api_key, None)
+
+
+def tweet_cache_key(tweet_id: int) -> str:
+    return "tweet:{tweet_id}".format(tweet_id=tweet_id)
+
+
+def create_cache() -> CacheBackend:
+    """
+    Создает кэш согласно настройке cache_backend.
+
+    :return: объект CacheBackend
+    """
+    if settings.cache_backend == "memory":
+        return MemoryCache(settings.cache_max_bytes, settings.cache_ttl)
+
+    if settings.cache_backend == "redis":
+        try:
+            from redis import asyncio as aioredis  # noqa: WPS433
+        except ImportError:
+            logger.error("Пакет redis не установлен, кэширование выключено.")
+            return NullCache()
+        return RedisCache(
+            aioredis.from_url(settings.cache_redis_url),
+            settings.cache_ttl,
+        )
+
+    return NullCache()
+
+
+cache = create_cache()
+
+principal_cache = PrincipalCache(
+    settings.auth_cache_max_entries,
+    settings.auth_cache_ttl,
+    settings.auth_cache_negative_ttl,
+    settings.auth_cache_check_seconds,
+)
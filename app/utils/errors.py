@@ -4,6 +4,7 @@ from typing import Any, Callable, TypeVar, cast
 from fastapi.responses import JSONResponse
 
 from app.utils.logger import get_logger
+from app.utils.metrics import APP_ERRORS
 
 FunVar = TypeVar("FunVar", bound=Callable[..., Any])
 
@@ -59,6 +60,7 @@ def error_handler(func: FunVar) -> FunVar:
             return await func(*args, **kwargs)
         except AppExcept as ex:
             logger.error(ex.msg)
+            APP_ERRORS.labels(ex.mtype).inc()
             return await create_valid_response(ex.mtype, ex.msg)
         except ValueError as ex:
             logger.info(ex.args)
@@ -1,9 +1,90 @@
+import atexit
 import json
+import logging
 import os
-from logging import Logger, config, getLogger
+import queue
+import uuid
+from contextvars import ContextVar
+from logging import Filter, Formatter, Handler, Logger, LogRecord, config, getLogger
+from logging.handlers import QueueHandler, QueueListener
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+from fastapi import Request, Response
+
+from app.config import Settings, settings
+from app.utils.timing import timed
 
 FOLDER_LOG = "app/app_logs"
 LOGGING_CONFIG_FILE = "app/utils/loggers.json"
+REQUEST_ID_HEADER = "X-Request-ID"
+
+request_id: ContextVar[Optional[str]] = ContextVar("request_id", default=None)
+
+
+class RequestIdFilter(Filter):
+    """Добавляет к записи лога ID текущего HTTP запроса (record.request_id)."""
+
+    def filter(self, record: LogRecord) -> bool:
+        record.request_id = request_id.get()
+        return True
+
+
+class SamplingFilter(Filter):
+    """
+    Пропускает долю info/debug записей логгеров из rates.
+
+    Доля задается для имени логгера, например {"endpoints.post": 0.1}
+    пропускает каждую десятую запись. Записи уровня WARNING и выше
+    пропускаются всегда.
+    """
+
+    def __init__(self, rates: Dict[str, float]) -> None:
+        super().__init__()
+        self.rates = rates
+        self._seen: Dict[str, int] = {}
+        self._passed: Dict[str, int] = {}
+
+    def filter(self, record: LogRecord) -> bool:
+        rate = self.rates.get(record.name)
+        if rate is None or record.levelno >= logging.WARNING:
+            return True
+
+        seen = self._seen.get(record.name, 0)
+        passed = self._passed.get(record.name, 0)
+        self._seen[record.name] = seen + 1
+        if passed > seen * rate:
+            return False
+        self._passed[record.name] = passed + 1
+        return True
+
+
+class JsonFormatter(Formatter):
+    """Форматирует запись лога в одну строку JSON."""
+
+    def format(self, record: LogRecord) -> str:
+        message = {
+            "time": self.formatTime(record),
+            "level": record.levelname,
+            "logger": record.name,
+            "process": record.processName,
+            "request_id": getattr(record, "request_id", None),
+            "message": record.getMessage(),
+        }
+        if record.exc_info:
+            message["exc_info"] = self.formatException(record.exc_info)
+
+        return json.dumps(message, ensure_ascii=False)
+
+
+class _LoggingState:
+    def __init__(self) -> None:
+        self.templates: Optional[Dict[str, Any]] = None
+        self.queue_handler = QueueHandler(queue.SimpleQueue())
+        self.queue_handler.addFilter(RequestIdFilter())
+        self.listener: Optional[QueueListener] = None
+
+
+_state = _LoggingState()
 
 
 def create_log_folder(folder: str = FOLDER_LOG) -> None:
@@ -17,6 +98,64 @@ def create_log_folder(folder: str = FOLDER_LOG) -> None:
         os.mkdir(folder)
 
 
+def configure_logging(app_settings: Settings = settings) -> None:
+    """
+    Настраивает обработчики логов по loggers.json.
+
+    Логгеры пишут только в очередь (QueueHandler), а обработчики из
+    конфигурации (консоль, файл) вызываются в отдельном потоке
+    QueueListener, поэтому event loop не ждет записи в файл. Повторный
+    вызов заменяет обработчики с учетом новых настроек log_*.
+
+    :param app_settings: настройки приложения
+    """
+    with open(LOGGING_CONFIG_FILE, mode="r", encoding="utf-8") as log_file:
+        dict_config = json.load(log_file)
+
+    shutdown_logging()
+    templates = dict_config.pop("loggers")
+    handlers = dict_config["handlers"]
+    if not app_settings.log_file_enabled:
+        handlers.pop("rotating_file")
+    else:
+        create_log_folder()
+    for handler in handlers.values():
+        handler["formatter"] = app_settings.log_format
+
+    configurator = config.DictConfigurator(dict_config)
+    configurator.configure()
+    targets: List[Handler] = [
+        configurator.config["handlers"][name]
+        for name in handlers
+    ]
+
+    for old_filter in list(_state.queue_handler.filters):
+        if isinstance(old_filter, SamplingFilter):
+            _state.queue_handler.removeFilter(old_filter)
+    if app_settings.log_sampling:
+        _state.queue_handler.addFilter(SamplingFilter(app_settings.log_sampling))
+
+    _state.templates = templates
+    _state.listener = QueueListener(
+        _state.queue_handler.queue,
+        *targets,
+        respect_handler_level=True,
+    )
+    _state.listener.start()
+
+
+def shutdown_logging() -> None:
+    """Останавливает поток записи логов, дописав записи из очереди."""
+    if _state.listener is not None:
+        _state.listener.stop()
+        for handler in _state.listener.handlers:
+            handler.close()
+        _state.listener = None
+
+
+atexit.register(shutdown_logging)
+
+
 def get_logger(name: str, template: str = "default") -> Logger:
     """
     Настройки логгера.
@@ -25,11 +164,38 @@ def get_logger(name: str, template: str = "default") -> Logger:
     :param template:
     :return: logger.Logger
     """
-    create_log_folder()
-    with open(LOGGING_CONFIG_FILE, mode="r", encoding="utf-8") as log_file:
-        dict_config = json.load(log_file)
-        dict_config["loggers"][name] = dict_config["loggers"][template]
+    if _state.templates is None:
+        with timed("logging"):
+            configure_logging()
+
+    logger = getLogger(name)
+    logger.setLevel(_state.templates[template]["level"])
+    if _state.queue_handler not in logger.handlers:
+        logger.addHandler(_state.queue_handler)
+
+    return logger
 
-    config.dictConfig(dict_config)
 
-    return getLogger(name)
+async def assign_request_id(
+        request: Request,
+        call_next: Callable[[Request], Awaitable[Response]],
+) -> Response:
+    """
+    Middleware: ID запроса для записей лога.
+
+    ID берется из заголовка X-Request-ID (или генерируется) и
+    возвращается в том же заголовке ответа.
+
+    :param request: HTTP запрос
+    :param call_next: следующий обработчик
+    :return: HTTP ответ
+    """
+    current_id = request.headers.get(REQUEST_ID_HEADER) or uuid.uuid4().hex
+    token = request_id.set(current_id)
+    try:
+        response = await call_next(request)
+    finally:
+        request_id.reset(token)
+
+    response.headers[REQUEST_ID_HEADER] = current_id
+    return response
@@ -0,0 +1,125 @@
+"""
+Разбор файлов медиа в процессах пула MediaWorker.
+
+Модуль не импортирует приложение, поэтому процессы пула запускаются
+быстро и не открывают соединений с базой.
+"""
+import hashlib
+import mmap
+import struct
+from typing import Any, Dict, Optional, Tuple
+
+SIGNATURES = (
+    (b"\x89PNG\r\n\x1a\n", "png"),
+    (b"\xff\xd8\xff", "jpeg"),
+    (b"GIF87a", "gif"),
+    (b"GIF89a", "gif"),
+    (b"BM", "bmp"),
+)
+# Маркеры SOF JPEG, после которых идут высота и ширина изображения.
+JPEG_SOF_MARKERS = frozenset(range(0xC0, 0xD0)) - {0xC4, 0xC8, 0xCC}
+
+
+def sniff_format(header: bytes) -> str:
+    """
+    Определяет формат файла по первым байтам.
+
+    :param header: начало файла (не меньше 16 байт)
+    :return: png, jpeg, gif, bmp, webp или unknown
+    """
+    if header[:4] == b"RIFF" and header[8:12] == b"WEBP":
+        return "webp"
+    for signature, media_format in SIGNATURES:
+        if header.startswith(signature):
+            return media_format
+    return "unknown"
+
+
+def jpeg_dimensions(data: memoryview) -> Optional[Tuple[int, int]]:
+    """
+    Читает размеры JPEG из сегмента SOF, пропуская остальные сегменты.
+
+    :param data: содержимое файла
+    :return: ширина и высота или None, если сегмент SOF не найден
+    """
+    position = 2
+    while position + 4 <= len(data):
+        if data[position] != 0xFF:
+            return None
+        marker = data[position + 1]
+        length = struct.unpack_from(">H", data, position + 2)[0]
+        if length < 2:
+            return None
+        if marker in JPEG_SOF_MARKERS:
+            if position + 9 > len(data):
+                return None
+            height, width = struct.unpack_from(">HH", data, position + 5)
+            return width, height
+        position += 2 + length
+    return None
+
+
+def dimensions(data: memoryview, media_format: str) -> Optional[Tuple[int, int]]:
+    """
+    Читает ширину и высоту изображения из заголовка файла.
+
+    :param data: содержимое файла
+    :param media_format: формат файла (sniff_format)
+    :return: ширина и высота или None для неизвестного формата
+    """
+    if media_format == "png" and len(data) >= 24:
+        return struct.unpack_from(">II", data, 16)
+    if media_format == "gif" and len(data) >= 10:
+        return struct.unpack_from("<HH", data, 6)
+    if media_format == "bmp" and len(data) >= 26:
+        width, height = struct.unpack_from("<ii", data, 18)
+        return width, abs(height)
+    if media_format == "webp" and bytes(data[12:16]) == b"VP8X" and len(data) >= 30:
+        return (
+            int.from_bytes(data[24:27], "little") + 1,
+            int.from_bytes(data[27:30], "little") + 1,
+        )
+    if media_format == "jpeg":
+        return jpeg_dimensions(data)
+    return None
+
+
+def inspect_media(path: str, offset: int, length: int, sha256: str) -> Dict[str, Any]:
+    """
+    Проверяет контрольную сумму файла и извлекает его метаданные.
+
+    Файл отображается в память (mmap), поэтому читаются только страницы
+    диапазона медиа; диапазон нужен для блобов внутри сегментов.
+
+    :param path: абсолютный путь файла
+    :param offset: начало содержимого медиа в файле
+    :param length: размер медиа в байтах
+    :param sha256: ожидаемый SHA-256 содержимого (hex)
+    :return: формат, ширина, высота и размер файла
+    :raises ValueError: если SHA-256 файла не совпадает с ожидаемым
+    """
+    with open(path, mode="rb") as source:
+        if length == 0:
+            return describe(memoryview(b""), sha256)
+        with mmap.mmap(source.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            with memoryview(mapped) as mapped_view:
+                with mapped_view[offset:offset + length] as data:
+                    if len(data) != length:
+                        raise ValueError(
+                            "{path}: диапазон за концом файла".format(path=path),
+                        )
+                    return describe(data, sha256)
+
+
+def describe(data: memoryview, sha256: str) -> Dict[str, Any]:
+    if hashlib.sha256(data).hexdigest() != sha256:
+        raise ValueError("SHA-256 содержимого не совпадает")
+
+    media_format = sniff_format(bytes(data[:16]))
+    size_px = dimensions(data, media_format)
+    return {
+        "format": media_format,
+        "width": size_px[0] if size_px else None,
+        "height": size_px[1] if size_px else None,
+        "size": len(data),
+    }
@@ -0,0 +1,214 @@
+"""
+Ответы с содержимым медиа: условные запросы (ETag), диапазоны (Range) и
+передача файла nginx (X-Accel-Redirect).
+"""
+import mimetypes
+import re
+from pathlib import Path
+from typing import Dict, Optional
+
+import anyio
+from fastapi import Request, Response, status
+from starlette.types import Receive, Scope, Send
+
+from app.config import settings
+
+RANGE_PATTERN = re.compile(r"bytes=(\d*)-(\d*)")
+ZEROCOPY = "http.response.zerocopy"
+# Типы, которые отдаются для показа в браузере. Остальные файлы (в том
+# числе HTML и SVG с активным содержимым) отдаются как вложение.
+INLINE_MEDIA_TYPES = frozenset((
+    "image/bmp",
+    "image/gif",
+    "image/jpeg",
+    "image/png",
+    "image/webp",
+))
+
+
+def requested_range(header: Optional[str], size: int) -> Optional[range]:
+    """
+    Разбирает заголовок Range с одним диапазоном байтов.
+
+    Несколько диапазонов и некорректный заголовок игнорируются: в этом
+    случае отдается весь файл.
+
+    :param header: значение заголовка Range
+    :param size: размер медиа в байтах
+    :return: диапазон байтов, пустой диапазон, если он за концом файла,
+        или None, если нужно отдать весь файл
+    """
+    matched = RANGE_PATTERN.fullmatch(header.strip()) if header else None
+    if matched is None or matched.group(1) == matched.group(2) == "":
+        return None
+
+    first, last = matched.groups()
+    if first == "":
+        return range(max(size - int(last), 0), size) if int(last) else range(0)
+    if last != "" and int(last) < int(first):
+        return None
+    if int(first) >= size:
+        return range(0)
+    return range(int(first), min(int(last) + 1, size) if last else size)
+
+
+def etag_matches(header: Optional[str], etag: str) -> bool:
+    """
+    Проверяет заголовок If-None-Match (слабое сравнение).
+
+    :param header: значение заголовка If-None-Match
+    :param etag: ETag медиа
+    :return: True, если у клиента актуальная копия
+    """
+    if not header:
+        return False
+    if header.strip() == "*":
+        return True
+    return etag in (
+        tag.strip().removeprefix("W/") for tag in header.split(",")
+    )
+
+
+class MediaFileResponse(Response):
+    """
+    Диапазон байтов файла в теле ответа.
+
+    Если сервер ASGI поддерживает расширение http.response.zerocopy,
+    файл передается ему (sendfile), иначе читается частями по
+    media_chunk_size.
+    """
+
+    def __init__(
+            self,
+            path: Path,
+            offset: int,
+            length: int,
+            status_code: int,
+            headers: Dict[str, str],
+            media_type: str,
+    ) -> None:
+        self.path = path
+        self.offset = offset
+        self.length = length
+        self.status_code = status_code
+        self.media_type = media_type
+        self.background = None
+        self.body = b""
+        self.init_headers({**headers, "content-length": str(length)})
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        await send({
+            "type": "http.response.start",
+            "status": self.status_code,
+            "headers": self.raw_headers,
+        })
+        if ZEROCOPY in scope.get("extensions", {}):
+            with open(self.path, mode="rb") as source:
+                await send({
+                    "type": ZEROCOPY,
+                    "file": source,
+                    "offset": self.offset,
+                    "count": self.length,
+                    "more_body": False,
+                })
+            return
+
+        async with await anyio.open_file(self.path, mode="rb") as source:
+            await source.seek(self.offset)
+            remaining = self.length
+            while remaining > 0:
+                chunk = await source.read(min(settings.media_chunk_size, remaining))
+                if not chunk:
+                    break
+                remaining -= len(chunk)
+                await send({
+                    "type": "http.response.body",
+                    "body": chunk,
+                    "more_body": True,
+                })
+        await send({"type": "http.response.body", "body": b"", "more_body": False})
+
+
+def media_response(
+        request: Request,
+        path: Path,
+        offset: int,
+        length: int,
+        file_name: str,
+        etag: Optional[str],
+        accel_path: Optional[str] = None,
+) -> Response:
+    """
+    Ответ с содержимым медиа с учетом If-None-Match, Range и If-Range.
+
+    Тип содержимого определяется по расширению загруженного файла, поэтому
+    для показа в браузере отдаются только изображения из
+    INLINE_MEDIA_TYPES, остальные файлы - как вложение
+    application/octet-stream; заголовок nosniff запрещает браузеру
+    определять тип самому.
+
+    :param request: запрос
+    :param path: файл с содержимым медиа
+    :param offset: начало содержимого в файле
+    :param length: размер медиа в байтах
+    :param file_name: имя файла медиа (для Content-Type)
+    :param etag: ETag медиа или None, если хеш содержимого неизвестен
+    :param accel_path: внутренний адрес файла в nginx; если указан, файл
+        отдает nginx (X-Accel-Redirect)
+    :return: ответ 200, 206, 304 или 416
+    """
+    media_type = mimetypes.guess_type(file_name)[0] or "application/octet-stream"
+    headers = {
+        "accept-ranges": "bytes",
+        "cache-control": "public, max-age={max_age}".format(
+            max_age=settings.media_cache_max_age,
+        ),
+        "x-content-type-options": "nosniff",
+    }
+    if media_type not in INLINE_MEDIA_TYPES:
+        media_type = "application/octet-stream"
+        headers["content-disposition"] = "attachment"
+    if etag is not None:
+        headers["etag"] = etag
+        if etag_matches(request.headers.get("if-none-match"), etag):
+            return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+
+    if accel_path is not None:
+        # Range и If-Range обрабатывает nginx.
+        headers["x-accel-redirect"] = accel_path
+        return Response(headers=headers, media_type=media_type)
+
+    byte_range = None
+    if_range = request.headers.get("if-range")
+    if if_range is None or if_range.strip() == etag:
+        byte_range = requested_range(request.headers.get("range"), length)
+
+    if byte_range is None:
+        return MediaFileResponse(
+            path,
+            offset,
+            length,
+            status.HTTP_200_OK,
+            headers,
+            media_type,
+        )
+    if not byte_range:
+        headers["content-range"] = "bytes */{size}".format(size=length)
+        return Response(
+            status_code=status.HTTP_416_REQUESTED_RANGE_NOT_SATISFIABLE,
+            headers=headers,
+        )
+
+    headers["content-range"] = "bytes {first}-{last}/{size}".format(
+        first=byte_range.start,
+        last=byte_range.stop - 1,
+        size=length,
+    )
+    return MediaFileResponse(
+        path,
+        offset + byte_range.start,
+        len(byte_range),
+        status.HTTP_206_PARTIAL_CONTENT,
+        headers,
+        media_type,
+    )
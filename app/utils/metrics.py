@@ -0,0 +1,176 @@
+import os
+import time
+from typing import Any, Awaitable, Callable, Tuple
+
+from fastapi import Request, Response
+from prometheus_client import (
+    CONTENT_TYPE_LATEST,
+    REGISTRY,
+    CollectorRegistry,
+    Counter,
+    Gauge,
+    Histogram,
+    generate_latest,
+    multiprocess,
+)
+from sqlalchemy import event
+from sqlalchemy.pool import Pool
+from starlette.routing import Match
+
+MULTIPROC_DIR_ENV = "PROMETHEUS_MULTIPROC_DIR"
+
+REQUEST_LATENCY = Histogram(
+    "http_request_duration_seconds",
+    "Время обработки HTTP запроса.",
+    ["method", "route", "status"],
+)
+REQUESTS_IN_PROGRESS = Gauge(
+    "http_requests_in_progress",
+    "Количество обрабатываемых HTTP запросов.",
+    ["method"],
+    multiprocess_mode="livesum",
+)
+APP_ERRORS = Counter(
+    "app_errors_total",
+    "Ошибки AppExcept, возвращенные клиенту, по типу.",
+    ["mtype"],
+)
+CACHE_REQUESTS = Counter(
+    "cache_requests_total",
+    "Обращения к кэшам: result=hit|miss (hit ratio = hit / все обращения).",
+    ["cache", "result"],
+)
+CACHE_REMOVALS = Counter(
+    "cache_removals_total",
+    "Записи, удаленные из кэшей: reason=evicted|expired.",
+    ["cache", "reason"],
+)
+MEDIA_JOBS = Counter(
+    "media_jobs_total",
+    "Задачи обработки медиа: result=done|retry|failed.",
+    ["result"],
+)
+MEDIA_RECLAIMED_FILES = Counter(
+    "media_reclaimed_files_total",
+    "Удаленные файлы медиа и сегменты: reason=tweet|orphan|unused|temp|compact.",
+    ["reason"],
+)
+MEDIA_RECLAIMED_BYTES = Counter(
+    "media_reclaimed_bytes_total",
+    "Место на диске, освобожденное удалением файлов медиа.",
+    ["reason"],
+)
+DB_POOL_SIZE = Gauge(
+    "db_pool_size",
+    "Размер пула соединений с базой.",
+    multiprocess_mode="livesum",
+)
+DB_POOL_CHECKED_OUT = Gauge(
+    "db_pool_checked_out",
+    "Соединения, выданные из пула.",
+    multiprocess_mode="livesum",
+)
+DB_POOL_OVERFLOW = Gauge(
+    "db_pool_overflow",
+    "Соединения сверх размера пула (отрицательное - свободные слоты пула).",
+    multiprocess_mode="livesum",
+)
+
+
+def route_template(request: Request) -> str:
+    """
+    Возвращает шаблон маршрута запроса, например /api/tweets/{tweet_id}/likes.
+
+    Метки метрик строятся по шаблону, а не по пути, чтобы количество рядов
+    не зависело от ID в URL.
+
+    :param request: HTTP запрос
+    :return: шаблон маршрута или "unmatched"
+    """
+    for route in request.app.routes:
+        match, _ = route.matches(request.scope)
+        if match == Match.FULL:
+            return route.path
+    return "unmatched"
+
+
+async def record_request_metrics(
+        request: Request,
+        call_next: Callable[[Request], Awaitable[Response]],
+) -> Response:
+    """
+    Middleware: время обработки и количество запросов в обработке.
+
+    :param request: HTTP запрос
+    :param call_next: следующий обработчик
+    :return: HTTP ответ
+    """
+    in_progress = REQUESTS_IN_PROGRESS.labels(request.method)
+    in_progress.inc()
+    started_at = time.perf_counter()
+    status = 500
+    try:
+        response = await call_next(request)
+        status = response.status_code
+    finally:
+        in_progress.dec()
+        REQUEST_LATENCY.labels(
+            request.method,
+            route_template(request),
+            str(status),
+        ).observe(time.perf_counter() - started_at)
+
+    return response
+
+
+def instrument_pool(pool: Pool) -> None:
+    """
+    Подключает метрики пула соединений.
+
+    :param pool: пул синхронного движка (AsyncEngine.sync_engine.pool)
+    """
+    size = getattr(pool, "size", None)
+    if size is not None:
+        DB_POOL_SIZE.set(size())
+
+    def on_checkout(*args: Any) -> None:
+        DB_POOL_CHECKED_OUT.inc()
+        _set_overflow(pool)
+
+    def on_checkin(*args: Any) -> None:
+        DB_POOL_CHECKED_OUT.dec()
+        _set_overflow(pool)
+
+    event.listen(pool, "checkout", on_checkout)
+    event.listen(pool, "checkin", on_checkin)
+
+
+def _set_overflow(pool: Pool) -> None:
+    overflow = getattr(pool, "overflow", None)
+    if overflow is not None:
+        DB_POOL_OVERFLOW.set(overflow())
+
+
+def render_metrics() -> Tuple[bytes, str]:
+    """
+    Собирает метрики в текстовом формате Prometheus.
+
+    Если задана переменная окружения PROMETHEUS_MULTIPROC_DIR (несколько
+    воркеров uvicorn), метрики всех процессов собираются из файлов
+    этого каталога.
+
+    :return: тело ответа и его Content-Type
+    """
+    if os.environ.get(MULTIPROC_DIR_ENV):
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = REGISTRY
+
+    return generate_latest(registry), CONTENT_TYPE_LATEST
+
+
+def mark_process_dead() -> None:
+    """Удаляет live-метрики завершающегося воркера (multiprocess режим)."""
+    if os.environ.get(MULTIPROC_DIR_ENV):
+        multiprocess.mark_process_dead(os.getpid())
@@ -0,0 +1,68 @@
+import base64
+import binascii
+from datetime import datetime
+from typing import Tuple
+
+from app.utils.errors import AppExcept
+
+CURSOR_SEPARATOR = "|"
+
+
+def encode_cursor(created_at: datetime, row_id: int) -> str:
+    """
+    Кодирует позицию ленты (created_at, id) в непрозрачный курсор.
+
+    :param created_at: дата создания последней записи страницы
+    :param row_id: ID последней записи страницы
+    :return: курсор в виде urlsafe base64 строки
+    """
+    raw = "{created_at}{sep}{row_id}".format(
+        created_at=created_at.isoformat(),
+        sep=CURSOR_SEPARATOR,
+        row_id=row_id,
+    )
+    return base64.urlsafe_b64encode(raw.encode("utf-8")).decode("ascii")
+
+
+def decode_cursor(cursor: str) -> Tuple[datetime, int]:
+    """
+    Декодирует курсор, полученный от клиента.
+
+    :param cursor: курсор из параметра запроса
+    :return: кортеж (created_at, id)
+    """
+    try:
+        raw = base64.urlsafe_b64decode(cursor.encode("ascii")).decode("utf-8")
+        created_at, row_id = raw.rsplit(CURSOR_SEPARATOR, 1)
+        return datetime.fromisoformat(created_at), int(row_id)
+    except (binascii.Error, UnicodeError, ValueError):
+        raise AppExcept(
+            "Invalid cursor",
+            "Некорректный курсор пагинации",
+        )
+
+
+def encode_id_cursor(row_id: int) -> str:
+    """
+    Кодирует позицию списка, упорядоченного только по id, в курсор.
+
+    :param row_id: ID последней записи страницы
+    :return: курсор в виде urlsafe base64 строки
+    """
+    return base64.urlsafe_b64encode(str(row_id).encode("ascii")).decode("ascii")
+
+
+def decode_id_cursor(cursor: str) -> int:
+    """
+    Декодирует курсор, созданный encode_id_cursor.
+
+    :param cursor: курсор из параметра запроса
+    :return: ID последней записи предыдущей страницы
+    """
+    try:
+        return int(base64.urlsafe_b64decode(cursor.encode("ascii")))
+    except (binascii.Error, UnicodeError, ValueError):
+        raise AppExcept(
+            "Invalid cursor",
+            "Некорректный курсор пагинации",
+        )
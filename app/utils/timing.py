@@ -0,0 +1,29 @@
+import time
+from contextlib import contextmanager
+from typing import Dict, Iterator
+
+startup_timings: Dict[str, float] = {}
+
+
+@contextmanager
+def timed(stage: str) -> Iterator[None]:
+    """
+    Запоминает длительность этапа запуска приложения в миллисекундах.
+
+    Повторные замеры этапа суммируются.
+
+    :param stage: название этапа
+    """
+    started_at = time.perf_counter()
+    try:
+        yield
+    finally:
+        duration = (time.perf_counter() - started_at) * 1000
+        startup_timings[stage] = startup_timings.get(stage, 0.0) + duration
+
+
+def format_timings(timings: Dict[str, float]) -> str:
+    return ", ".join(
+        "{stage} {duration:.1f} мс".format(stage=stage, duration=duration)
+        for stage, duration in timings.items()
+    )
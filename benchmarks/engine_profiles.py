@@ -0,0 +1,149 @@
+"""
+Нагрузочный бенчмарк профилей движка базы данных.
+
+Для каждого пресета создается отдельный движок (engine_options с
+переопределенными настройками db_*), после чего --concurrency задач
+выполняют --requests запросов чтения ленты: аутентификация по api-key,
+ключи страницы домашней ленты и загрузка твитов страницы. Для пресета
+считается пропускная способность (запросов в секунду) и задержки.
+
+Бенчмарк только читает данные; пользователь с --api-key должен
+существовать (например, после python initial_data.py). Пресет legacy
+пишет SQL в stdout (echo=True), поэтому отчет удобнее сохранять в файл
+(--output).
+
+Пресеты:
+    legacy - прежняя конфигурация: echo=True, пул по умолчанию;
+    production - значения db_* по умолчанию;
+    no_statement_cache - production без кэша подготовленных запросов;
+    pgbouncer - NullPool и выключенные подготовленные запросы.
+
+Пример запуска::
+
+    python -m benchmarks.engine_profiles --requests 2000 --concurrency 20 \\
+        --output engine_profiles.json
+"""
+import argparse
+import asyncio
+import json
+import statistics
+import time
+from typing import Any, Dict, List
+
+from jose import jwt
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+from sqlalchemy.orm import sessionmaker
+
+from app.config import settings
+from app.crud.tweet import TweetService
+from app.crud.user import UserService
+from app.db.database import engine_options
+
+PRESETS: Dict[str, Dict[str, Any]] = {
+    "legacy": {
+        "db_echo": True,
+        "db_pool_size": 5,
+        "db_max_overflow": 10,
+        "db_pool_recycle": -1,
+        "db_pool_pre_ping": False,
+    },
+    "production": {},
+    "no_statement_cache": {"db_statement_cache_size": 0},
+    "pgbouncer": {"db_pgbouncer_mode": True},
+}
+
+
+def percentile(samples: List[float], rank: float) -> float:
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * rank))]
+
+
+async def read_feed(session_factory: sessionmaker, api_token: str) -> None:
+    async with session_factory() as session:
+        principal = await UserService(session).get_principal_by_token(api_token)
+        service = TweetService(session)
+        tweet_ids, _ = await service.get_home_timeline_ids(
+            principal.id,
+            settings.tweets_page_size,
+        )
+        await service.get_tweets_by_ids(tweet_ids)
+
+
+async def run_preset(
+        overrides: Dict[str, Any],
+        args: argparse.Namespace,
+) -> Dict[str, Any]:
+    """
+    Прогоняет нагрузку на движке с настройками пресета.
+
+    :param overrides: переопределения настроек db_*
+    :param args: параметры бенчмарка
+    :return: пропускная способность и задержки
+    """
+    engine = create_async_engine(
+        settings.async_db_uri,
+        **engine_options(settings.copy(update=overrides)),
+    )
+    session_factory = sessionmaker(
+        engine,
+        expire_on_commit=False,
+        class_=AsyncSession,
+    )
+    api_token = jwt.encode(
+        claims={"api-key": args.api_key},
+        key=settings.secret_key,
+        algorithm=settings.algorithm,
+    )
+    latencies: List[float] = []
+    remaining = iter(range(args.requests))
+
+    async def worker() -> None:
+        for _ in remaining:
+            started = time.perf_counter()
+            await read_feed(session_factory, api_token)
+            latencies.append(time.perf_counter() - started)
+
+    await read_feed(session_factory, api_token)
+    started = time.perf_counter()
+    await asyncio.gather(*[worker() for _ in range(args.concurrency)])
+    elapsed = time.perf_counter() - started
+    await engine.dispose()
+
+    return {
+        "requests_per_second": args.requests / elapsed,
+        "latency_ms_p50": statistics.median(latencies) * 1000,
+        "latency_ms_p99": percentile(latencies, 0.99) * 1000,
+    }
+
+
+async def run(args: argparse.Namespace) -> Dict[str, Any]:
+    presets = args.presets or list(PRESETS)
+    return {
+        "requests": args.requests,
+        "concurrency": args.concurrency,
+        "presets": {
+            name: await run_preset(PRESETS[name], args)
+            for name in presets
+        },
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=20)
+    parser.add_argument("--api-key", default="test")
+    parser.add_argument("--presets", nargs="*", choices=list(PRESETS))
+    parser.add_argument("--output", help="файл для отчета (по умолчанию stdout)")
+    args = parser.parse_args()
+
+    report = json.dumps(asyncio.run(run(args)), indent=2)
+    if args.output is None:
+        print(report)
+    else:
+        with open(args.output, mode="w", encoding="utf-8") as output:
+            output.write(report)
+
+
+if __name__ == "__main__":
+    main()
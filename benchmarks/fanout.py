@@ -0,0 +1,164 @@
+"""
+Бенчмарк гибридной рассылки твитов на синтетическом графе подписок.
+
+Граф подписок со степенным распределением популярности авторов
+создается в базе генератором benchmarks.social_graph, домашние ленты
+заполняются по порогу --threshold (fanout_follower_threshold). Считается
+усиление записи (сколько строк home_timeline пишется на один твит) и
+задержка чтения страницы ленты (TimelineService.get_page_keys: входящая
+лента и LATERAL-запрос к авторам с большим числом подписчиков) для
+случайных читателей. После теста сгенерированные данные удаляются
+(кроме запуска с --keep-data).
+
+Пример запуска::
+
+    python -m benchmarks.fanout --users 20000 --threshold 1000 2>/dev/null
+"""
+import argparse
+import asyncio
+import json
+import random
+import statistics
+import time
+from collections import defaultdict
+from typing import Any, Dict, List
+
+from app.bulk_data import connect
+from app.config import settings
+from app.crud.timeline import TimelineService, is_high_fanout
+from app.db.database import async_session, engine
+from benchmarks.social_graph import Dataset, generate, remove
+
+
+def percentile(samples: List[float], rank: float) -> float:
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * rank))]
+
+
+async def measure_reads(
+        dataset: Dataset,
+        reads: int,
+        page: int,
+        rnd: random.Random,
+) -> List[float]:
+    """
+    Читает страницы домашних лент случайных пользователей.
+
+    :param dataset: сгенерированные данные
+    :param reads: количество чтений
+    :param page: размер страницы
+    :param rnd: генератор случайных чисел
+    :return: задержки чтений в миллисекундах
+    """
+    read_ms: List[float] = []
+    async with async_session() as session:
+        service = TimelineService(session)
+        # Первое чтение открывает соединение и в замер не входит.
+        await service.get_page_keys(dataset.user_ids[0], page)
+        for _ in range(reads):
+            reader_id = rnd.choice(dataset.user_ids)
+            started = time.perf_counter()
+            await service.get_page_keys(reader_id, page)
+            read_ms.append((time.perf_counter() - started) * 1000)
+
+    return read_ms
+
+
+async def measure(args: argparse.Namespace, rnd: random.Random) -> Dict[str, Any]:
+    conn = await connect()
+    dataset = await generate(conn, args, rnd)
+    try:
+        followers_count: Dict[int, int] = dict(await conn.fetch(
+            'SELECT id, followers_count FROM "user" WHERE id = ANY($1::int[])',
+            dataset.user_ids,
+        ))
+        tweet_fanout = [
+            followers_count[author_id]
+            for author_id in await conn.fetchval(
+                "SELECT array_agg(user_id) FROM tweet WHERE id = ANY($1::int[])",
+                dataset.tweet_ids,
+            ) or []
+        ]
+        read_ms = await measure_reads(dataset, args.reads, args.page, rnd)
+    finally:
+        if not args.keep_data:
+            await remove(conn, dataset)
+        await conn.close()
+
+    followees: Dict[int, List[int]] = defaultdict(list)
+    for reader_id, author_id in dataset.follows:
+        followees[reader_id].append(author_id)
+    pulled_authors = [
+        sum(1 for author_id in followees[reader_id] if is_high_fanout(
+            followers_count[author_id],
+        ))
+        for reader_id in dataset.user_ids
+    ]
+    push_writes = [1 + fanout for fanout in tweet_fanout] or [0]
+    hybrid_writes = [
+        1 + (0 if is_high_fanout(fanout) else fanout) for fanout in tweet_fanout
+    ] or [0]
+
+    return {
+        "users": len(dataset.user_ids),
+        "tweets": len(dataset.tweet_ids),
+        "threshold": args.threshold,
+        "max_followers": max(followers_count.values()),
+        "high_fanout_authors": sum(
+            1 for count in followers_count.values() if is_high_fanout(count)
+        ),
+        "write_amplification": {
+            "push_mean": statistics.mean(push_writes),
+            "push_max": max(push_writes),
+            "hybrid_mean": statistics.mean(hybrid_writes),
+            "hybrid_max": max(hybrid_writes),
+        },
+        "read": {
+            "pulled_authors_mean": statistics.mean(pulled_authors),
+            "pulled_authors_max": max(pulled_authors),
+            "page_p50_ms": percentile(read_ms, 0.5),
+            "page_p99_ms": percentile(read_ms, 0.99),
+            "budget_ms": args.budget_ms,
+            "within_budget": percentile(read_ms, 0.99) <= args.budget_ms,
+        },
+    }
+
+
+async def run(args: argparse.Namespace) -> Dict[str, Any]:
+    rnd = random.Random(args.seed)
+    # Порог читают генератор лент и get_page_keys; после теста он
+    # возвращается к настройке процесса.
+    threshold = settings.fanout_follower_threshold
+    settings.fanout_follower_threshold = args.threshold
+    try:
+        return await measure(args, rnd)
+    finally:
+        settings.fanout_follower_threshold = threshold
+        await engine.dispose()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--users", type=int, default=20000)
+    parser.add_argument("--follows-per-user", type=int, default=50)
+    parser.add_argument("--alpha", type=float, default=1.2)
+    parser.add_argument("--tweets-per-user", type=float, default=2.5)
+    parser.add_argument("--days", type=int, default=30)
+    parser.add_argument("--reads", type=int, default=2000)
+    parser.add_argument("--page", type=int, default=settings.tweets_page_size)
+    parser.add_argument(
+        "--threshold",
+        type=int,
+        default=settings.fanout_follower_threshold,
+    )
+    parser.add_argument("--budget-ms", type=float, default=5.0)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--keep-data", action="store_true")
+    # Лайки и медиа на ленту не влияют и не генерируются.
+    parser.set_defaults(likes_per_tweet=0, zipf_exponent=1.0, media_ratio=0.0)
+
+    print(json.dumps(asyncio.run(run(parser.parse_args())), indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,215 @@
+"""
+Бенчмарк сборки JSON ленты: ORM + to_json против json_agg в Postgres.
+
+Данные (пользователь, его домашняя лента и лайки) создаются внутри
+транзакции, которая откатывается в конце, поэтому база не меняется.
+Для каждого режима измеряется процессорное время и время ответа на
+запрос, а также пиковая память (tracemalloc) одного запроса.
+
+Режимы:
+    legacy - get_all_tweets + to_json по всей таблице (прежний путь);
+    orm - страница домашней ленты через ORM, to_json и TweetsOut;
+    sql - страница домашней ленты, собранная в базе (FEED_JSON_QUERY).
+
+Пример запуска::
+
+    python -m benchmarks.feed_json --tweets 2000 --limit 100
+"""
+import argparse
+import asyncio
+import json
+import random
+import statistics
+import time
+import tracemalloc
+from typing import Any, Awaitable, Callable, Dict, List
+
+from jose import jwt
+from sqlalchemy import insert, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.config import settings
+from app.crud.tweet import TweetService
+from app.db.database import engine
+from app.db.models import HomeTimeline, Tweet, TweetLikes, User
+from app.schema.schemas import TweetsOut
+
+Render = Callable[[], Awaitable[bytes]]
+
+INSERT_CHUNK = 1000
+
+
+async def insert_rows(session: AsyncSession, model: Any, rows: List[Dict]) -> None:
+    for start in range(0, len(rows), INSERT_CHUNK):
+        await session.execute(insert(model).values(rows[start:start + INSERT_CHUNK]))
+
+
+async def seed(session: AsyncSession, args: argparse.Namespace) -> int:
+    """
+    Создает пользователя с домашней лентой из args.tweets твитов.
+
+    :param session: сессия внутри откатываемой транзакции
+    :param args: параметры бенчмарка
+    :return: ID пользователя, чья лента измеряется
+    """
+    rnd = random.Random(args.seed)
+    user_ids = (await session.execute(
+        insert(User).values([
+            {
+                "username": "bench_feed_{number}".format(number=number),
+                "api_token": jwt.encode(
+                    claims={"api-key": "bench_feed_{number}".format(number=number)},
+                    key=settings.secret_key,
+                    algorithm=settings.algorithm,
+                ),
+            }
+            for number in range(args.likers + 1)
+        ]).returning(User.id),
+    )).scalars().all()
+    reader_id = user_ids[0]
+
+    likers = [
+        rnd.sample(user_ids, rnd.randint(0, args.max_likes))
+        for _ in range(args.tweets)
+    ]
+    tweets = []
+    for start in range(0, args.tweets, INSERT_CHUNK):
+        tweets += (await session.execute(
+            insert(Tweet).values([
+                {
+                    "content": "Твит для бенчмарка {number}".format(number=number),
+                    "user_id": rnd.choice(user_ids),
+                    "like_count": len(likers[number]),
+                }
+                for number in range(start, min(args.tweets, start + INSERT_CHUNK))
+            ]).returning(Tweet.id, Tweet.user_id, Tweet.created_at),
+        )).all()
+
+    await insert_rows(session, HomeTimeline, [
+        {
+            "user_id": reader_id,
+            "tweet_id": tweet.id,
+            "author_id": tweet.user_id,
+            "created_at": tweet.created_at,
+        }
+        for tweet in tweets
+    ])
+    await insert_rows(session, TweetLikes, [
+        {"tweet_id": tweet.id, "user_id": liker_id}
+        for tweet, tweet_likers in zip(tweets, likers)
+        for liker_id in tweet_likers
+    ])
+
+    return reader_id
+
+
+async def measure(
+        session: AsyncSession,
+        render: Render,
+        iterations: int,
+) -> Dict[str, Any]:
+    cpu_ms: List[float] = []
+    wall_ms: List[float] = []
+    body = b""
+
+    for _ in range(iterations):
+        session.expunge_all()
+        cpu_started = time.process_time()
+        wall_started = time.perf_counter()
+        body = await render()
+        cpu_ms.append((time.process_time() - cpu_started) * 1000)
+        wall_ms.append((time.perf_counter() - wall_started) * 1000)
+
+    session.expunge_all()
+    tracemalloc.start()
+    await render()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return {
+        "cpu_ms_mean": statistics.mean(cpu_ms),
+        "wall_ms_p50": statistics.median(wall_ms),
+        "peak_memory_kib": peak / 1024,
+        "response_bytes": len(body),
+        "tweets": len(json.loads(body)["tweets"]),
+    }
+
+
+async def run(args: argparse.Namespace) -> Dict[str, Any]:
+    async with engine.connect() as conn:
+        transaction = await conn.begin()
+        session = AsyncSession(bind=conn, expire_on_commit=False)
+        reader_id = await seed(session, args)
+        reader_name = await session.scalar(
+            select(User.username).where(User.id == reader_id),
+        )
+        service = TweetService(session)
+
+        async def render_page(tweets: List[Tweet], next_cursor: Any) -> bytes:
+            tweets_json = await service.mark_liked_by_me(
+                await service.serialize_tweets(tweets),
+                reader_id,
+                reader_name,
+            )
+            return TweetsOut.parse_obj({
+                "result": True,
+                "tweets": tweets_json,
+                "next_cursor": next_cursor,
+            }).json().encode("utf-8")
+
+        async def render_legacy() -> bytes:
+            rows = await service.get_all_tweets()
+            return await render_page([row[0] for row in rows], None)
+
+        async def render_orm() -> bytes:
+            tweet_ids, next_cursor = await service.get_home_timeline_ids(
+                reader_id,
+                args.limit,
+            )
+            return await render_page(
+                await service.get_tweets_by_ids(tweet_ids),
+                next_cursor,
+            )
+
+        async def render_sql() -> bytes:
+            return await service.get_home_timeline_raw(
+                reader_id,
+                reader_name,
+                args.limit,
+            )
+
+        renders: Dict[str, Render] = {"orm": render_orm, "sql": render_sql}
+        if args.legacy:
+            renders["legacy"] = render_legacy
+
+        report = {
+            "tweets": args.tweets,
+            "limit": args.limit,
+            "iterations": args.iterations,
+            "modes": {
+                mode: await measure(session, render, args.iterations)
+                for mode, render in renders.items()
+            },
+        }
+        await session.close()
+        await transaction.rollback()
+
+    await engine.dispose()
+    return report
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--tweets", type=int, default=2000)
+    parser.add_argument("--likers", type=int, default=50)
+    parser.add_argument("--max-likes", type=int, default=20)
+    parser.add_argument("--limit", type=int, default=100)
+    parser.add_argument("--iterations", type=int, default=20)
+    parser.add_argument("--legacy", action="store_true")
+    parser.add_argument("--seed", type=int, default=42)
+
+    print(json.dumps(asyncio.run(run(parser.parse_args())), indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,301 @@
+"""
+Нагрузочный тест приложения на синтетическом социальном графе.
+
+Данные создаются генератором benchmarks.social_graph (степенное
+распределение подписчиков, лайки по Ципфу, медиа у части твитов), затем
+--concurrency задач выполняют --requests запросов к приложению в том же
+процессе (httpx + ASGI); обработчики startup и shutdown приложения
+запускаются, как в рабочем процессе, нагрузка начинается после прогрева.
+Операция каждого запроса выбирается по весам
+--mix, пользователь - по Ципфу (активные пользователи делают больше
+запросов). Лайки и подписки переключаются: если лайк уже стоит,
+выполняется отмена.
+
+Для каждой операции считаются RPS, задержки p50/p95/p99, доля ошибок и
+количество SQL запросов на запрос (по заголовку Server-Timing). После
+теста сгенерированные данные удаляются (кроме запуска с --keep-data).
+Консольные логи идут в stderr, поэтому его удобно отбросить::
+
+    python -m benchmarks.load_test --users 2000 --requests 5000 \\
+        --output load_test.json 2>/dev/null
+"""
+import argparse
+import asyncio
+import json
+import random
+import re
+import statistics
+import time
+from collections import defaultdict
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+from httpx import AsyncClient, Response
+
+from app.bulk_data import connect
+from app.crud.warmup import warmup
+from app.db.database import engine
+from app.main import app
+from app.utils.cache import principal_cache
+from benchmarks.social_graph import Dataset, ZipfSampler, generate, remove
+
+DEFAULT_MIX = {
+    "feed": 55,
+    "me": 10,
+    "profile": 10,
+    "likes": 5,
+    "like": 12,
+    "post": 5,
+    "follow": 3,
+}
+SERVER_TIMING_QUERIES = re.compile(r'desc="(\d+) queries"')
+WARMUP_POLL_SECONDS = 0.1
+
+Operation = Callable[[random.Random, int], Awaitable[Tuple[str, Response]]]
+
+
+def percentile(samples: List[float], rank: float) -> float:
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * rank))]
+
+
+class Workload:
+    """Смешанная нагрузка чтения и записи от имени сгенерированных пользователей."""
+
+    def __init__(
+            self,
+            client: AsyncClient,
+            dataset: Dataset,
+            rnd: random.Random,
+    ) -> None:
+        self.client = client
+        self.dataset = dataset
+        self.users = ZipfSampler(
+            rnd.sample(dataset.user_ids, len(dataset.user_ids)),
+            1.0,
+        )
+        self.tweets = ZipfSampler(
+            rnd.sample(dataset.tweet_ids, len(dataset.tweet_ids)),
+            1.0,
+        )
+        self.authors = ZipfSampler(
+            rnd.sample(dataset.user_ids, len(dataset.user_ids)),
+            1.0,
+        )
+        self.operations: Dict[str, Operation] = {
+            "feed": self.feed,
+            "me": self.me,
+            "profile": self.profile,
+            "likes": self.likes,
+            "like": self.like,
+            "post": self.post,
+            "follow": self.follow,
+        }
+
+    def headers(self, user_id: int) -> Dict[str, str]:
+        return {"api-key": self.dataset.api_keys[user_id]}
+
+    async def feed(self, rnd: random.Random, user_id: int) -> Tuple[str, Response]:
+        return "GET /api/tweets", await self.client.get(
+            "/api/tweets",
+            headers=self.headers(user_id),
+        )
+
+    async def me(self, rnd: random.Random, user_id: int) -> Tuple[str, Response]:
+        return "GET /api/users/me", await self.client.get(
+            "/api/users/me",
+            headers=self.headers(user_id),
+        )
+
+    async def profile(self, rnd: random.Random, user_id: int) -> Tuple[str, Response]:
+        return "GET /api/users/{user_id}", await self.client.get(
+            "/api/users/{user_id}".format(user_id=self.authors.sample(rnd)[0]),
+            headers=self.headers(user_id),
+        )
+
+    async def likes(self, rnd: random.Random, user_id: int) -> Tuple[str, Response]:
+        return "GET /api/tweets/{tweet_id}/likes", await self.client.get(
+            "/api/tweets/{tweet_id}/likes".format(tweet_id=self.tweets.sample(rnd)[0]),
+            headers=self.headers(user_id),
+        )
+
+    async def like(self, rnd: random.Random, user_id: int) -> Tuple[str, Response]:
+        tweet_id = self.tweets.sample(rnd)[0]
+        url = "/api/tweets/{tweet_id}/likes".format(tweet_id=tweet_id)
+        key = (user_id, tweet_id)
+        if key in self.dataset.likes:
+            self.dataset.likes.discard(key)
+            return "DELETE /api/tweets/{tweet_id}/likes", await self.client.delete(
+                url,
+                headers=self.headers(user_id),
+            )
+        self.dataset.likes.add(key)
+        return "POST /api/tweets/{tweet_id}/likes", await self.client.post(
+            url,
+            headers=self.headers(user_id),
+        )
+
+    async def post(self, rnd: random.Random, user_id: int) -> Tuple[str, Response]:
+        return "POST /api/tweets", await self.client.post(
+            "/api/tweets",
+            json={"tweet_data": "Твит нагрузочного теста", "tweet_media_ids": []},
+            headers=self.headers(user_id),
+        )
+
+    async def follow(self, rnd: random.Random, user_id: int) -> Tuple[str, Response]:
+        author_id = self.authors.sample(rnd)[0]
+        key = (user_id, author_id)
+        if key in self.dataset.follows:
+            self.dataset.follows.discard(key)
+            return "DELETE /api/tweets/{user_id}/follow", await self.client.delete(
+                "/api/tweets/{user_id}/follow".format(user_id=author_id),
+                headers=self.headers(user_id),
+            )
+        self.dataset.follows.add(key)
+        return "DELETE /api/users/{user_id}/follow", await self.client.delete(
+            "/api/users/{user_id}/follow".format(user_id=author_id),
+            headers=self.headers(user_id),
+        )
+
+
+def summarize(
+        samples: List[Tuple[float, int, Optional[int]]],
+        elapsed: float,
+) -> Dict[str, Any]:
+    """
+    Сводка по запросам одной операции.
+
+    :param samples: (задержка в секундах, HTTP статус, SQL запросов)
+    :param elapsed: длительность теста в секундах
+    :return: RPS, задержки, ошибки и SQL запросы на запрос
+    """
+    latencies = [latency for latency, _, _ in samples]
+    queries = [count for _, _, count in samples if count is not None]
+    return {
+        "requests": len(samples),
+        "rps": len(samples) / elapsed,
+        "errors": sum(1 for _, status, _ in samples if status >= 400),
+        "latency_ms_p50": percentile(latencies, 0.5) * 1000,
+        "latency_ms_p95": percentile(latencies, 0.95) * 1000,
+        "latency_ms_p99": percentile(latencies, 0.99) * 1000,
+        "sql_per_request": statistics.mean(queries) if queries else None,
+    }
+
+
+async def drive(workload: Workload, args: argparse.Namespace) -> Dict[str, Any]:
+    """
+    Выполняет нагрузку и собирает статистику по операциям.
+
+    :param workload: нагрузка
+    :param args: параметры теста
+    :return: сводка по всем запросам и по каждой операции
+    """
+    mix = {**DEFAULT_MIX, **json.loads(args.mix)} if args.mix else DEFAULT_MIX
+    names = [name for name, weight in mix.items() if weight > 0]
+    weights = [mix[name] for name in names]
+    samples: Dict[str, List[Tuple[float, int, Optional[int]]]] = defaultdict(list)
+    remaining = iter(range(args.requests))
+
+    async def worker(seed: int) -> None:
+        rnd = random.Random(seed)
+        for _ in remaining:
+            name = rnd.choices(names, weights=weights)[0]
+            user_id = workload.users.sample(rnd)[0]
+            started = time.perf_counter()
+            endpoint, response = await workload.operations[name](rnd, user_id)
+            latency = time.perf_counter() - started
+            match = SERVER_TIMING_QUERIES.search(
+                response.headers.get("Server-Timing", ""),
+            )
+            samples[endpoint].append((
+                latency,
+                response.status_code,
+                int(match.group(1)) if match else None,
+            ))
+
+    started = time.perf_counter()
+    await asyncio.gather(*[
+        worker(args.seed + number) for number in range(args.concurrency)
+    ])
+    elapsed = time.perf_counter() - started
+
+    return {
+        "total": summarize(
+            [sample for endpoint in samples.values() for sample in endpoint],
+            elapsed,
+        ),
+        "endpoints": {
+            endpoint: summarize(endpoint_samples, elapsed)
+            for endpoint, endpoint_samples in sorted(samples.items())
+        },
+    }
+
+
+async def run(args: argparse.Namespace) -> Dict[str, Any]:
+    rnd = random.Random(args.seed)
+
+    conn = await connect()
+    started = time.perf_counter()
+    dataset = await generate(conn, args, rnd)
+    generated_in = time.perf_counter() - started
+
+    principal_cache.clear()
+    # AsyncClient не запускает обработчики startup/shutdown, а без них не
+    # работают буфер лайков, обработка и очистка медиа и прогрев.
+    await app.router.startup()
+    try:
+        while not warmup.ready:
+            await asyncio.sleep(WARMUP_POLL_SECONDS)
+        async with AsyncClient(app=app, base_url="http://benchmark") as client:
+            report = await drive(Workload(client, dataset, rnd), args)
+    finally:
+        # shutdown сбрасывает буфер лайков, поэтому данные удаляются после.
+        await app.router.shutdown()
+        if not args.keep_data:
+            await remove(conn, dataset)
+            principal_cache.clear()
+        await conn.close()
+
+    await engine.dispose()
+    return {
+        "config": {
+            "requests": args.requests,
+            "concurrency": args.concurrency,
+            "mix": {**DEFAULT_MIX, **json.loads(args.mix)} if args.mix else DEFAULT_MIX,
+            "seed": args.seed,
+        },
+        "data": {**dataset.to_json(), "generated_seconds": generated_in},
+        **report,
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--users", type=int, default=2000)
+    parser.add_argument("--follows-per-user", type=int, default=20)
+    parser.add_argument("--alpha", type=float, default=1.2)
+    parser.add_argument("--tweets-per-user", type=float, default=10)
+    parser.add_argument("--likes-per-tweet", type=int, default=3)
+    parser.add_argument("--zipf-exponent", type=float, default=1.1)
+    parser.add_argument("--media-ratio", type=float, default=0.2)
+    parser.add_argument("--days", type=int, default=30)
+    parser.add_argument("--requests", type=int, default=5000)
+    parser.add_argument("--concurrency", type=int, default=20)
+    parser.add_argument(
+        "--mix",
+        help='веса операций в JSON, например \'{"feed": 80, "post": 20}\'',
+    )
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--keep-data", action="store_true")
+    parser.add_argument("--output", help="файл для отчета (по умолчанию stdout)")
+    args = parser.parse_args()
+
+    report = json.dumps(asyncio.run(run(args)), indent=2)
+    if args.output is None:
+        print(report)
+    else:
+        with open(args.output, mode="w", encoding="utf-8") as output:
+            output.write(report)
+
+
+if __name__ == "__main__":
+    main()
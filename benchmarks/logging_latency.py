@@ -0,0 +1,111 @@
+"""
+Бенчмарк задержки запросов с записью логов в файл и без нее.
+
+Приложение вызывается в том же процессе (httpx + ASGI), --concurrency
+задач выполняют --requests запросов чтения ленты. Перед каждым режимом
+логирование перенастраивается через configure_logging с
+переопределенными настройками log_*; записи уходят в очередь, а в
+консоль и файл их пишет поток QueueListener.
+
+Режимы:
+    file_off - только консоль (log_file_enabled=False);
+    file_on - консоль и RotatingFileHandler (app/app_logs/main.log).
+
+Консольные записи идут в stderr, поэтому его удобно отбросить::
+
+    python -m benchmarks.logging_latency --requests 2000 2>/dev/null
+"""
+import argparse
+import asyncio
+import json
+import statistics
+import time
+from typing import Any, Dict, List
+
+from httpx import AsyncClient
+
+from app.config import settings
+from app.db.database import engine
+from app.main import app
+from app.utils.logger import configure_logging
+
+MODES: Dict[str, Dict[str, Any]] = {
+    "file_off": {"log_file_enabled": False},
+    "file_on": {"log_file_enabled": True},
+}
+
+
+def percentile(samples: List[float], rank: float) -> float:
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * rank))]
+
+
+async def run_mode(
+        client: AsyncClient,
+        overrides: Dict[str, Any],
+        args: argparse.Namespace,
+) -> Dict[str, Any]:
+    """
+    Прогоняет нагрузку с настройками логирования режима.
+
+    :param client: клиент приложения
+    :param overrides: переопределения настроек log_*
+    :param args: параметры бенчмарка
+    :return: задержки запросов
+    """
+    configure_logging(settings.copy(update={
+        "log_format": args.log_format,
+        **overrides,
+    }))
+    headers = {"api-key": args.api_key}
+    latencies: List[float] = []
+    remaining = iter(range(args.requests))
+
+    async def worker() -> None:
+        for _ in remaining:
+            started = time.perf_counter()
+            await client.get("/api/tweets", headers=headers)
+            latencies.append(time.perf_counter() - started)
+
+    await client.get("/api/tweets", headers=headers)
+    started = time.perf_counter()
+    await asyncio.gather(*[worker() for _ in range(args.concurrency)])
+    elapsed = time.perf_counter() - started
+
+    return {
+        "requests_per_second": args.requests / elapsed,
+        "latency_ms_p50": statistics.median(latencies) * 1000,
+        "latency_ms_p99": percentile(latencies, 0.99) * 1000,
+    }
+
+
+async def run(args: argparse.Namespace) -> Dict[str, Any]:
+    async with AsyncClient(app=app, base_url="http://benchmark") as client:
+        report = {
+            "requests": args.requests,
+            "concurrency": args.concurrency,
+            "log_format": args.log_format,
+            "modes": {
+                mode: await run_mode(client, overrides, args)
+                for mode, overrides in MODES.items()
+            },
+        }
+
+    configure_logging()
+    await engine.dispose()
+    return report
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=20)
+    parser.add_argument("--api-key", default="test")
+    parser.add_argument("--log-format", choices=["text", "json"], default="text")
+    args = parser.parse_args()
+
+    print(json.dumps(asyncio.run(run(args)), indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,295 @@
+"""
+Генератор синтетического социального графа для нагрузочных бенчмарков.
+
+Популярность авторов распределена по Парето (build_follow_graph), лайки
+распределены по твитам по закону Ципфа, часть твитов получает от одного
+до четырех медиа. Строки вставляются через COPY с заранее выбранными
+ID, после чего пересчитываются followers_count, like_count, домашние
+ленты и последовательности ID. Пользователи называются bench_<номер>,
+api-key совпадает с именем.
+"""
+import argparse
+import itertools
+import random
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, List, Sequence, Set, Tuple
+
+from asyncpg import Connection
+from jose import jwt
+
+from app.bulk_data import SERIAL_TABLES, rebuild_sequences
+from app.config import settings
+
+USER_PREFIX = "bench_"
+MAX_MEDIA_PER_TWEET = 4
+
+
+def build_follow_graph(
+        users: int,
+        follows_per_user: int,
+        alpha: float,
+        rnd: random.Random,
+) -> Dict[int, List[int]]:
+    """
+    Строит граф подписок: читатель -> список авторов.
+
+    :param users: количество пользователей
+    :param follows_per_user: среднее количество подписок пользователя
+    :param alpha: параметр распределения Парето для популярности авторов
+    :param rnd: генератор случайных чисел
+    :return: словарь подписок пользователей
+    """
+    popularity = [rnd.paretovariate(alpha) for _ in range(users)]
+    follows: Dict[int, List[int]] = {}
+
+    for user_id in range(users):
+        count = min(users - 1, max(1, int(rnd.expovariate(1 / follows_per_user))))
+        follows[user_id] = list(
+            set(rnd.choices(range(users), weights=popularity, k=count)) - {user_id},
+        )
+
+    return follows
+
+
+class ZipfSampler:
+    """Выбор элементов с вероятностью, обратной рангу в степени exponent."""
+
+    def __init__(self, items: Sequence[Any], exponent: float) -> None:
+        self.items = items
+        self.cum_weights = list(itertools.accumulate(
+            1 / (rank + 1) ** exponent for rank in range(len(items))
+        ))
+
+    def sample(self, rnd: random.Random, k: int = 1) -> List[Any]:
+        return rnd.choices(self.items, cum_weights=self.cum_weights, k=k)
+
+
+class Dataset:
+    """Сгенерированные данные, которые нужны нагрузочному тесту."""
+
+    def __init__(self) -> None:
+        self.user_ids: List[int] = []
+        self.api_keys: Dict[int, str] = {}
+        self.tweet_ids: List[int] = []
+        self.follows: Set[Tuple[int, int]] = set()
+        self.likes: Set[Tuple[int, int]] = set()
+        self.media = 0
+
+    def to_json(self) -> Dict[str, int]:
+        return {
+            "users": len(self.user_ids),
+            "follows": len(self.follows),
+            "tweets": len(self.tweet_ids),
+            "likes": len(self.likes),
+            "media": self.media,
+        }
+
+
+async def next_id(conn: Connection, table: str) -> int:
+    return await conn.fetchval(
+        'SELECT COALESCE(MAX(id), 0) + 1 FROM "{table}"'.format(table=table),
+    )
+
+
+async def generate(
+        conn: Connection,
+        args: argparse.Namespace,
+        rnd: random.Random,
+) -> Dataset:
+    """
+    Создает пользователей, подписки, твиты, медиа и лайки.
+
+    :param conn: соединение asyncpg
+    :param args: параметры генерации (users, follows_per_user, alpha,
+        tweets_per_user, likes_per_tweet, zipf_exponent, media_ratio)
+    :param rnd: генератор случайных чисел
+    :return: сгенерированные данные
+    """
+    dataset = Dataset()
+    now = datetime.now(timezone.utc)
+
+    first_user = await next_id(conn, "user")
+    dataset.user_ids = list(range(first_user, first_user + args.users))
+    users = []
+    for user_id in dataset.user_ids:
+        api_key = "{prefix}{number}".format(prefix=USER_PREFIX, number=user_id)
+        dataset.api_keys[user_id] = api_key
+        users.append((
+            user_id,
+            api_key,
+            jwt.encode(
+                claims={"api-key": api_key},
+                key=settings.secret_key,
+                algorithm=settings.algorithm,
+            ),
+        ))
+
+    graph = build_follow_graph(args.users, args.follows_per_user, args.alpha, rnd)
+    dataset.follows = {
+        (dataset.user_ids[reader], dataset.user_ids[author])
+        for reader, authors in graph.items()
+        for author in authors
+    }
+
+    first_tweet = await next_id(conn, "tweet")
+    tweets = []
+    for user_id in dataset.user_ids:
+        for _ in range(int(rnd.expovariate(1 / args.tweets_per_user))):
+            tweet_id = first_tweet + len(tweets)
+            tweets.append((
+                tweet_id,
+                "Твит {number} пользователя {user_id}".format(
+                    number=tweet_id,
+                    user_id=user_id,
+                ),
+                user_id,
+                now - timedelta(seconds=rnd.uniform(0, args.days * 86400)),
+            ))
+    dataset.tweet_ids = [tweet[0] for tweet in tweets]
+
+    popular_tweets = ZipfSampler(
+        rnd.sample(dataset.tweet_ids, len(dataset.tweet_ids)),
+        args.zipf_exponent,
+    )
+    likers = ZipfSampler(
+        rnd.sample(dataset.user_ids, len(dataset.user_ids)),
+        args.zipf_exponent,
+    )
+    if dataset.tweet_ids:
+        dataset.likes = set(zip(
+            likers.sample(rnd, len(dataset.tweet_ids) * args.likes_per_tweet),
+            popular_tweets.sample(rnd, len(dataset.tweet_ids) * args.likes_per_tweet),
+        ))
+
+    first_media = await next_id(conn, "media")
+    media = []
+    for tweet_id in dataset.tweet_ids:
+        if rnd.random() < args.media_ratio:
+            for _ in range(rnd.randint(1, MAX_MEDIA_PER_TWEET)):
+                media_id = first_media + len(media)
+                media.append((
+                    media_id,
+                    tweet_id,
+                    "images/bench_{media_id}.png".format(media_id=media_id),
+                ))
+    dataset.media = len(media)
+
+    async with conn.transaction():
+        await conn.copy_records_to_table(
+            "user",
+            records=users,
+            columns=["id", "username", "api_token"],
+        )
+        await conn.copy_records_to_table(
+            "followings",
+            records=list(dataset.follows),
+            columns=["user_id", "follows_user_id"],
+        )
+        await conn.copy_records_to_table(
+            "tweet",
+            records=tweets,
+            columns=["id", "content", "user_id", "created_at"],
+        )
+        await conn.copy_records_to_table(
+            "media",
+            records=media,
+            columns=["id", "tweet_id", "path_file"],
+        )
+        await conn.copy_records_to_table(
+            "tweet_likes",
+            records=list(dataset.likes),
+            columns=["user_id", "tweet_id"],
+        )
+        await update_counters(conn, dataset)
+        await rebuild_sequences(conn, SERIAL_TABLES)
+
+    return dataset
+
+
+async def update_counters(conn: Connection, dataset: Dataset) -> None:
+    """
+    Пересчитывает денормализованные счетчики и домашние ленты.
+
+    В ленты попадают собственные твиты пользователей и твиты авторов,
+    которых рассылает fan-out (не больше fanout_follower_threshold
+    подписчиков), как при обычной публикации.
+
+    :param conn: соединение asyncpg внутри транзакции генерации
+    :param dataset: сгенерированные данные
+    """
+    await conn.execute(
+        """
+        UPDATE "user" SET followers_count = counts.total
+        FROM (
+            SELECT follows_user_id, count(*) AS total FROM followings
+            WHERE follows_user_id = ANY($1::int[]) GROUP BY follows_user_id
+        ) AS counts
+        WHERE "user".id = counts.follows_user_id
+        """,
+        dataset.user_ids,
+    )
+    await conn.execute(
+        """
+        UPDATE tweet SET like_count = counts.total
+        FROM (
+            SELECT tweet_id, count(*) AS total FROM tweet_likes
+            WHERE tweet_id = ANY($1::int[]) GROUP BY tweet_id
+        ) AS counts
+        WHERE tweet.id = counts.tweet_id
+        """,
+        dataset.tweet_ids,
+    )
+    await conn.execute(
+        """
+        INSERT INTO home_timeline (user_id, tweet_id, author_id, created_at)
+        SELECT tweet.user_id, tweet.id, tweet.user_id, tweet.created_at
+        FROM tweet WHERE tweet.id = ANY($1::int[])
+        UNION ALL
+        SELECT followings.user_id, tweet.id, tweet.user_id, tweet.created_at
+        FROM tweet
+        JOIN followings ON followings.follows_user_id = tweet.user_id
+        JOIN "user" AS author ON author.id = tweet.user_id
+        WHERE tweet.id = ANY($1::int[]) AND author.followers_count <= $2
+        ON CONFLICT DO NOTHING
+        """,
+        dataset.tweet_ids,
+        settings.fanout_follower_threshold,
+    )
+
+
+async def remove(conn: Connection, dataset: Dataset) -> None:
+    """
+    Удаляет сгенерированных пользователей и все их данные.
+
+    Твиты, лайки и подписки, созданные во время нагрузки, тоже удаляются:
+    они принадлежат тем же пользователям. Последовательности ID
+    возвращаются на максимальный оставшийся ID.
+
+    :param conn: соединение asyncpg
+    :param dataset: сгенерированные данные
+    """
+    user_ids = dataset.user_ids
+    async with conn.transaction():
+        await conn.execute(
+            "DELETE FROM home_timeline WHERE user_id = ANY($1::int[]) "
+            "OR author_id = ANY($1::int[])",
+            user_ids,
+        )
+        await conn.execute(
+            "DELETE FROM tweet_likes WHERE user_id = ANY($1::int[]) OR tweet_id IN "
+            "(SELECT id FROM tweet WHERE user_id = ANY($1::int[]))",
+            user_ids,
+        )
+        await conn.execute(
+            "DELETE FROM media WHERE tweet_id IN "
+            "(SELECT id FROM tweet WHERE user_id = ANY($1::int[]))",
+            user_ids,
+        )
+        await conn.execute("DELETE FROM tweet WHERE user_id = ANY($1::int[])", user_ids)
+        await conn.execute(
+            "DELETE FROM followings WHERE user_id = ANY($1::int[]) "
+            "OR follows_user_id = ANY($1::int[])",
+            user_ids,
+        )
+        await conn.execute('DELETE FROM "user" WHERE id = ANY($1::int[])', user_ids)
+        await rebuild_sequences(conn, SERIAL_TABLES)
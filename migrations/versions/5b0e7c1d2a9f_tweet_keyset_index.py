@@ -0,0 +1,29 @@
+"""tweet_keyset_index
+
+Revision ID: 5b0e7c1d2a9f
+Revises: 3423b3aaf7f4
+Create Date: 2026-10-18 10:12:40.118520
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '5b0e7c1d2a9f'
+down_revision = '3423b3aaf7f4'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_index(
+        'ix_tweet_created_at_id',
+        'tweet',
+        [sa.text('created_at DESC'), sa.text('id DESC')],
+        unique=False,
+    )
+
+
+def downgrade() -> None:
+    op.drop_index('ix_tweet_created_at_id', table_name='tweet')
@@ -0,0 +1,79 @@
+"""home_timeline
+
+Revision ID: 8d41f2a6c3e7
+Revises: 5b0e7c1d2a9f
+Create Date: 2026-10-18 11:02:15.530214
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+# revision identifiers, used by Alembic.
+revision = '8d41f2a6c3e7'
+down_revision = '5b0e7c1d2a9f'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        'home_timeline',
+        sa.Column('user_id', sa.INTEGER(), nullable=False),
+        sa.Column('tweet_id', sa.INTEGER(), nullable=False),
+        sa.Column('author_id', sa.INTEGER(), nullable=False),
+        sa.Column(
+            'created_at',
+            postgresql.TIMESTAMP(timezone=True),
+            nullable=False,
+        ),
+        sa.ForeignKeyConstraint(
+            ['user_id'],
+            ['user.id'],
+            name='home_timeline_user_id_fkey',
+        ),
+        sa.ForeignKeyConstraint(
+            ['tweet_id'],
+            ['tweet.id'],
+            name='home_timeline_tweet_id_fkey',
+        ),
+        sa.ForeignKeyConstraint(
+            ['author_id'],
+            ['user.id'],
+            name='home_timeline_author_id_fkey',
+        ),
+        sa.PrimaryKeyConstraint('user_id', 'tweet_id', name='home_timeline_pkey'),
+    )
+    op.create_index(
+        'ix_home_timeline_user_created_at',
+        'home_timeline',
+        ['user_id', sa.text('created_at DESC'), sa.text('tweet_id DESC')],
+        unique=False,
+    )
+    op.create_index(
+        'ix_home_timeline_tweet_id',
+        'home_timeline',
+        ['tweet_id'],
+        unique=False,
+    )
+
+    # Existing tweets: every author sees own tweets, followers see the rest.
+    op.execute(
+        """
+        INSERT INTO home_timeline (user_id, tweet_id, author_id, created_at)
+        SELECT tweet.user_id, tweet.id, tweet.user_id, tweet.created_at
+        FROM tweet
+        WHERE tweet.user_id IS NOT NULL AND tweet.created_at IS NOT NULL
+        UNION
+        SELECT followings.user_id, tweet.id, tweet.user_id, tweet.created_at
+        FROM tweet
+        JOIN followings ON followings.follows_user_id = tweet.user_id
+        WHERE followings.user_id IS NOT NULL AND tweet.created_at IS NOT NULL
+        """
+    )
+
+
+def downgrade() -> None:
+    op.drop_index('ix_home_timeline_tweet_id', table_name='home_timeline')
+    op.drop_index('ix_home_timeline_user_created_at', table_name='home_timeline')
+    op.drop_table('home_timeline')
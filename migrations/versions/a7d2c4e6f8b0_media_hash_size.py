@@ -0,0 +1,28 @@
+"""media_hash_size
+
+Revision ID: a7d2c4e6f8b0
+Revises: f3c5d7e9a1b2
+Create Date: 2026-10-18 18:12:40.215903
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'a7d2c4e6f8b0'
+down_revision = 'f3c5d7e9a1b2'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    # Для уже загруженных файлов хеш и размер неизвестны, поэтому колонки
+    # допускают NULL.
+    op.add_column('media', sa.Column('sha256', sa.String(length=64), nullable=True))
+    op.add_column('media', sa.Column('size', sa.BigInteger(), nullable=True))
+
+
+def downgrade() -> None:
+    op.drop_column('media', 'size')
+    op.drop_column('media', 'sha256')
@@ -0,0 +1,93 @@
+"""media_blob
+
+Revision ID: b9e1f3a5c7d2
+Revises: a7d2c4e6f8b0
+Create Date: 2026-10-18 19:03:27.640118
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b9e1f3a5c7d2'
+down_revision = 'a7d2c4e6f8b0'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        'media_blob',
+        sa.Column('sha256', sa.String(length=64), nullable=False),
+        sa.Column('path_file', sa.Text(), nullable=False),
+        sa.Column('size', sa.BigInteger(), nullable=False),
+        sa.Column('ref_count', sa.Integer(), server_default='1', nullable=False),
+        sa.Column(
+            'created_at',
+            sa.DateTime(timezone=True),
+            server_default=sa.text('now()'),
+            nullable=True,
+        ),
+        sa.PrimaryKeyConstraint('sha256'),
+    )
+    op.create_table(
+        'media_file_cleanup',
+        sa.Column('path_file', sa.Text(), nullable=False),
+        sa.Column(
+            'created_at',
+            sa.DateTime(timezone=True),
+            server_default=sa.text('now()'),
+            nullable=True,
+        ),
+        sa.PrimaryKeyConstraint('path_file'),
+    )
+    # Загрузки после a7d2c4e6f8b0 уже хранят хеш. Для каждого хеша файлом
+    # блоба становится файл первой загрузки, остальные медиа переводятся
+    # на него. Прежние файлы не удаляются здесь: все ревизии выполняются в
+    # одной транзакции, и после отката строки ссылались бы на удаленные
+    # файлы. Пути записываются в media_file_cleanup, файлы удаляет
+    # MediaSweeper после фиксации.
+    op.execute(
+        """
+        INSERT INTO media_blob (sha256, path_file, size, ref_count)
+        SELECT DISTINCT ON (sha256) sha256, path_file, size,
+            count(*) OVER (PARTITION BY sha256)
+        FROM media
+        WHERE sha256 IS NOT NULL
+        ORDER BY sha256, id
+        """
+    )
+    op.execute(
+        """
+        WITH moved AS (
+            SELECT media.id, media.path_file AS old_path, blob.path_file
+            FROM media
+            JOIN media_blob AS blob ON blob.sha256 = media.sha256
+            WHERE media.path_file <> blob.path_file
+        ), updated AS (
+            UPDATE media SET path_file = moved.path_file
+            FROM moved
+            WHERE media.id = moved.id
+            RETURNING moved.old_path
+        )
+        INSERT INTO media_file_cleanup (path_file)
+        SELECT DISTINCT old_path FROM updated
+        WHERE old_path NOT IN (SELECT path_file FROM media_blob)
+        """
+    )
+    op.create_index('ix_media_sha256', 'media', ['sha256'], unique=False)
+    op.create_foreign_key(
+        'media_sha256_fkey',
+        'media',
+        'media_blob',
+        ['sha256'],
+        ['sha256'],
+    )
+
+
+def downgrade() -> None:
+    op.drop_constraint('media_sha256_fkey', 'media', type_='foreignkey')
+    op.drop_index('ix_media_sha256', table_name='media')
+    op.drop_table('media_file_cleanup')
+    op.drop_table('media_blob')
@@ -0,0 +1,46 @@
+"""hybrid_fanout
+
+Revision ID: c27a9e4b5f10
+Revises: 8d41f2a6c3e7
+Create Date: 2026-10-18 12:20:47.902611
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c27a9e4b5f10'
+down_revision = '8d41f2a6c3e7'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.add_column(
+        'user',
+        sa.Column('followers_count', sa.INTEGER(), server_default='0', nullable=False),
+    )
+    op.execute(
+        """
+        UPDATE "user"
+        SET followers_count = counts.total
+        FROM (
+            SELECT follows_user_id, count(*) AS total
+            FROM followings
+            GROUP BY follows_user_id
+        ) AS counts
+        WHERE counts.follows_user_id = "user".id
+        """
+    )
+    op.create_index(
+        'ix_tweet_user_created_at',
+        'tweet',
+        ['user_id', sa.text('created_at DESC'), sa.text('id DESC')],
+        unique=False,
+    )
+
+
+def downgrade() -> None:
+    op.drop_index('ix_tweet_user_created_at', table_name='tweet')
+    op.drop_column('user', 'followers_count')
@@ -0,0 +1,74 @@
+"""media_job
+
+Revision ID: c4f6a8b0d2e3
+Revises: b9e1f3a5c7d2
+Create Date: 2026-10-18 20:21:54.803377
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision = 'c4f6a8b0d2e3'
+down_revision = 'b9e1f3a5c7d2'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.add_column(
+        'media_blob',
+        sa.Column('meta', postgresql.JSONB(astext_type=sa.Text()), nullable=True),
+    )
+    op.create_table(
+        'media_job',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('sha256', sa.String(length=64), nullable=False),
+        sa.Column(
+            'status',
+            sa.String(length=16),
+            server_default='pending',
+            nullable=False,
+        ),
+        sa.Column('attempts', sa.Integer(), server_default='0', nullable=False),
+        sa.Column(
+            'run_after',
+            sa.DateTime(timezone=True),
+            server_default=sa.text('now()'),
+            nullable=False,
+        ),
+        sa.Column('last_error', sa.Text(), nullable=True),
+        sa.Column(
+            'created_at',
+            sa.DateTime(timezone=True),
+            server_default=sa.text('now()'),
+            nullable=True,
+        ),
+        sa.Column(
+            'updated_at',
+            sa.DateTime(timezone=True),
+            server_default=sa.text('now()'),
+            nullable=True,
+        ),
+        sa.ForeignKeyConstraint(['sha256'], ['media_blob.sha256'], ondelete='CASCADE'),
+        sa.PrimaryKeyConstraint('id'),
+    )
+    op.create_index('ix_media_job_sha256', 'media_job', ['sha256'], unique=False)
+    op.create_index(
+        'ix_media_job_run_after',
+        'media_job',
+        ['run_after'],
+        unique=False,
+        postgresql_where=sa.text("status IN ('pending', 'running')"),
+    )
+    # Уже загруженные блобы обрабатываются так же, как новые.
+    op.execute("INSERT INTO media_job (sha256) SELECT sha256 FROM media_blob")
+
+
+def downgrade() -> None:
+    op.drop_index('ix_media_job_run_after', table_name='media_job')
+    op.drop_index('ix_media_job_sha256', table_name='media_job')
+    op.drop_table('media_job')
+    op.drop_column('media_blob', 'meta')
@@ -0,0 +1,42 @@
+"""media_created_at
+
+Revision ID: d8a0c2e4f6b1
+Revises: c4f6a8b0d2e3
+Create Date: 2026-10-18 21:37:08.119264
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'd8a0c2e4f6b1'
+down_revision = 'c4f6a8b0d2e3'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    # Существующие медиа получают время миграции, поэтому непривязанные
+    # из них удаляются не раньше чем через media_orphan_ttl_seconds.
+    op.add_column(
+        'media',
+        sa.Column(
+            'created_at',
+            sa.DateTime(timezone=True),
+            server_default=sa.text('now()'),
+            nullable=True,
+        ),
+    )
+    op.create_index(
+        'ix_media_orphan_created_at',
+        'media',
+        ['created_at'],
+        unique=False,
+        postgresql_where=sa.text('tweet_id IS NULL'),
+    )
+
+
+def downgrade() -> None:
+    op.drop_index('ix_media_orphan_created_at', table_name='media')
+    op.drop_column('media', 'created_at')
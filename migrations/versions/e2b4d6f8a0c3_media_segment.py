@@ -0,0 +1,57 @@
+"""media_segment
+
+Revision ID: e2b4d6f8a0c3
+Revises: d8a0c2e4f6b1
+Create Date: 2026-10-18 22:48:31.502776
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e2b4d6f8a0c3'
+down_revision = 'd8a0c2e4f6b1'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        'media_segment',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('sealed', sa.Boolean(), server_default='false', nullable=False),
+        sa.Column(
+            'created_at',
+            sa.DateTime(timezone=True),
+            server_default=sa.text('now()'),
+            nullable=True,
+        ),
+        sa.PrimaryKeyConstraint('id'),
+    )
+    op.add_column('media_blob', sa.Column('segment_id', sa.Integer(), nullable=True))
+    op.add_column(
+        'media_blob',
+        sa.Column('segment_offset', sa.BigInteger(), nullable=True),
+    )
+    op.create_index(
+        'ix_media_blob_segment_id',
+        'media_blob',
+        ['segment_id'],
+        unique=False,
+    )
+    op.create_foreign_key(
+        'media_blob_segment_id_fkey',
+        'media_blob',
+        'media_segment',
+        ['segment_id'],
+        ['id'],
+    )
+
+
+def downgrade() -> None:
+    op.drop_constraint('media_blob_segment_id_fkey', 'media_blob', type_='foreignkey')
+    op.drop_index('ix_media_blob_segment_id', table_name='media_blob')
+    op.drop_column('media_blob', 'segment_offset')
+    op.drop_column('media_blob', 'segment_id')
+    op.drop_table('media_segment')
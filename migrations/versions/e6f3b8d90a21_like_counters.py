@@ -0,0 +1,67 @@
+"""like_counters
+
+Revision ID: e6f3b8d90a21
+Revises: c27a9e4b5f10
+Create Date: 2026-10-18 14:41:09.318077
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e6f3b8d90a21'
+down_revision = 'c27a9e4b5f10'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.execute(
+        """
+        DELETE FROM tweet_likes
+        WHERE id IN (
+            SELECT id FROM (
+                SELECT id, row_number() OVER (
+                    PARTITION BY tweet_id, user_id ORDER BY id
+                ) AS position
+                FROM tweet_likes
+            ) AS duplicates
+            WHERE duplicates.position > 1
+        )
+        """
+    )
+    op.create_unique_constraint(
+        'uq_tweet_likes_tweet_user',
+        'tweet_likes',
+        ['tweet_id', 'user_id'],
+    )
+    op.create_index(
+        'ix_tweet_likes_tweet_id_id',
+        'tweet_likes',
+        ['tweet_id', sa.text('id DESC')],
+        unique=False,
+    )
+
+    op.add_column(
+        'tweet',
+        sa.Column('like_count', sa.INTEGER(), server_default='0', nullable=False),
+    )
+    op.execute(
+        """
+        UPDATE tweet
+        SET like_count = counts.total
+        FROM (
+            SELECT tweet_id, count(*) AS total
+            FROM tweet_likes
+            GROUP BY tweet_id
+        ) AS counts
+        WHERE counts.tweet_id = tweet.id
+        """
+    )
+
+
+def downgrade() -> None:
+    op.drop_column('tweet', 'like_count')
+    op.drop_index('ix_tweet_likes_tweet_id_id', table_name='tweet_likes')
+    op.drop_constraint('uq_tweet_likes_tweet_user', 'tweet_likes', type_='unique')
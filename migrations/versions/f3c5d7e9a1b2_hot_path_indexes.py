@@ -0,0 +1,57 @@
+"""hot_path_indexes
+
+Revision ID: f3c5d7e9a1b2
+Revises: e6f3b8d90a21
+Create Date: 2026-10-18 16:05:12.447390
+
+"""
+from typing import List
+
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = 'f3c5d7e9a1b2'
+down_revision = 'e6f3b8d90a21'
+branch_labels = None
+depends_on = None
+
+INDEXES = (
+    ('ix_user_api_token', 'user', ['api_token']),
+    (
+        'ix_followings_user_id_follows_user_id',
+        'followings',
+        ['user_id', 'follows_user_id'],
+    ),
+    ('ix_followings_follows_user_id', 'followings', ['follows_user_id']),
+    ('ix_media_tweet_id', 'media', ['tweet_id']),
+)
+
+
+def create_index(name: str, table: str, columns: List[str]) -> None:
+    op.execute(
+        'CREATE INDEX CONCURRENTLY IF NOT EXISTS {name} ON "{table}" '
+        '({columns})'.format(name=name, table=table, columns=', '.join(columns))
+    )
+
+
+def drop_index(name: str) -> None:
+    op.execute('DROP INDEX CONCURRENTLY IF EXISTS {name}'.format(name=name))
+
+
+def upgrade() -> None:
+    # CREATE/DROP INDEX CONCURRENTLY не блокируют запись в таблицы,
+    # но не могут выполняться внутри транзакции. IF [NOT] EXISTS
+    # позволяет повторить прерванную миграцию; op.create_index и
+    # op.drop_index поддерживают его только с alembic 1.12.
+    with op.get_context().autocommit_block():
+        for name, table, columns in INDEXES:
+            create_index(name, table, columns)
+        drop_index('ix_tweet_content')
+
+
+def downgrade() -> None:
+    with op.get_context().autocommit_block():
+        create_index('ix_tweet_content', 'tweet', ['content'])
+        for name, _, _ in reversed(INDEXES):
+            drop_index(name)
@@ -0,0 +1,37 @@
+"""media_segment lease
+
+Revision ID: f3c5e7a9b1d4
+Revises: e2b4d6f8a0c3
+Create Date: 2026-10-18 23:14:52.318904
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'f3c5e7a9b1d4'
+down_revision = 'e2b4d6f8a0c3'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.add_column(
+        'media_segment',
+        sa.Column(
+            'heartbeat_at',
+            sa.DateTime(timezone=True),
+            server_default=sa.text('now()'),
+            nullable=True,
+        ),
+    )
+    op.add_column(
+        'media_segment',
+        sa.Column('retired_at', sa.DateTime(timezone=True), nullable=True),
+    )
+
+
+def downgrade() -> None:
+    op.drop_column('media_segment', 'retired_at')
+    op.drop_column('media_segment', 'heartbeat_at')
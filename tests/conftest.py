@@ -2,7 +2,10 @@ import asyncio
 
 import pytest
 from httpx import AsyncClient
+from sqlalchemy import event
 
+from app.config import settings
+from app.db.database import engine
 from app.main import app
 
 
@@ -17,3 +20,24 @@ def event_loop():
 async def client():
     async with AsyncClient(app=app, base_url="http://0.0.0.0:8080") as async_client:
         yield async_client
+
+
+@pytest.fixture
+def sql_statements():
+    """Список SQL запросов, выполненных во время теста."""
+    statements = []
+
+    def before_cursor_execute(conn, cursor, statement, *args):
+        statements.append(statement)
+
+    event.listen(engine.sync_engine, "before_cursor_execute", before_cursor_execute)
+    yield statements
+    event.remove(engine.sync_engine, "before_cursor_execute", before_cursor_execute)
+
+
+@pytest.fixture(scope="session", autouse=True)
+def strict_query_budget():
+    """Превышение бюджета SQL запросов endpoint роняет тест."""
+    settings.sql_query_budget_strict = True
+    yield
+    settings.sql_query_budget_strict = False
@@ -0,0 +1,112 @@
+import argparse
+import json
+
+import asyncpg
+import pytest
+
+from app.bulk_data import (
+    connect,
+    read_records,
+    rebuild_sequences,
+    run,
+    run_export,
+    run_import,
+)
+
+
+def test_read_records_csv(tmp_path):
+    path = tmp_path / "tweet.csv"
+    path.write_bytes(
+        b'id,content\n'
+        b'1,"first\nline"\n'
+        b'2,"with ""quotes"""\n'
+        b'3,plain\n',
+    )
+
+    batches = list(read_records(path, "csv", 2))
+    assert batches == [
+        [b'1,"first\nline"\n', b'2,"with ""quotes"""\n'],
+        [b"3,plain\n"],
+    ]
+
+
+@pytest.mark.asyncio
+async def test_export_import(tmp_path):
+    conn = await connect()
+    try:
+        users = await conn.fetchval('SELECT count(*) FROM "user"')
+
+        report = await run_export(conn, tmp_path, "ndjson", ["user"])
+        assert report["user"]["rows"] == users
+        lines = (tmp_path / "user.ndjson").read_text(encoding="utf-8").splitlines()
+        assert {json.loads(line)["username"] for line in lines} >= {"test", "test1"}
+
+        (tmp_path / "import").mkdir()
+        (tmp_path / "import" / "user.csv").write_text(
+            "id,username,api_token,followers_count\n"
+            '1001,bulk_user,"token, with comma",0\n',
+            encoding="utf-8",
+        )
+        try:
+            report = await run_import(conn, tmp_path / "import", "csv", ["user"], 10)
+            assert report["user"]["rows"] == 1
+            assert await conn.fetchval(
+                "SELECT api_token FROM \"user\" WHERE username = 'bulk_user'",
+            ) == "token, with comma"
+            assert await conn.fetchval(
+                "SELECT last_value FROM user_id_seq",
+            ) == 1001
+        finally:
+            await conn.execute("DELETE FROM \"user\" WHERE id = 1001")
+            await rebuild_sequences(conn, ["user"])
+    finally:
+        await conn.close()
+
+
+@pytest.mark.asyncio
+async def test_import_truncate_keeps_dependent_tables(tmp_path):
+    (tmp_path / "user.csv").write_text(
+        "id,username,api_token,followers_count\n",
+        encoding="utf-8",
+    )
+    conn = await connect()
+    try:
+        users = await conn.fetchval('SELECT count(*) FROM "user"')
+        with pytest.raises(asyncpg.FeatureNotSupportedError):
+            await run_import(conn, tmp_path, "csv", ["user"], 10, truncate=True)
+        assert await conn.fetchval('SELECT count(*) FROM "user"') == users
+    finally:
+        await conn.close()
+
+
+@pytest.mark.asyncio
+async def test_import_tables_in_foreign_key_order(tmp_path):
+    (tmp_path / "user.csv").write_text(
+        "id,username,api_token,followers_count\n"
+        "1002,bulk_author,bulk_token,0\n",
+        encoding="utf-8",
+    )
+    (tmp_path / "tweet.csv").write_text(
+        "id,content,user_id,like_count\n"
+        "1002,bulk tweet,1002,0\n",
+        encoding="utf-8",
+    )
+    args = argparse.Namespace(
+        command="import",
+        dir=tmp_path,
+        format="csv",
+        tables=["tweet", "user"],
+        batch_size=10,
+        truncate=False,
+    )
+    try:
+        report = await run(args)
+        assert list(report["tables"]) == ["user", "tweet"]
+    finally:
+        conn = await connect()
+        try:
+            await conn.execute("DELETE FROM tweet WHERE id = 1002")
+            await conn.execute("DELETE FROM \"user\" WHERE id = 1002")
+            await rebuild_sequences(conn, ["user", "tweet"])
+        finally:
+            await conn.close()
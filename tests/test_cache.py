@@ -0,0 +1,124 @@
+import pytest
+
+from app.schema.schemas import Principal
+from app.utils.cache import MemoryCache, PrincipalCache, RedisCache
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+class FakeRedis:
+    """Минимальная замена redis.asyncio.Redis для тестов."""
+
+    def __init__(self, clock):
+        self.clock = clock
+        self.data = {}
+
+    async def mget(self, keys):
+        return [self._get(key) for key in keys]
+
+    async def set(self, key, value, px=None):
+        expires_at = None if px is None else self.clock() + px / 1000
+        self.data[key] = (expires_at, value)
+
+    async def delete(self, *keys):
+        for key in keys:
+            self.data.pop(key, None)
+
+    def _get(self, key):
+        expires_at, value = self.data.get(key, (None, None))
+        if expires_at is not None and expires_at <= self.clock():
+            return None
+        return value
+
+
+@pytest.mark.asyncio
+async def test_memory_cache_lru_eviction():
+    cache = MemoryCache(max_bytes=30, ttl=60)
+    await cache.set("a", "x" * 10)
+    await cache.set("b", "x" * 10)
+    await cache.get("a")
+    await cache.set("c", "x" * 10)
+
+    assert await cache.get("a") == "x" * 10
+    assert await cache.get("b") is None
+    assert cache.size <= cache.max_bytes
+    assert cache.stats.evictions == 1
+
+
+@pytest.mark.asyncio
+async def test_memory_cache_ttl():
+    clock = FakeClock()
+    cache = MemoryCache(max_bytes=1024, ttl=10, clock=clock)
+    await cache.set("key", {"id": 1})
+
+    assert await cache.get("key") == {"id": 1}
+    clock.now = 11
+    assert await cache.get("key") is None
+    assert cache.stats.to_json()["expirations"] == 1
+    assert cache.stats.hits == 1
+    assert cache.stats.misses == 1
+    assert cache.size == 0
+
+
+@pytest.mark.asyncio
+async def test_redis_cache():
+    clock = FakeClock()
+    cache = RedisCache(FakeRedis(clock), ttl=10)
+    await cache.set("a", [1, 2])
+    await cache.set("b", "value")
+    await cache.delete("b")
+
+    assert await cache.get_many(["a", "b"]) == {"a": [1, 2]}
+    clock.now = 11
+    assert await cache.get("a") is None
+
+
+def test_principal_cache_negative_ttl_and_eviction():
+    clock = FakeClock()
+    principals = PrincipalCache(max_entries=2, ttl=60, negative_ttl=5, clock=clock)
+    user = Principal(id=1, username="test")
+
+    assert principals.get("test") is PrincipalCache.missing
+    principals.set("test", user)
+    principals.set("unknown", None)
+    assert principals.get("test") == user
+    assert principals.get("unknown") is None
+
+    clock.now = 10
+    assert principals.get("unknown") is PrincipalCache.missing
+    assert principals.get("test") == user
+
+    principals.set("other", Principal(id=2, username="test2"))
+    principals.set("third", Principal(id=3, username="test3"))
+    assert principals.get("test") is PrincipalCache.missing
+    assert principals.stats.evictions == 1
+    assert principals.get("third").id == 3
+
+
+@pytest.mark.asyncio
+async def test_principal_cache_version_sync():
+    clock = FakeClock()
+    shared = RedisCache(FakeRedis(clock), ttl=30)
+    principals = PrincipalCache(
+        max_entries=10,
+        ttl=60,
+        negative_ttl=5,
+        check_interval=1,
+        clock=clock,
+    )
+    await principals.sync(shared)
+    principals.set("test", Principal(id=1, username="test"))
+
+    await principals.bump(shared)
+    await principals.sync(shared)
+    assert principals.get("test").id == 1
+
+    clock.now = 1
+    await principals.sync(shared)
+    assert principals.get("test") is PrincipalCache.missing
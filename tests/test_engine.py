@@ -0,0 +1,25 @@
+from sqlalchemy.pool import NullPool
+
+from app.config import settings
+from app.db.database import engine_options
+
+
+def test_engine_options_pool():
+    options = engine_options(
+        settings.copy(update={"db_pool_size": 3, "db_echo": False}),
+    )
+    assert options["pool_size"] == 3
+    assert options["echo"] is False
+    assert options["connect_args"] == {
+        "prepared_statement_cache_size": settings.db_statement_cache_size,
+    }
+
+
+def test_engine_options_pgbouncer():
+    options = engine_options(settings.copy(update={"db_pgbouncer_mode": True}))
+    assert options["poolclass"] is NullPool
+    assert "pool_size" not in options
+    assert options["connect_args"] == {
+        "statement_cache_size": 0,
+        "prepared_statement_cache_size": 0,
+    }
@@ -0,0 +1,94 @@
+import asyncio
+
+import pytest
+from httpx import AsyncClient
+
+from app.config import settings
+from app.crud.like_buffer import LikeBuffer, like_buffer
+
+
+@pytest.mark.asyncio
+async def test_buffered_likes(client: AsyncClient, monkeypatch):
+    monkeypatch.setattr(settings, "like_buffer_enabled", True)
+    res = await client.post(
+        "/api/tweets",
+        json={"tweet_data": "Твит с буфером лайков", "tweet_media_ids": []},
+        headers={"api-key": "test2"},
+    )
+    id_tweet = res.json()["tweet_id"]
+
+    await client.post(f"/api/tweets/{id_tweet}/likes", headers={"api-key": "test2"})
+    await client.delete(f"/api/tweets/{id_tweet}/likes", headers={"api-key": "test2"})
+    await client.post(f"/api/tweets/{id_tweet}/likes", headers={"api-key": "test2"})
+    assert len(like_buffer) == 1
+
+    for _ in range(2):
+        feed = await client.get("/api/tweets", headers={"api-key": "test2"})
+        tweet = next(
+            tweet for tweet in feed.json()["tweets"] if tweet["id"] == id_tweet
+        )
+        assert tweet["like_count"] == 1
+        assert tweet["liked_by_me"] is True
+        await like_buffer.flush()
+
+    likes = await client.get(
+        f"/api/tweets/{id_tweet}/likes",
+        headers={"api-key": "test2"},
+    )
+    assert likes.json()["likes"] == [{"user_id": 3, "name": "test2"}]
+
+
+@pytest.fixture
+def slow_buffer(monkeypatch):
+    buffer = LikeBuffer(flush_interval=60, max_entries=100)
+    buffer.writing = asyncio.Event()
+    buffer.written = []
+
+    async def slow_write(batch):
+        buffer.writing.set()
+        await asyncio.sleep(0.05)
+        buffer.written.append(dict(batch))
+        return []
+
+    monkeypatch.setattr(buffer, "_write", slow_write)
+    return buffer
+
+
+@pytest.mark.asyncio
+async def test_like_buffer_inflight_batch_visible(slow_buffer):
+    slow_buffer.add(1, 10, True)
+    flush = asyncio.create_task(slow_buffer.flush())
+    await slow_buffer.writing.wait()
+    slow_buffer.add(2, 10, False)
+    assert slow_buffer.pending_for([10]) == {(1, 10): True, (2, 10): False}
+    assert len(slow_buffer) == 2
+
+    assert await flush == 1
+    assert slow_buffer.pending_for([10]) == {(2, 10): False}
+    assert len(slow_buffer) == 1
+
+
+@pytest.mark.asyncio
+async def test_like_buffer_keeps_cancelled_batch(slow_buffer):
+    slow_buffer.add(1, 10, True)
+    flush = asyncio.create_task(slow_buffer.flush())
+    await slow_buffer.writing.wait()
+    flush.cancel()
+    with pytest.raises(asyncio.CancelledError):
+        await flush
+    assert slow_buffer.pending_for([10]) == {(1, 10): True}
+    assert slow_buffer.written == []
+
+
+@pytest.mark.asyncio
+async def test_like_buffer_stop_waits_for_flush(slow_buffer):
+    slow_buffer.start()
+    slow_buffer.add(1, 10, True)
+    flush = asyncio.create_task(slow_buffer.flush())
+    await slow_buffer.writing.wait()
+    slow_buffer.add(2, 10, False)
+
+    await slow_buffer.stop()
+    assert await flush == 1
+    assert slow_buffer.written == [{(1, 10): True}, {(2, 10): False}]
+    assert len(slow_buffer) == 0
@@ -0,0 +1,54 @@
+import json
+import logging
+
+import pytest
+from httpx import AsyncClient
+
+from app.utils.logger import (
+    REQUEST_ID_HEADER,
+    JsonFormatter,
+    RequestIdFilter,
+    SamplingFilter,
+    request_id,
+)
+
+
+def make_record(name: str, level: int = logging.INFO) -> logging.LogRecord:
+    return logging.LogRecord(name, level, __file__, 1, "Сообщение %s", ("1",), None)
+
+
+@pytest.mark.asyncio
+async def test_request_id_header(client: AsyncClient):
+    response = await client.get(
+        "/api/users/me",
+        headers={"api-key": "test", REQUEST_ID_HEADER: "req-1"},
+    )
+    assert response.headers[REQUEST_ID_HEADER] == "req-1"
+
+    response = await client.get("/api/users/me", headers={"api-key": "test"})
+    assert len(response.headers[REQUEST_ID_HEADER]) == 32
+
+
+def test_json_formatter():
+    record = make_record("endpoints.post")
+    token = request_id.set("req-2")
+    try:
+        RequestIdFilter().filter(record)
+    finally:
+        request_id.reset(token)
+
+    message = json.loads(JsonFormatter().format(record))
+    assert message["request_id"] == "req-2"
+    assert message["logger"] == "endpoints.post"
+    assert message["level"] == "INFO"
+    assert message["message"] == "Сообщение 1"
+
+
+def test_sampling_filter():
+    sampling = SamplingFilter({"endpoints.post": 0.25})
+
+    passed = [sampling.filter(make_record("endpoints.post")) for _ in range(8)]
+    assert passed.count(True) == 2
+    assert passed[0] and passed[4]
+    assert sampling.filter(make_record("endpoints.post", logging.WARNING))
+    assert all(sampling.filter(make_record("crud.post")) for _ in range(4))
@@ -1,6 +1,31 @@
+import asyncio
+import hashlib
+import io
+import os
+import struct
+import time
+from datetime import timedelta
+from uuid import uuid4
+
 import aiofiles
 import pytest
+from fastapi import UploadFile
 from httpx import AsyncClient
+from sqlalchemy import delete, func, insert, select, update
+
+from app.config import settings
+from app.crud.media import MediaService
+from app.crud.media_gc import media_sweeper
+from app.crud.media_storage import StoredFile, read_range, segment_storage
+from app.crud.media_worker import media_worker
+from app.db.database import async_session, engine
+from app.db.models import (
+    Media,
+    MediaBlob,
+    MediaFileCleanup,
+    MediaJob,
+    MediaSegment,
+)
 
 
 @pytest.mark.asyncio
@@ -19,3 +44,439 @@ async def test_add_media(client: AsyncClient):
         "result": True,
         "media_id": 1,
     }
+
+
+@pytest.mark.asyncio
+async def test_media_saved_with_hash(client: AsyncClient):
+    data = b"media-content" * 1000
+
+    response = await client.post(
+        "/api/medias",
+        files={"file": ("photo.jpg", data)},
+        headers={"api-key": "test"}
+    )
+    assert response.status_code == 201
+    media_id = response.json()["media_id"]
+
+    async with engine.connect() as conn:
+        media = (await conn.execute(
+            select(Media).where(Media.id == media_id)
+        )).one()
+    assert media.path_file.endswith(".jpg")
+    assert media.sha256 == hashlib.sha256(data).hexdigest()
+    assert media.size == len(data)
+
+    file_path = settings.path_image() / media.path_file.split("/")[1]
+    async with aiofiles.open(file_path, mode="rb") as img_file:
+        assert await img_file.read() == data
+
+
+@pytest.mark.asyncio
+async def test_media_too_large(client: AsyncClient, monkeypatch):
+    monkeypatch.setattr(settings, "media_chunk_size", 16)
+    monkeypatch.setattr(settings, "media_max_size", 100)
+    files_before = set(settings.path_image().iterdir())
+
+    response = await client.post(
+        "/api/medias",
+        files={"file": ("big.png", b"x" * 101)},
+        headers={"api-key": "test"}
+    )
+    assert response.status_code == 422
+    assert response.json()["error_type"] == "File too large"
+    assert set(settings.path_image().iterdir()) == files_before
+
+
+async def get_blob(sha256: str):
+    async with engine.connect() as conn:
+        return (await conn.execute(
+            select(MediaBlob).where(MediaBlob.sha256 == sha256)
+        )).one_or_none()
+
+
+async def get_job(sha256: str):
+    async with engine.connect() as conn:
+        return (await conn.execute(
+            select(MediaJob, MediaBlob.meta).join(
+                MediaBlob,
+                MediaBlob.sha256 == MediaJob.sha256,
+            ).where(MediaJob.sha256 == sha256)
+        )).one()
+
+
+@pytest.mark.asyncio
+async def test_media_worker_extracts_meta(client: AsyncClient):
+    header = b"\x89PNG\r\n\x1a\n\x00\x00\x00\rIHDR"
+    # Уникальное содержимое: иначе при повторном запуске блоб уже есть и
+    # новая задача не создается.
+    data = header + struct.pack(">II", 3, 2) + b"\x00" * 64 + uuid4().bytes
+    response = await client.post(
+        "/api/medias",
+        files={"file": ("pixel.png", data)},
+        headers={"api-key": "test"}
+    )
+    assert response.status_code == 201
+    sha256 = hashlib.sha256(data).hexdigest()
+    assert (await get_job(sha256)).status == "pending"
+
+    try:
+        while await media_worker.run_once():
+            pass
+    finally:
+        await media_worker.stop()
+
+    job = await get_job(sha256)
+    assert job.status == "done"
+    assert job.attempts == 1
+    assert job.meta == {"format": "png", "width": 3, "height": 2, "size": len(data)}
+
+
+@pytest.mark.asyncio
+async def test_media_worker_retries(client: AsyncClient, monkeypatch):
+    monkeypatch.setattr(settings, "media_job_max_attempts", 2)
+    monkeypatch.setattr(settings, "media_job_retry_seconds", 0)
+    data = b"media-without-file" * 10 + uuid4().bytes
+    response = await client.post(
+        "/api/medias",
+        files={"file": ("gone.png", data)},
+        headers={"api-key": "test"}
+    )
+    assert response.status_code == 201
+    sha256 = hashlib.sha256(data).hexdigest()
+    for file_path in settings.path_image().glob(sha256 + "*"):
+        file_path.unlink()
+
+    try:
+        await media_worker.run_once()
+        job = await get_job(sha256)
+        assert (job.status, job.attempts) == ("pending", 1)
+        assert "FileNotFoundError" in job.last_error
+
+        await media_worker.run_once()
+        job = await get_job(sha256)
+        assert (job.status, job.attempts) == ("failed", 2)
+    finally:
+        await media_worker.stop()
+
+
+@pytest.mark.asyncio
+async def test_media_worker_fails_expired_job(client: AsyncClient, monkeypatch):
+    monkeypatch.setattr(settings, "media_job_max_attempts", 2)
+    data = b"media-worker-crashed" * 10 + uuid4().bytes
+    await client.post(
+        "/api/medias",
+        files={"file": ("crashed.png", data)},
+        headers={"api-key": "test"}
+    )
+    sha256 = hashlib.sha256(data).hexdigest()
+    # Процесс, взявший задачу, остановился на последней попытке.
+    async with engine.begin() as conn:
+        await conn.execute(
+            update(MediaJob).where(MediaJob.sha256 == sha256).values(
+                status="running",
+                attempts=2,
+                run_after=func.now() - timedelta(hours=1),
+            )
+        )
+
+    try:
+        await media_worker.run_once()
+    finally:
+        await media_worker.stop()
+    job = await get_job(sha256)
+    assert (job.status, job.attempts) == ("failed", 2)
+    assert job.last_error is not None
+
+
+@pytest.mark.asyncio
+async def test_media_sweeper_removes_orphans(client: AsyncClient):
+    data = b"orphan-media" * 100
+    response = await client.post(
+        "/api/medias",
+        files={"file": ("orphan.png", data)},
+        headers={"api-key": "test"}
+    )
+    media_id = response.json()["media_id"]
+    sha256 = hashlib.sha256(data).hexdigest()
+    (file_path,) = settings.path_image().glob(sha256 + "*")
+    temp_path = settings.path_image_temp() / "interrupted.png.part"
+    temp_path.write_bytes(b"x" * 10)
+    expired = time.time() - settings.media_orphan_ttl_seconds - 60
+    os.utime(temp_path, (expired, expired))
+
+    async with engine.begin() as conn:
+        await conn.execute(
+            update(Media).where(Media.id == media_id).values(
+                created_at=func.now() - timedelta(
+                    seconds=settings.media_orphan_ttl_seconds + 60,
+                ),
+            )
+        )
+
+    report = await media_sweeper.sweep()
+    assert report == {"media": 1, "bytes": len(data) + 10}
+    assert not file_path.exists()
+    assert not temp_path.exists()
+    assert await get_blob(sha256) is None
+
+    assert await media_sweeper.sweep() == {"media": 0, "bytes": 0}
+
+
+def stored_file(blob) -> StoredFile:
+    return StoredFile(
+        blob.path_file,
+        blob.size,
+        blob.segment_id,
+        blob.segment_offset,
+    )
+
+
+@pytest.mark.asyncio
+async def test_segment_storage(client: AsyncClient, monkeypatch):
+    monkeypatch.setattr(settings, "media_storage", "segment")
+    payloads = [b"segment-one" * 70, b"segment-two" * 50]
+    hashes = [hashlib.sha256(data).hexdigest() for data in payloads]
+    media_ids = []
+    for number, data in enumerate(payloads):
+        response = await client.post(
+            "/api/medias",
+            files={"file": (f"small{number}.png", data)},
+            headers={"api-key": "test"}
+        )
+        media_ids.append(response.json()["media_id"])
+
+    first, second = [await get_blob(sha256) for sha256 in hashes]
+    assert first.segment_id == second.segment_id
+    assert second.segment_offset == first.segment_offset + len(payloads[0])
+    assert read_range(segment_storage.locate(stored_file(first))) == payloads[0]
+    assert read_range(segment_storage.locate(stored_file(second))) == payloads[1]
+    assert not list(settings.path_image().glob(hashes[0] + "*"))
+
+    async with async_session() as session:
+        deleted = await session.execute(
+            delete(Media).where(Media.id == media_ids[0]).returning(
+                Media.path_file,
+                Media.sha256,
+            )
+        )
+        await MediaService(session).release_media(deleted.all())
+        await session.commit()
+
+    old_segment = segment_storage.segment_path(first.segment_id)
+    await segment_storage.seal()
+    assert await segment_storage.compact() == len(payloads[0])
+    assert old_segment.exists()
+
+    moved = await get_blob(hashes[1])
+    assert moved.segment_id != first.segment_id
+    assert read_range(segment_storage.locate(stored_file(moved))) == payloads[1]
+
+    monkeypatch.setattr(settings, "media_gc_interval_seconds", 0)
+    await segment_storage.compact()
+    assert not old_segment.exists()
+    await segment_storage.seal()
+
+
+@pytest.mark.asyncio
+async def test_abandoned_segment_sealed(client: AsyncClient, monkeypatch):
+    monkeypatch.setattr(settings, "media_storage", "segment")
+    blobs = []
+    for number in range(2):
+        data = b"abandoned-segment%d" % number + uuid4().bytes
+        await client.post(
+            "/api/medias",
+            files={"file": (f"abandoned{number}.png", data)},
+            headers={"api-key": "test"}
+        )
+        blobs.append(await get_blob(hashlib.sha256(data).hexdigest()))
+        if number == 0:
+            # Процесс-владелец давно не продлевал сегмент.
+            async with engine.begin() as conn:
+                await conn.execute(
+                    update(MediaSegment).where(
+                        MediaSegment.id == blobs[0].segment_id,
+                    ).values(
+                        heartbeat_at=func.now() - timedelta(
+                            seconds=settings.media_segment_lease_seconds + 60,
+                        ),
+                    )
+                )
+            assert await segment_storage.seal_abandoned() == 1
+            monkeypatch.setattr(segment_storage, "_heartbeat", 0.0)
+
+    assert blobs[1].segment_id != blobs[0].segment_id
+    async with engine.connect() as conn:
+        sealed = (await conn.execute(
+            select(MediaSegment.sealed).where(
+                MediaSegment.id == blobs[0].segment_id,
+            )
+        )).scalar_one()
+    assert sealed is True
+    await segment_storage.seal()
+
+
+@pytest.mark.asyncio
+async def test_compact_waits_for_uncommitted_blob(client: AsyncClient, monkeypatch):
+    monkeypatch.setattr(settings, "media_storage", "segment")
+    payloads = [b"uncommitted-blob%d" % number + uuid4().bytes for number in range(2)]
+    hashes = [hashlib.sha256(data).hexdigest() for data in payloads]
+    placements = []
+    for number, data in enumerate(payloads):
+        upload = UploadFile(f"race{number}.png", file=io.BytesIO(data))
+        placements.append(await segment_storage.save(upload, "", len(data)))
+    segment_id = placements[0]["segment_id"]
+    assert placements[1]["segment_id"] == segment_id
+    # Одновременная загрузка закрыла сегмент до фиксации первой.
+    await segment_storage.seal()
+
+    async with async_session() as session:
+        path_file = await MediaService(session).insert_blob(
+            hashes[0],
+            "images/race0.png",
+            len(payloads[0]),
+            placements[0],
+        )
+        assert path_file == "images/race0.png"
+        compact = asyncio.create_task(segment_storage.compact_segment(segment_id))
+        await asyncio.sleep(0.2)
+        assert not compact.done()
+        await session.commit()
+    await compact
+
+    moved = await get_blob(hashes[0])
+    assert moved.segment_id != segment_id
+    assert read_range(segment_storage.locate(stored_file(moved))) == payloads[0]
+
+    async with async_session() as session:
+        path_file = await MediaService(session).insert_blob(
+            hashes[1],
+            "images/race1.png",
+            len(payloads[1]),
+            placements[1],
+        )
+    assert path_file is None
+    assert await get_blob(hashes[1]) is None
+    await segment_storage.seal()
+
+
+@pytest.mark.asyncio
+async def test_show_media(client: AsyncClient):
+    data = bytes(range(256)) * 4
+    response = await client.post(
+        "/api/medias",
+        files={"file": ("served.png", data)},
+        headers={"api-key": "test"}
+    )
+    media_id = response.json()["media_id"]
+    etag = '"{sha256}"'.format(sha256=hashlib.sha256(data).hexdigest())
+
+    response = await client.get(f"/api/medias/{media_id}")
+    assert response.status_code == 200
+    assert response.content == data
+    assert response.headers["etag"] == etag
+    assert response.headers["content-type"] == "image/png"
+    assert "content-disposition" not in response.headers
+
+    response = await client.get(
+        f"/api/medias/{media_id}",
+        headers={"if-none-match": etag},
+    )
+    assert response.status_code == 304
+    assert response.content == b""
+
+    response = await client.get(
+        f"/api/medias/{media_id}",
+        headers={"range": "bytes=10-19"},
+    )
+    assert response.status_code == 206
+    assert response.content == data[10:20]
+    assert response.headers["content-range"] == f"bytes 10-19/{len(data)}"
+
+    response = await client.get(
+        f"/api/medias/{media_id}",
+        headers={"range": "bytes=-6", "if-range": etag},
+    )
+    assert response.status_code == 206
+    assert response.content == data[-6:]
+
+    response = await client.get(
+        f"/api/medias/{media_id}",
+        headers={"range": f"bytes={len(data)}-"},
+    )
+    assert response.status_code == 416
+    assert response.headers["content-range"] == f"bytes */{len(data)}"
+
+    response = await client.get("/api/medias/1000000")
+    assert response.status_code == 422
+    assert response.json()["error_type"] == "Media not found"
+
+
+@pytest.mark.asyncio
+async def test_show_media_not_image(client: AsyncClient):
+    response = await client.post(
+        "/api/medias",
+        files={"file": ("page.html", b"<script>alert(1)</script>")},
+        headers={"api-key": "test"}
+    )
+    media_id = response.json()["media_id"]
+
+    response = await client.get(f"/api/medias/{media_id}")
+    assert response.status_code == 200
+    assert response.headers["content-type"] == "application/octet-stream"
+    assert response.headers["content-disposition"] == "attachment"
+    assert response.headers["x-content-type-options"] == "nosniff"
+
+
+@pytest.mark.asyncio
+async def test_show_media_accel_redirect(client: AsyncClient, monkeypatch):
+    data = b"accel-media" * 20
+    response = await client.post(
+        "/api/medias",
+        files={"file": ("accel.jpg", data)},
+        headers={"api-key": "test"}
+    )
+    media_id = response.json()["media_id"]
+    monkeypatch.setattr(settings, "media_accel_redirect", True)
+
+    response = await client.get(f"/api/medias/{media_id}")
+    blob = await get_blob(hashlib.sha256(data).hexdigest())
+    assert response.status_code == 200
+    assert response.content == b""
+    assert response.headers["x-accel-redirect"] == (
+        "/internal/images/" + blob.path_file.split("/")[1]
+    )
+
+    monkeypatch.setattr(settings, "media_storage", "segment")
+    data = b"accel-segment" * 20
+    response = await client.post(
+        "/api/medias",
+        files={"file": ("segment.jpg", data)},
+        headers={"api-key": "test"}
+    )
+    response = await client.get(
+        "/api/medias/{media_id}".format(media_id=response.json()["media_id"]),
+        headers={"range": "bytes=0-4"},
+    )
+    assert "x-accel-redirect" not in response.headers
+    assert response.content == data[:5]
+    await segment_storage.seal()
+
+
+@pytest.mark.asyncio
+async def test_media_sweeper_removes_unused_files(client: AsyncClient):
+    unused_path = settings.path_image() / "unused-{name}.png".format(
+        name=uuid4().hex,
+    )
+    unused_path.write_bytes(b"x" * 20)
+    async with engine.begin() as conn:
+        await conn.execute(
+            insert(MediaFileCleanup).values(
+                path_file="images/{name}".format(name=unused_path.name),
+            )
+        )
+
+    assert await media_sweeper.sweep() == {"media": 0, "bytes": 20}
+    assert not unused_path.exists()
+    async with engine.connect() as conn:
+        remaining = await conn.execute(select(func.count(MediaFileCleanup.path_file)))
+    assert remaining.scalar_one() == 0
@@ -0,0 +1,24 @@
+import pytest
+from httpx import AsyncClient
+
+
+@pytest.mark.asyncio
+async def test_metrics(client: AsyncClient):
+    await client.get("/api/tweets/1/likes", headers={"api-key": "test"})
+    await client.get(
+        "/api/tweets",
+        params={"cursor": "invalid"},
+        headers={"api-key": "test"},
+    )
+
+    response = await client.get("/metrics")
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/plain")
+    assert (
+        'http_request_duration_seconds_count{method="GET",'
+        'route="/api/tweets/{tweet_id}/likes",status="200"}'
+    ) in response.text
+    assert 'app_errors_total{mtype="Invalid cursor"}' in response.text
+    assert 'cache_requests_total{cache="principals",result="hit"}' in response.text
+    assert "db_pool_checked_out" in response.text
+    assert 'http_requests_in_progress{method="GET"} 1.0' in response.text
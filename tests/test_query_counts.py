@@ -0,0 +1,121 @@
+import pytest
+from httpx import AsyncClient
+
+from app.api.depends import QueryBudget
+from app.crud import timeline, tweet
+from app.db.instrumentation import QueryBudgetExceeded, QueryStats, query_stats
+from app.utils.cache import NullCache
+
+
+@pytest.fixture
+def no_cache(monkeypatch):
+    monkeypatch.setattr(tweet, "cache", NullCache())
+    monkeypatch.setattr(timeline, "cache", NullCache())
+
+
+async def count_queries(
+        client: AsyncClient,
+        sql_statements: list,
+        method: str,
+        url: str,
+        **kwargs,
+) -> int:
+    await client.get("/api/users/me", headers={"api-key": "test"})
+    sql_statements.clear()
+    response = await client.request(
+        method,
+        url,
+        headers={"api-key": "test"},
+        **kwargs,
+    )
+    assert response.status_code in {200, 201}, response.text
+    return len(sql_statements)
+
+
+@pytest.mark.asyncio
+async def test_user_queries(client: AsyncClient, sql_statements):
+    assert await count_queries(client, sql_statements, "GET", "/api/users/me") == 3
+    assert await count_queries(client, sql_statements, "GET", "/api/users/2") == 3
+
+
+@pytest.mark.asyncio
+async def test_tweet_queries(client: AsyncClient, sql_statements, no_cache):
+    res = await client.post(
+        "/api/tweets",
+        json={"tweet_data": "Твит для подсчета запросов", "tweet_media_ids": []},
+        headers={"api-key": "test"},
+    )
+    tweet_id = res.json()["tweet_id"]
+    likes_url = f"/api/tweets/{tweet_id}/likes"
+
+    assert await count_queries(
+        client,
+        sql_statements,
+        "POST",
+        "/api/tweets",
+        json={"tweet_data": "Еще один твит", "tweet_media_ids": []},
+    ) == 4
+    assert await count_queries(
+        client,
+        sql_statements,
+        "POST",
+        "/api/tweets/batch",
+        json={"tweets": [
+            {"tweet_data": "Твит из пачки {number}".format(number=number),
+             "tweet_media_ids": []}
+            for number in range(10)
+        ]},
+    ) == 4
+    assert await count_queries(client, sql_statements, "POST", likes_url) == 2
+    assert await count_queries(client, sql_statements, "GET", "/api/tweets") == 7
+    assert await count_queries(client, sql_statements, "GET", likes_url) == 1
+    assert await count_queries(client, sql_statements, "DELETE", likes_url) == 2
+
+
+@pytest.mark.asyncio
+async def test_follow_queries(client: AsyncClient, sql_statements):
+    assert await count_queries(
+        client,
+        sql_statements,
+        "DELETE",
+        "/api/users/3/follow",
+    ) == 5
+    assert await count_queries(
+        client,
+        sql_statements,
+        "DELETE",
+        "/api/tweets/3/follow",
+    ) == 4
+
+
+def test_query_stats_n_plus_one():
+    stats = QueryStats()
+    for media_id in range(3):
+        stats.record("SELECT media.id FROM media\nWHERE media.id = %s", 0.001)
+    stats.record("SELECT tweet.id FROM tweet", 0.001)
+
+    assert stats.count == 4
+    assert stats.repeated(3) == {"SELECT media.id FROM media WHERE media.id = %s": 3}
+    assert stats.server_timing() == 'db;dur=4.00;desc="4 queries"'
+
+
+@pytest.mark.asyncio
+async def test_server_timing_header(client: AsyncClient):
+    response = await client.get("/api/users/me", headers={"api-key": "test"})
+    assert response.headers["Server-Timing"].startswith("db;dur=")
+    assert response.headers["Server-Timing"].endswith('desc="3 queries"')
+
+
+@pytest.mark.asyncio
+async def test_query_budget_strict(client: AsyncClient, monkeypatch):
+    async def tight_budget(budget):
+        query_stats.get().budget = 1
+
+    monkeypatch.setattr(QueryBudget, "__call__", tight_budget)
+    with pytest.raises(Exception) as excinfo:
+        await client.get("/api/users/me", headers={"api-key": "test"})
+
+    error = excinfo.value
+    while hasattr(error, "exceptions"):
+        error = error.exceptions[0]
+    assert isinstance(error, QueryBudgetExceeded)
@@ -0,0 +1,117 @@
+import pytest
+from httpx import AsyncClient
+from sqlalchemy import event
+
+from app.config import settings
+from app.crud.like_buffer import like_buffer
+from app.db.database import engine
+from app.utils.cache import principal_cache
+
+EXPLAINED = ("SELECT", "INSERT", "UPDATE", "DELETE", "WITH")
+
+
+@pytest.fixture
+def driver_statements():
+    """
+    Запросы в том виде, в котором они уходят в asyncpg.
+
+    Диалект asyncpg добавляет к параметрам приведения типов ($1::INTEGER)
+    уже в курсоре, поэтому запрос собирается здесь, а не по тексту из
+    before_cursor_execute.
+    """
+    statements = {}
+
+    def before_cursor_execute(conn, cursor, statement, parameters, context, many):
+        if many or not statement.lstrip().upper().startswith(EXPLAINED):
+            return
+        if parameters:
+            statement = statement % cursor._parameter_placeholders(parameters)
+        statements.setdefault(statement, tuple(parameters or ()))
+
+    event.listen(engine.sync_engine, "before_cursor_execute", before_cursor_execute)
+    yield statements
+    event.remove(engine.sync_engine, "before_cursor_execute", before_cursor_execute)
+
+
+def seq_scans(plan: dict) -> list:
+    """Таблицы, которые план читает последовательным сканированием."""
+    scans = []
+    if plan["Node Type"] == "Seq Scan":
+        scans.append(plan["Relation Name"])
+    for child in plan.get("Plans", []):
+        scans.extend(seq_scans(child))
+    return scans
+
+
+async def run_workload(client: AsyncClient, monkeypatch) -> None:
+    headers = {"api-key": "test"}
+    principal_cache.clear()
+
+    with open("app/images/1.png", mode="rb") as img_file:
+        media = await client.post(
+            "/api/medias",
+            files={"file": img_file.read()},
+            headers=headers,
+        )
+    res = await client.post(
+        "/api/tweets",
+        json={
+            "tweet_data": "Твит для проверки планов",
+            "tweet_media_ids": [media.json()["media_id"]],
+        },
+        headers={"api-key": "test3"},
+    )
+    tweet_id = res.json()["tweet_id"]
+
+    await client.delete("/api/users/4/follow", headers=headers)
+    await client.post(f"/api/tweets/{tweet_id}/likes", headers=headers)
+    await client.get("/api/users/me", headers=headers)
+    await client.get("/api/users/4", headers=headers)
+    await client.get("/api/tweets", headers=headers)
+    await client.get(f"/api/tweets/{tweet_id}/likes", headers=headers)
+    await client.get("/api/tweets", params={"stream": True}, headers=headers)
+
+    monkeypatch.setattr(settings, "feed_render_mode", "sql")
+    await client.get("/api/tweets", headers=headers)
+    monkeypatch.setattr(settings, "home_timeline_enabled", False)
+    await client.get("/api/tweets", headers=headers)
+    await client.get("/api/tweets", params={"stream": True}, headers=headers)
+
+    monkeypatch.setattr(settings, "like_buffer_enabled", True)
+    await client.delete(f"/api/tweets/{tweet_id}/likes", headers=headers)
+    await client.post(f"/api/tweets/{tweet_id}/likes", headers=headers)
+    await like_buffer.flush()
+    await client.delete(f"/api/tweets/{tweet_id}/likes", headers=headers)
+    await like_buffer.flush()
+
+    await client.delete("/api/tweets/4/follow", headers=headers)
+    await client.delete(f"/api/tweets/{tweet_id}", headers={"api-key": "test3"})
+
+
+@pytest.mark.asyncio
+async def test_hot_queries_use_indexes(
+        client: AsyncClient,
+        driver_statements,
+        monkeypatch,
+):
+    await run_workload(client, monkeypatch)
+    assert driver_statements
+
+    failures = []
+    async with engine.connect() as conn:
+        driver = (await conn.get_raw_connection()).driver_connection
+        async with driver.transaction():
+            await driver.execute("SET LOCAL enable_seqscan = off")
+            for statement, parameters in driver_statements.items():
+                plan = await driver.fetchval(
+                    "EXPLAIN (FORMAT JSON) " + statement,
+                    *parameters,
+                )
+                tables = seq_scans(plan[0]["Plan"])
+                if tables:
+                    failures.append("{tables}: {statement}".format(
+                        tables=", ".join(tables),
+                        statement=" ".join(statement.split()),
+                    ))
+
+    assert not failures, "\n".join(failures)
@@ -0,0 +1,55 @@
+import pytest
+from httpx import AsyncClient
+from sqlalchemy import select
+
+from app.config import settings
+from app.crud.timeline import merge_timelines
+from app.db.database import async_session
+from app.db.models import HomeTimeline
+
+
+def test_merge_timelines():
+    inbox = [(9, 9), (6, 6), (3, 3)]
+    author_a = [(8, 8), (6, 6), (2, 2)]
+    author_b = [(7, 7), (1, 1)]
+
+    merged = merge_timelines([inbox, author_a, author_b], limit=5)
+
+    assert merged == [(9, 9), (8, 8), (7, 7), (6, 6), (3, 3)]
+
+
+@pytest.mark.asyncio
+async def test_high_fanout_author_merged_on_read(client: AsyncClient, monkeypatch):
+    monkeypatch.setattr(settings, "fanout_follower_threshold", 0)
+    await client.delete("/api/users/2/follow", headers={"api-key": "test3"})
+
+    res = await client.post(
+        "/api/tweets",
+        json={
+            "tweet_data": "Твит популярного автора",
+            "tweet_media_ids": [],
+        },
+        headers={"api-key": "test1"},
+    )
+    id_tweet = res.json()["tweet_id"]
+
+    async with async_session() as session:
+        pushed = await session.scalar(
+            select(HomeTimeline.user_id).where(
+                HomeTimeline.user_id == 4,
+                HomeTimeline.tweet_id == id_tweet,
+            ),
+        )
+    assert pushed is None
+
+    follower_feed = await client.get("/api/tweets", headers={"api-key": "test3"})
+    assert id_tweet in [tweet["id"] for tweet in follower_feed.json()["tweets"]]
+
+    streamed = await client.get(
+        "/api/tweets",
+        params={"limit": 5, "stream": True},
+        headers={"api-key": "test3"},
+    )
+    streamed_ids = [tweet["id"] for tweet in streamed.json()["tweets"]]
+    assert id_tweet in streamed_ids
+    assert len(streamed_ids) == len(set(streamed_ids))
@@ -1,5 +1,12 @@
+import hashlib
+
 import pytest
 from httpx import AsyncClient
+from sqlalchemy import select
+
+from app.config import settings
+from app.db.database import engine
+from app.db.models import Media, MediaBlob
 
 
 @pytest.mark.asyncio
@@ -68,7 +75,7 @@ async def test_delete_tweets_other_user(client: AsyncClient):
         "/api/tweets",
         json={
             "tweet_data": "Чужой твит",
-            "tweet_media_ids": [1],
+            "tweet_media_ids": [],
         },
         headers={"api-key": "test1"},
     )
@@ -83,3 +90,358 @@ async def test_delete_tweets_other_user(client: AsyncClient):
         "error_type": "Tweet not found",
         "error_message": "Tweet не найден",
     }
+
+
+@pytest.mark.asyncio
+async def test_get_tweets_pagination(client: AsyncClient):
+    for number in range(3):
+        await client.post(
+            "/api/tweets",
+            json={
+                "tweet_data": f"Твит {number}",
+                "tweet_media_ids": [],
+            },
+            headers={"api-key": "test"},
+        )
+
+    first_page = await client.get(
+        "/api/tweets",
+        params={"limit": 2},
+        headers={"api-key": "test"},
+    )
+    assert first_page.status_code == 200
+    assert len(first_page.json()["tweets"]) == 2
+    assert first_page.json()["next_cursor"] is not None
+
+    second_page = await client.get(
+        "/api/tweets",
+        params={"limit": 2, "cursor": first_page.json()["next_cursor"]},
+        headers={"api-key": "test"},
+    )
+    first_ids = {tweet["id"] for tweet in first_page.json()["tweets"]}
+    second_ids = {tweet["id"] for tweet in second_page.json()["tweets"]}
+    assert second_page.status_code == 200
+    assert second_ids
+    assert not first_ids & second_ids
+
+
+@pytest.mark.asyncio
+async def test_get_tweets_invalid_cursor(client: AsyncClient):
+    response = await client.get(
+        "/api/tweets",
+        params={"cursor": "invalid"},
+        headers={"api-key": "test"},
+    )
+    assert response.status_code == 422
+    assert response.json()["error_type"] == "Invalid cursor"
+
+
+@pytest.mark.asyncio
+async def test_home_timeline_follows(client: AsyncClient):
+    await client.delete("/api/users/4/follow", headers={"api-key": "test2"})
+    res = await client.post(
+        "/api/tweets",
+        json={
+            "tweet_data": "Твит для подписчиков",
+            "tweet_media_ids": [],
+        },
+        headers={"api-key": "test3"},
+    )
+    id_tweet = res.json()["tweet_id"]
+
+    follower_feed = await client.get("/api/tweets", headers={"api-key": "test2"})
+    stranger_feed = await client.get("/api/tweets", headers={"api-key": "test1"})
+    assert id_tweet in [tweet["id"] for tweet in follower_feed.json()["tweets"]]
+    assert id_tweet not in [tweet["id"] for tweet in stranger_feed.json()["tweets"]]
+
+    await client.delete(f"/api/tweets/{id_tweet}", headers={"api-key": "test3"})
+    follower_feed = await client.get("/api/tweets", headers={"api-key": "test2"})
+    assert id_tweet not in [tweet["id"] for tweet in follower_feed.json()["tweets"]]
+
+
+@pytest.mark.asyncio
+async def test_feed_sees_own_like(client: AsyncClient):
+    res = await client.post(
+        "/api/tweets",
+        json={"tweet_data": "Твит для лайка", "tweet_media_ids": []},
+        headers={"api-key": "test1"},
+    )
+    id_tweet = res.json()["tweet_id"]
+    await client.get("/api/tweets", headers={"api-key": "test1"})
+
+    await client.post(f"/api/tweets/{id_tweet}/likes", headers={"api-key": "test1"})
+    await client.post(f"/api/tweets/{id_tweet}/likes", headers={"api-key": "test1"})
+    feed = await client.get("/api/tweets", headers={"api-key": "test1"})
+    tweet = next(
+        tweet for tweet in feed.json()["tweets"] if tweet["id"] == id_tweet
+    )
+    assert tweet["likes"] == [{"user_id": 2, "name": "test1"}]
+    assert tweet["like_count"] == 1
+    assert tweet["liked_by_me"] is True
+
+
+@pytest.mark.asyncio
+async def test_get_tweet_likes(client: AsyncClient):
+    res = await client.post(
+        "/api/tweets",
+        json={"tweet_data": "Популярный твит", "tweet_media_ids": []},
+        headers={"api-key": "test"},
+    )
+    id_tweet = res.json()["tweet_id"]
+    for api_key in ("test", "test1", "test2"):
+        await client.post(f"/api/tweets/{id_tweet}/likes", headers={"api-key": api_key})
+
+    first_page = await client.get(
+        f"/api/tweets/{id_tweet}/likes",
+        params={"limit": 2},
+        headers={"api-key": "test"},
+    )
+    second_page = await client.get(
+        f"/api/tweets/{id_tweet}/likes",
+        params={"limit": 2, "cursor": first_page.json()["next_cursor"]},
+        headers={"api-key": "test"},
+    )
+    assert first_page.status_code == 200
+    assert first_page.json()["likes"] == [
+        {"user_id": 3, "name": "test2"},
+        {"user_id": 2, "name": "test1"},
+    ]
+    assert second_page.json() == {
+        "result": True,
+        "likes": [{"user_id": 1, "name": "test"}],
+        "next_cursor": None,
+    }
+
+
+@pytest.mark.asyncio
+async def test_feed_sql_render_mode(client: AsyncClient, monkeypatch):
+    from app.config import settings
+
+    orm_feed = await client.get("/api/tweets", headers={"api-key": "test1"})
+    monkeypatch.setattr(settings, "feed_render_mode", "sql")
+    sql_feed = await client.get("/api/tweets", headers={"api-key": "test1"})
+
+    assert sql_feed.status_code == 200
+    assert sql_feed.headers["content-type"] == "application/json"
+    assert orm_feed.json()["tweets"]
+    assert sql_feed.json() == orm_feed.json()
+
+
+@pytest.mark.asyncio
+async def test_feed_stream(client: AsyncClient):
+    page = await client.get(
+        "/api/tweets",
+        params={"limit": 3},
+        headers={"api-key": "test"},
+    )
+    streamed = await client.get(
+        "/api/tweets",
+        params={"limit": 2, "stream": True},
+        headers={"api-key": "test"},
+    )
+    assert streamed.status_code == 200
+    assert streamed.json()["result"] is True
+    assert [tweet["id"] for tweet in streamed.json()["tweets"]] == [
+        tweet["id"] for tweet in page.json()["tweets"][:2]
+    ]
+    assert streamed.json()["next_cursor"] is not None
+
+    rest = await client.get(
+        "/api/tweets",
+        params={
+            "limit": 1,
+            "stream": True,
+            "cursor": streamed.json()["next_cursor"],
+        },
+        headers={"api-key": "test"},
+    )
+    assert rest.json()["tweets"][0]["id"] == page.json()["tweets"][2]["id"]
+
+
+@pytest.mark.asyncio
+async def test_feed_limit_without_stream(client: AsyncClient):
+    response = await client.get(
+        "/api/tweets",
+        params={"limit": 1000},
+        headers={"api-key": "test"},
+    )
+    assert response.status_code == 422
+    assert response.json()["error_type"] == "Invalid limit"
+
+
+@pytest.mark.asyncio
+async def test_add_tweets_batch(client: AsyncClient):
+    headers = {"api-key": "test"}
+    media_ids = []
+    for _ in range(2):
+        with open("app/images/1.png", mode="rb") as img_file:
+            media = await client.post(
+                "/api/medias",
+                files={"file": img_file.read()},
+                headers=headers,
+            )
+        media_ids.append(media.json()["media_id"])
+
+    response = await client.post(
+        "/api/tweets/batch",
+        json={
+            "tweets": [
+                {"tweet_data": "Пачка 1", "tweet_media_ids": [media_ids[0]]},
+                {"tweet_data": "Пачка 2", "tweet_media_ids": []},
+                {"tweet_data": "Пачка 3", "tweet_media_ids": [media_ids[1]]},
+            ],
+        },
+        headers=headers,
+    )
+    assert response.status_code == 201
+    tweet_ids = response.json()["tweet_ids"]
+    assert len(tweet_ids) == 3
+    assert tweet_ids == sorted(tweet_ids)
+
+    feed = await client.get("/api/tweets", headers=headers)
+    tweets = {tweet["id"]: tweet for tweet in feed.json()["tweets"]}
+    assert tweets[tweet_ids[0]]["content"] == "Пачка 1"
+    assert len(tweets[tweet_ids[0]]["attachments"]) == 1
+    assert not tweets[tweet_ids[1]]["attachments"]
+    assert len(tweets[tweet_ids[2]]["attachments"]) == 1
+
+    for tweet_id in tweet_ids:
+        await client.delete(f"/api/tweets/{tweet_id}", headers=headers)
+
+
+@pytest.mark.asyncio
+async def test_add_tweets_batch_duplicate_media(client: AsyncClient):
+    response = await client.post(
+        "/api/tweets/batch",
+        json={
+            "tweets": [
+                {"tweet_data": "Пачка 1", "tweet_media_ids": [1]},
+                {"tweet_data": "Пачка 2", "tweet_media_ids": [1]},
+            ],
+        },
+        headers={"api-key": "test"},
+    )
+    assert response.status_code == 422
+    assert response.json()["error_type"] == "Invalid batch"
+
+
+@pytest.mark.asyncio
+async def test_add_tweets_batch_attached_media(client: AsyncClient):
+    headers = {"api-key": "test"}
+    media_ids = []
+    for number in range(2):
+        media = await client.post(
+            "/api/medias",
+            files={"file": (f"batch{number}.png", b"batch-media%d" % number)},
+            headers=headers,
+        )
+        media_ids.append(media.json()["media_id"])
+    tweet = await client.post(
+        "/api/tweets",
+        json={"tweet_data": "Твит с медиа", "tweet_media_ids": [media_ids[0]]},
+        headers=headers,
+    )
+    assert tweet.status_code == 201
+
+    for taken_id in (media_ids[0], 1000000):
+        response = await client.post(
+            "/api/tweets/batch",
+            json={
+                "tweets": [
+                    {"tweet_data": "Пачка 1", "tweet_media_ids": [media_ids[1]]},
+                    {"tweet_data": "Пачка 2", "tweet_media_ids": [taken_id]},
+                ],
+            },
+            headers=headers,
+        )
+        assert response.status_code == 422
+        assert response.json()["error_type"] == "Invalid batch"
+
+    async with engine.connect() as conn:
+        attached = (await conn.execute(
+            select(Media.id, Media.tweet_id).where(Media.id.in_(media_ids))
+        )).all()
+    assert dict(attached) == {
+        media_ids[0]: tweet.json()["tweet_id"],
+        media_ids[1]: None,
+    }
+    await client.delete(f"/api/tweets/{tweet.json()['tweet_id']}", headers=headers)
+
+
+async def get_blob(sha256: str):
+    async with engine.connect() as conn:
+        return (await conn.execute(
+            select(MediaBlob).where(MediaBlob.sha256 == sha256)
+        )).one_or_none()
+
+
+@pytest.mark.asyncio
+async def test_duplicate_media_shares_blob(client: AsyncClient):
+    headers = {"api-key": "test"}
+    data = b"duplicate-media" * 500
+    sha256 = hashlib.sha256(data).hexdigest()
+
+    tweet_ids = []
+    for _ in range(2):
+        media = await client.post(
+            "/api/medias",
+            files={"file": ("meme.png", data)},
+            headers=headers,
+        )
+        tweet = await client.post(
+            "/api/tweets",
+            json={
+                "tweet_data": "Твит с одинаковой картинкой",
+                "tweet_media_ids": [media.json()["media_id"]],
+            },
+            headers=headers,
+        )
+        tweet_ids.append(tweet.json()["tweet_id"])
+
+    blob = await get_blob(sha256)
+    assert blob.ref_count == 2
+    file_path = settings.path_image() / blob.path_file.split("/")[1]
+    assert len(list(settings.path_image().glob(sha256 + "*"))) == 1
+
+    await client.delete(f"/api/tweets/{tweet_ids[0]}", headers=headers)
+    assert (await get_blob(sha256)).ref_count == 1
+    assert file_path.exists()
+
+    await client.delete(f"/api/tweets/{tweet_ids[1]}", headers=headers)
+    assert await get_blob(sha256) is None
+    assert not file_path.exists()
+
+
+@pytest.mark.asyncio
+async def test_segment_media_attachment_url(client: AsyncClient, monkeypatch):
+    from app.crud.media_storage import segment_storage
+
+    headers = {"api-key": "test"}
+    monkeypatch.setattr(settings, "media_storage", "segment")
+    data = b"segment-attachment" * 40
+    media = await client.post(
+        "/api/medias",
+        files={"file": ("attached.png", data)},
+        headers=headers,
+    )
+    media_id = media.json()["media_id"]
+    tweet = await client.post(
+        "/api/tweets",
+        json={"tweet_data": "Твит из сегмента", "tweet_media_ids": [media_id]},
+        headers=headers,
+    )
+    tweet_id = tweet.json()["tweet_id"]
+
+    for render_mode in ("orm", "sql"):
+        monkeypatch.setattr(settings, "feed_render_mode", render_mode)
+        feed = await client.get("/api/tweets", headers=headers)
+        tweets = {item["id"]: item for item in feed.json()["tweets"]}
+        (url,) = tweets[tweet_id]["attachments"]
+        assert url == f"/api/medias/{media_id}"
+
+        response = await client.get(url)
+        assert response.status_code == 200
+        assert response.content == data
+
+    await client.delete(f"/api/tweets/{tweet_id}", headers=headers)
+    await segment_storage.seal()
@@ -1,6 +1,8 @@
 import pytest
 from httpx import AsyncClient
 
+from app.crud.user import UserService
+
 api_key = "test"
 
 
@@ -51,3 +53,14 @@ async def test_unfollow(client: AsyncClient):
         "result": True
     }
 
+
+@pytest.mark.asyncio
+async def test_current_user_cached(client: AsyncClient, monkeypatch):
+    await client.get("/api/tweets", headers={"api-key": "test"})
+
+    async def no_database(*args):
+        raise AssertionError("api-key должен быть взят из кэша")
+
+    monkeypatch.setattr(UserService, "get_principal_by_token", no_database)
+    response = await client.get("/api/tweets", headers={"api-key": "test"})
+    assert response.status_code == 200
@@ -0,0 +1,62 @@
+import pytest
+from httpx import AsyncClient
+
+from app.config import settings
+from app.crud.warmup import warmup
+from app.utils.cache import principal_cache
+
+
+@pytest.mark.asyncio
+async def test_readiness_after_warmup(client: AsyncClient):
+    response = await client.get("/health/live")
+    assert response.status_code == 200
+
+    warmup.ready = False
+    response = await client.get("/health/ready")
+    assert response.status_code == 503
+    assert response.json()["result"] is False
+
+    principal_cache.clear()
+    await warmup.run()
+
+    response = await client.get("/health/ready")
+    assert response.status_code == 200
+    timings = response.json()["timings_ms"]
+    for stage in ("engine", "connections", "statements", "principal_cache"):
+        assert stage in timings
+    assert principal_cache.get("test").id == 1
+
+
+@pytest.mark.asyncio
+async def test_warmup_retries(client: AsyncClient, monkeypatch):
+    monkeypatch.setattr(settings, "warmup_retry_seconds", 0)
+    monkeypatch.setattr(settings, "warmup_max_attempts", 3)
+    open_connections = warmup.open_connections
+    attempts = []
+
+    async def flaky_connections():
+        attempts.append(1)
+        if len(attempts) < 2:
+            raise ConnectionRefusedError("database is starting")
+        return await open_connections()
+
+    monkeypatch.setattr(warmup, "open_connections", flaky_connections)
+    await warmup.run()
+    assert len(attempts) == 2
+    assert (warmup.ready, warmup.degraded, warmup.error) == (True, False, None)
+
+    async def down_connections():
+        attempts.append(1)
+        raise ConnectionRefusedError("database is down")
+
+    attempts.clear()
+    monkeypatch.setattr(warmup, "open_connections", down_connections)
+    await warmup.run()
+    assert len(attempts) == 3
+
+    response = await client.get("/health/ready")
+    assert response.status_code == 200
+    assert response.json()["degraded"] is True
+    assert "database is down" in response.json()["error"]
+    warmup.degraded = False
+    warmup.error = None